@@ -0,0 +1,114 @@
+# amostragem.py — pré-checagem por amostra: estima a divergência AWS × Fabric em segundos
+#
+# Os dois lados rodam sql/aws.sql e sql/fabric.sql com um filtro extra
+# (-- {{EXTRA_FILTER}}) que escolhe as notas por um hash determinístico de
+# nota_fiscal_id, calculado da mesma forma no Postgres, no SQL Server e no
+# SQLite — então AWS e Fabric devolvem o mesmo subconjunto de notas. A
+# amostra passa pela normalização/comparação de sempre.
+import math
+import time
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from extracao_notas import METRICAS, extrair, escalar_inteiros, limite_escalado
+from comparacao import normalizar, comparar
+from reconciliacao import _em_paralelo
+
+TAXA_PADRAO = 0.01
+# (id mod P) * A mod P embaralha os ids (P primo) antes do módulo da amostra,
+# para ids sequenciais ou com sufixo fixo não caírem todos no mesmo resto;
+# cabe em bigint mesmo com P * A, sem overflow em nenhum dos bancos
+_PRIMO = 1_000_003
+_MULT = 48_271
+
+def filtro_amostra(taxa: float = TAXA_PADRAO, semente: int = 0):
+    """(expressão, "=", resto) para os `filtros` de extrair: ~`taxa` das notas, sempre as mesmas por semente."""
+    modulo = max(1, round(1 / taxa))
+    expr = f"((cast(nota_fiscal_id as bigint) % {_PRIMO}) * {_MULT}) % {_PRIMO} % {modulo}"
+    return expr, "=", int(semente) % modulo
+
+def intervalo_wilson(k: int, n: int, confianca: float = 0.95):
+    """Intervalo de Wilson para a proporção k/n (bom também com k perto de 0)."""
+    if n <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confianca / 2)
+    p = k / n
+    den = 1 + z * z / n
+    centro = (p + z * z / (2 * n)) / den
+    meia = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / den
+    return max(0.0, centro - meia), min(1.0, centro + meia)
+
+def _totais(aws_n: pd.DataFrame, fab_n: pd.DataFrame, diff_table: pd.DataFrame, casas: int, atol: float) -> pd.DataFrame:
+    limite = limite_escalado(atol, casas)
+    linhas = []
+    for m in METRICAS:
+        soma_aws, soma_fab = float(aws_n[m].sum()), float(fab_n[m].sum())
+        diff = escalar_inteiros(diff_table[f"diff_{m}"], casas)
+        linhas.append({"metrica": m, "soma_aws": soma_aws, "soma_fabric": soma_fab,
+                       "diferenca": round(soma_aws - soma_fab, casas),
+                       "notas_divergentes": int((np.abs(diff) > limite).sum())})
+    return pd.DataFrame(linhas)
+
+def pre_checar(conn_pg, conn_fabric, dt_inicio: str, status_lista, taxa: float = TAXA_PADRAO, semente: int = 0,
+               casas: int = 4, atol: float = 0.01, confianca: float = 0.95,
+               dialetos=("aws", "fabric"), log=None) -> dict:
+    """
+    Extrai dos dois lados (em paralelo) só a amostra de ~`taxa` das notas e
+    compara. Uma nota da amostra "diverge" se alguma métrica passa de
+    `atol` ou se ela só existe de um lado. Retorna:
+      taxa_divergencia e intervalo (Wilson, nível `confianca`) sobre as notas da amostra;
+      divergentes_estimadas: o intervalo extrapolado para todas as notas;
+      contagens (notas_amostra, divergentes, so_aws, so_fabric) e
+      metricas: DataFrame com somas por métrica de cada lado na amostra,
+      a diferença e quantas notas divergem naquela métrica.
+    `conn_pg`/`conn_fabric` podem ser PoolConexoes; `dialetos` como em
+    reconciliacao.reconciliar.
+    """
+    log = log or (lambda msg: None)
+    t0 = time.perf_counter()
+    filtro = filtro_amostra(taxa, semente)
+    modulo = max(1, round(1 / taxa))
+    d_aws, d_fab = dialetos
+    aws_df, fab_df = _em_paralelo(
+        lambda: extrair(d_aws, conn_pg, dt_inicio, status_lista, [filtro]),
+        lambda: extrair(d_fab, conn_fabric, dt_inicio, status_lista, [filtro]),
+    )
+    aws_n, fab_n = normalizar(aws_df, casas), normalizar(fab_df, casas)
+    diff_table, so_aws, so_fabric = comparar(aws_n, fab_n, casas, atol)
+    ambos = diff_table["nota_fiscal_id_aws"].notna() & diff_table["nota_fiscal_id_fabric"].notna()
+    divergentes = int((diff_table["diverge"].to_numpy(dtype=bool) & ambos.to_numpy()).sum())
+    n = int(ambos.sum()) + len(so_aws) + len(so_fabric)
+    k = divergentes + len(so_aws) + len(so_fabric)
+    baixo, alto = intervalo_wilson(k, n, confianca)
+    res = {
+        "modulo": modulo, "resto": filtro[2], "taxa_amostra": 1 / modulo, "confianca": confianca,
+        "notas_amostra": n, "divergentes": divergentes, "so_aws": len(so_aws), "so_fabric": len(so_fabric),
+        "taxa_divergencia": k / n if n else 0.0, "intervalo": (baixo, alto),
+        "notas_estimadas": n * modulo, "divergentes_estimadas": (baixo * n * modulo, alto * n * modulo),
+        "metricas": _totais(aws_n, fab_n, diff_table[ambos.to_numpy()], casas, atol),
+        "segundos": time.perf_counter() - t0,
+    }
+    log(resumo(res))
+    return res
+
+def _milhar(x) -> str:
+    return f"{x:,.0f}".replace(",", ".")
+
+def resumo(res: dict) -> str:
+    baixo, alto = res["intervalo"]
+    linhas = [
+        f"🎯 Pré-checagem (1 a cada {res['modulo']} notas, {res['segundos']:.1f}s): "
+        f"{res['notas_amostra']} notas na amostra, {res['divergentes']} divergentes, "
+        f"{res['so_aws']} só AWS, {res['so_fabric']} só Fabric",
+        f"   divergência estimada {res['taxa_divergencia']:.2%} "
+        f"(IC {res['confianca']:.0%}: {baixo:.2%} – {alto:.2%}) ≈ "
+        f"{_milhar(res['divergentes_estimadas'][0])} – {_milhar(res['divergentes_estimadas'][1])} "
+        f"de ~{_milhar(res['notas_estimadas'])} notas",
+    ]
+    for r in res["metricas"].itertuples():
+        if r.notas_divergentes or r.diferenca:
+            linhas.append(f"   {r.metrica}: AWS {r.soma_aws:,.2f} | Fabric {r.soma_fabric:,.2f} | "
+                          f"diff {r.diferenca:,.4f} | {r.notas_divergentes} notas")
+    return "\n".join(linhas)
@@ -1,14 +1,33 @@
 # app.py — Comparador de Notas (Streamlit) v3
-import io, os, glob
+import io, os
 import time
+import hashlib
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
 import streamlit as st
 
-METRICAS = ["vol","fat","fatliq","fatdol","fatbon","cc","cp","ci","cf","frete"]
+from extracao_notas import METRICAS, escalar_inteiros, limite_escalado
+from comparacao import normalizar, diferencas, marcar_divergentes
+import desempenho
+from desempenho import medir
+from comparacao_duckdb import ComparacaoDuckDB
+import historico
+import manifesto
+import exportacao
+from detalhamento import ids_divergentes, detalhar, diff_linhas
 
 st.set_page_config(page_title="Comparação de Notas", layout="wide")
 st.title("🧾 Comparação de Notas — AWS × Fabric")
 
+# mesmas variáveis da GUI (o Streamlit herda o ambiente); spans deste rerun vão para o painel "Desempenho"
+desempenho.configurar(os.getenv("DESEMPENHO", "0") == "1",
+                      memoria=os.getenv("DESEMPENHO_MEMORIA", "1") == "1", arquivo="out/desempenho.jsonl")
+spans_execucao = desempenho.iniciar_coleta()
+DOWNLOADS_MAX_MB = float(os.getenv("DOWNLOADS_MAX_MB", exportacao.MAX_MB))
+
 def stop_streamlit():
     """Encerra o processo do Streamlit de forma controlada."""
     # Mostra um aviso rápido antes de sair
@@ -17,57 +36,350 @@ def stop_streamlit():
     os._exit(0)      # mata o processo do Streamlit imediatamente
 
 # ---------- helpers ----------
-def _latest_file(pattern: str):
-    files = glob.glob(pattern)
-    return max(files, key=os.path.getmtime) if files else None
-
 def _read_csv_auto(file_or_bytes) -> pd.DataFrame:
+    # separador pelo cabeçalho: lê o arquivo uma vez só, sem tentativa/erro
     if isinstance(file_or_bytes, (str, os.PathLike)):
-        try:
-            return pd.read_csv(file_or_bytes, sep=";")
-        except Exception:
-            return pd.read_csv(file_or_bytes)
+        with open(file_or_bytes, "r", encoding="utf-8", errors="ignore") as f:
+            header = f.readline()
     else:
-        try:
-            return pd.read_csv(file_or_bytes, sep=";")
-        except Exception:
-            file_or_bytes.seek(0)
-            return pd.read_csv(file_or_bytes)
-
-def _normalizar(df: pd.DataFrame, casas: int = 4) -> pd.DataFrame:
-    df = df.copy()
-    if "nota_fiscal_id" in df.columns:
-        df["nota_fiscal_id"] = pd.to_numeric(df["nota_fiscal_id"], errors="coerce").astype("Int64")
-    for c in METRICAS:
-        if c in df.columns:
-            df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0.0).round(casas)
-    cols = ["nota_fiscal_id"] + [c for c in METRICAS if c in df.columns]
-    return df[cols].sort_values("nota_fiscal_id").reset_index(drop=True)
-
-def _to_bytes_csv(df: pd.DataFrame, sep=";"):
-    buf = io.StringIO()
-    df.to_csv(buf, index=False, sep=sep)
-    return buf.getvalue().encode()
+        header = file_or_bytes.readline().decode("utf-8", errors="ignore")
+        file_or_bytes.seek(0)
+    sep = ";" if header.count(";") >= header.count(",") else ","
+    return pd.read_csv(file_or_bytes, sep=sep)
+
+_COLUNAS = ["nota_fiscal_id"] + METRICAS
+
+def _read_arrow(path_or_buf) -> pd.DataFrame:
+    # memory map: as páginas do arquivo ficam no cache do SO e são
+    # compartilhadas entre sessões; só as colunas usadas são convertidas
+    src = pa.memory_map(path_or_buf) if isinstance(path_or_buf, (str, os.PathLike)) else path_or_buf
+    table = pa.ipc.open_file(src).read_all()
+    return table.select([c for c in _COLUNAS if c in table.column_names]).to_pandas(split_blocks=True)
+
+def _read_parquet(path_or_buf) -> pd.DataFrame:
+    schema = pq.read_schema(path_or_buf)
+    if not isinstance(path_or_buf, (str, os.PathLike)):
+        path_or_buf.seek(0)
+    cols = [c for c in _COLUNAS if c in schema.names]
+    return pq.read_table(path_or_buf, columns=cols, memory_map=True).to_pandas(split_blocks=True)
+
+_LEITORES = {"arrow": _read_arrow, "feather": _read_arrow, "parquet": _read_parquet, "csv": _read_csv_auto}
+
+def _formato(nome: str) -> str:
+    return os.path.splitext(str(nome))[1].lstrip(".").lower()
+
+# ---------- cache por etapa ----------
+# carregar (chave = caminho + mtime + tamanho, ou md5 do upload) → normalizar
+# (chave + casas) → diferenças (independe de atol). max_entries limita a
+# memória; os objetos são compartilhados entre reruns/sessões: só leitura.
+_cache_execucao = {}
+
+def _cache_miss(etapa: str):
+    _cache_execucao.setdefault(etapa, [0, 0])[1] += 1
+
+def _com_cache(etapa: str, func, *args):
+    stats = _cache_execucao.setdefault(etapa, [0, 0])
+    misses = stats[1]
+    out = func(*args)
+    if stats[1] == misses:
+        stats[0] += 1
+    return out
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _carregar(chave: str, formato: str, _fonte) -> pd.DataFrame:
+    _cache_miss("carregar")
+    if isinstance(_fonte, str):
+        manifesto.tocar(_fonte)  # uso recente protege o extrato da remoção por LRU
+    return _LEITORES[formato](_fonte)
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _normalizado(chave: str, casas: int, _df: pd.DataFrame) -> pd.DataFrame:
+    _cache_miss("normalizar")
+    return normalizar(_df, casas)
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _diferencas(chave_aws: str, chave_fab: str, casas: int, _aws_n, _fab_n):
+    _cache_miss("comparar")
+    return diferencas(_aws_n, _fab_n, casas)
+
+@st.cache_resource(max_entries=2, show_spinner="Comparando com DuckDB…")
+def _motor_duckdb(chave_aws: str, chave_fab: str, casas: int, _aws_path: str, _fab_path: str) -> ComparacaoDuckDB:
+    _cache_miss("comparar")
+    return ComparacaoDuckDB(_aws_path, _fab_path, casas, memoria=os.getenv("DUCKDB_MEMORIA") or None)
+
+def _chave_arquivo(path: str) -> str:
+    info = os.stat(path)
+    return f"{os.path.abspath(path)}|{info.st_mtime_ns}|{info.st_size}"
+
+def _chave_upload(up) -> str:
+    return f"upload|{up.name}|{hashlib.md5(up.getvalue()).hexdigest()}"
+
+# ---------- visualização paginada das diferenças ----------
+# destaque de linhas com diferenças grandes (>= 1)
+THRESHOLD = 1.0
+_ESTILO_DESTAQUE = "background-color: #fff3b0; color: black"
+
+def _filtrar_diferencas(diff_table: pd.DataFrame, cols, min_abs: float = 0.0, id_ini=None, id_fim=None,
+                        atol: float = None, casas: int = 4):
+    """
+    Filtro vetorizado por |diff| mínimo nas colunas `cols` e faixa de IDs; com
+    `atol`, só as linhas em que alguma das `cols` passa da tolerância (em
+    inteiros escalados, como a marcação de divergentes). Devolve (linhas, |diff| máx.).
+    """
+    abs_max = np.nan_to_num(diff_table[cols].abs().to_numpy()).max(axis=1) if len(diff_table) else np.zeros(0)
+    mask = abs_max >= min_abs
+    if atol is not None:
+        limite = limite_escalado(atol, casas)
+        acima = np.zeros(len(diff_table), dtype=bool)
+        for c in cols:
+            acima |= np.abs(escalar_inteiros(diff_table[c], casas)) > limite
+        mask &= acima
+    ids = diff_table["nota_fiscal_id_aws"].fillna(diff_table["nota_fiscal_id_fabric"]).to_numpy(dtype="float64", na_value=np.nan)
+    if id_ini is not None: mask &= ids >= id_ini
+    if id_fim is not None: mask &= ids <= id_fim
+    return diff_table[mask], abs_max[mask]
+
+def _estilizar_pagina(pagina: pd.DataFrame, diff_cols):
+    destaque = (np.nan_to_num(pagina[diff_cols].abs().to_numpy()) >= THRESHOLD).any(axis=1)
+    estilos = np.where(destaque[:, None], _ESTILO_DESTAQUE, "")
+    estilos = np.broadcast_to(estilos, pagina.shape)
+    return pagina.style.apply(lambda _: pd.DataFrame(estilos, index=pagina.index, columns=pagina.columns), axis=None)
+
+def _filtros_diferencas():
+    f1, f2, f3, f4, f5 = st.columns([2, 2, 2, 2, 3])
+    metrica = f1.selectbox("Métrica acima da tolerância", ["(todas)"] + METRICAS,
+                           help="Com uma métrica escolhida, só as notas em que |diff| dela passa da tolerância")
+    min_abs = f2.number_input("|diff| mínimo", min_value=0.0, value=0.0, step=0.01, format="%.4f")
+    id_ini  = f3.number_input("ID inicial", value=None, step=1, format="%d")
+    id_fim  = f4.number_input("ID final", value=None, step=1, format="%d")
+    ordem   = f5.selectbox("Ordenar por", ["nota_fiscal_id", "maior |diff| (métrica filtrada)"])
+    return metrica, min_abs, id_ini, id_fim, ordem
+
+def _seletor_pagina(total: int):
+    p1, p2 = st.columns([1, 3])
+    tam_pagina = p1.selectbox("Linhas por página", [50, 100, 500, 1000], index=1)
+    n_paginas = max(1, -(-total // tam_pagina))
+    if st.session_state.get("pagina_diff", 1) > n_paginas:
+        st.session_state["pagina_diff"] = 1
+    pagina = p2.number_input(f"Página (1–{n_paginas})", min_value=1, max_value=n_paginas, step=1, key="pagina_diff")
+    return pagina, tam_pagina, n_paginas
+
+def _exportar(motor: ComparacaoDuckDB, o_que: str, rotulo: str, **kwargs):
+    # fora da memória não há bytes para o download_button: o DuckDB grava direto em out/
+    if st.button(f"💾 Exportar {rotulo} para out/ (CSV ;)", key=f"exp_{o_que}"):
+        os.makedirs("out", exist_ok=True)
+        destino = f"out/export_{o_que}_{time.strftime('%Y-%m-%d_%H-%M-%S')}.csv"
+        with st.spinner("Exportando…"):
+            motor.exportar(o_que, destino, **kwargs)
+        st.success(f"Gravado em {destino}")
+
+def _comparacao_fora_da_memoria(motor: ComparacaoDuckDB, atol: float, somente_div: bool):
+    """Mesmas abas do fluxo pandas, mas cada tabela vem do DuckDB já filtrada e paginada."""
+    contagens = motor.contagens(atol)
+    tab_diff, tab_fabric, tab_aws, tab_hist = st.tabs(
+        ["🔎 Diferenças", "📘 Fabric (dados)", "📗 AWS (dados)", "📚 Histórico"])
+
+    with tab_diff:
+        st.subheader("Diferenças (AWS − Fabric)")
+        diff_cols = [f"diff_{m}" for m in METRICAS]
+        metrica, min_abs, id_ini, id_fim, ordem = _filtros_diferencas()
+        filtros = dict(atol=atol, somente_div=somente_div, metricas=None if metrica == "(todas)" else [metrica],
+                       min_abs=min_abs, id_ini=id_ini, id_fim=id_fim)
+        with medir("app.filtrar"):
+            total = motor.contar(**filtros)
+        pagina, tam_pagina, n_paginas = _seletor_pagina(total)
+        linhas = contagens["divergentes"] if somente_div else contagens["total"]
+        st.caption(f"Tolerância: {atol:.2f} | Linhas: {linhas} | Após filtros: {total} | Página {pagina}/{n_paginas} | DuckDB")
+        with medir("app.render", linhas=tam_pagina):
+            vis, _ = motor.pagina(**filtros, por_maior_diff=ordem != "nota_fiscal_id",
+                                  limite=tam_pagina, deslocamento=(pagina - 1) * tam_pagina)
+            st.dataframe(_estilizar_pagina(vis, diff_cols), use_container_width=True)
+        _exportar(motor, "diferencas", "diferenças", atol=atol, somente_div=somente_div)
+        _detalhamento(lambda: ids_divergentes(motor.divergentes(atol)[0]), contagens["divergentes"],
+                      manifesto.parametros(aws_path), motor.casas, atol)
+
+        st.divider()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("### Somente no **Fabric**")
+            st.caption(f"Total: {contagens['so_fabric']}")
+            st.dataframe(motor.so_fabric(), use_container_width=True, height=260)
+            _exportar(motor, "so_fabric", "só no Fabric")
+        with col2:
+            st.markdown("### Somente na **AWS**")
+            st.caption(f"Total: {contagens['so_aws']}")
+            st.dataframe(motor.so_aws(), use_container_width=True, height=260)
+            _exportar(motor, "so_aws", "só na AWS")
+
+    for tab, lado, nome in ((tab_fabric, "fabric", "Fabric"), (tab_aws, "aws", "AWS")):
+        with tab:
+            st.subheader(f"{nome} (dados normalizados)")
+            dados, n = motor.dados(lado, limite=1000)
+            st.caption(f"Primeiras {len(dados)} de {n} notas")
+            st.dataframe(dados, use_container_width=True)
+            _exportar(motor, lado, f"{nome} completo")
+
+    with tab_hist:
+        _aba_historico()
+
+def _detalhamento(obter_ids, n_divergentes: int, parametros: dict, casas: int, atol: float):
+    """Linhas sem agregação das notas divergentes, buscadas sob demanda nos dois bancos."""
+    with st.expander("🔬 Detalhar linhas das notas divergentes", expanded=False):
+        if not n_divergentes:
+            st.caption("Nenhuma nota divergente.")
+            return
+        col1, col2, col3 = st.columns(3)
+        dt = col1.text_input("dt_inicio", parametros.get("dt_inicio") or os.getenv("DT_INICIO", "2025-08-01"), key="det_dt")
+        status_txt = col2.text_input("status", ",".join(map(str, parametros.get("status_lista") or []))
+                                     or os.getenv("STATUS_LISTA", "1"), key="det_status")
+        limite = col3.number_input("Máx. de notas", min_value=1, value=min(n_divergentes, 1000), step=100, key="det_limite")
+        if st.button(f"Buscar linhas de até {int(limite)} notas na AWS e no Fabric", key="det_buscar"):
+            status = [int(x) for x in status_txt.split(",") if x.strip()]
+            ids = obter_ids()[:int(limite)]
+            try:
+                from conexoes import nova_conexao_pg, nova_conexao_fabric
+                conn_pg, conn_fab = nova_conexao_pg(), nova_conexao_fabric()
+            except Exception as e:
+                st.error(f"Sem conexão com os bancos (.env): {e}")
+                return
+            try:
+                with st.spinner("Consultando as duas origens…"), medir("app.detalhe", ids=len(ids)):
+                    aws_l, fab_l = detalhar(conn_pg, conn_fab, dt, status, ids)
+            finally:
+                for conn in (conn_pg, conn_fab):
+                    try: conn.close()
+                    except Exception: pass
+            st.session_state.detalhe = (aws_l, fab_l, diff_linhas(aws_l, fab_l, casas, atol))
+
+        if "detalhe" not in st.session_state:
+            return
+        aws_l, fab_l, linhas = st.session_state.detalhe
+        if linhas.empty:
+            st.info("Nenhuma linha encontrada para essas notas.")
+            return
+        nota = st.selectbox("Nota", linhas["nota_fiscal_id"].unique(), key="det_nota")
+        col1, col2 = st.columns(2)
+        col1.markdown("**AWS**")
+        col1.dataframe(aws_l[aws_l["nota_fiscal_id"] == nota], use_container_width=True, hide_index=True)
+        col2.markdown("**Fabric**")
+        col2.dataframe(fab_l[fab_l["nota_fiscal_id"] == nota], use_container_width=True, hide_index=True)
+        vis = linhas[linhas["nota_fiscal_id"] == nota]
+        if st.checkbox("Só linhas diferentes", value=True, key="det_so_dif"):
+            vis = vis[vis["situacao"] != "igual"]
+        st.dataframe(_estilizar_pagina(vis, [f"diff_{m}" for m in METRICAS]), use_container_width=True, hide_index=True)
+        st.caption(" | ".join(f"{k}: {v}" for k, v in linhas["situacao"].value_counts().items()))
+        _baixar("Baixar linhas comparadas", linhas, "detalhe_linhas")
+
+def _aba_historico():
+    """Execuções registradas por execucao_lote.py: tendência por (dt_inicio, status) e busca por nota."""
+    st.subheader("Histórico de execuções")
+    execucoes = historico.execucoes()
+    if execucoes.empty:
+        st.info("Histórico vazio — as execuções de execucao_lote.py são registradas em out/historico.")
+        return
+    col1, col2 = st.columns(2)
+    dt = col1.selectbox("dt_inicio", sorted(execucoes["dt_inicio"].unique(), reverse=True), key="hist_dt")
+    status = col2.selectbox("status", sorted(execucoes.loc[execucoes["dt_inicio"] == dt, "status"].unique()), key="hist_status")
+    serie = execucoes[(execucoes["dt_inicio"] == dt) & (execucoes["status"] == status)].set_index("execucao")
+    st.line_chart(serie[["divergentes", "so_aws", "so_fabric"]])
+    with st.expander("Totais por métrica"):
+        st.dataframe(serie.filter(like="soma_"), use_container_width=True)
+
+    st.divider()
+    nota = st.number_input("Buscar nota_fiscal_id", min_value=0, value=None, step=1, key="hist_nota")
+    if nota is None:
+        return
+    with medir("app.historico_nota") as sp:
+        ocorrencias = historico.historico_nota(int(nota))
+        sp.linhas = len(ocorrencias)
+    if ocorrencias.empty:
+        st.success(f"Nota {int(nota)} nunca divergiu nas execuções registradas.")
+        return
+    info = historico.inicio_divergencia(int(nota), dt, status)
+    if info["inicio_sequencia_atual"]:
+        st.warning(f"Diverge desde {info['inicio_sequencia_atual']} em {dt} / {status} "
+                   f"({info['vezes']} de {info['execucoes']} execuções; primeira em {info['primeira']}).")
+    elif info["vezes"]:
+        st.caption(f"Em {dt} / {status}: {info['vezes']} de {info['execucoes']} execuções, "
+                   f"de {info['primeira']} a {info['ultima']}; não diverge na mais recente.")
+    st.dataframe(ocorrencias, use_container_width=True, hide_index=True)
+
+def _painel_desempenho():
+    with st.sidebar.expander("Desempenho", expanded=False):
+        if not desempenho.ativo():
+            st.caption("Medição desligada — defina DESEMPENHO=1 no .env.")
+        elif spans_execucao:
+            st.dataframe(pd.DataFrame(spans_execucao)[["etapa", "s", "linhas", "linhas_s", "bytes", "mb_s", "pico_mb"]],
+                         use_container_width=True, hide_index=True)
+            st.caption(f"Total: {sum(r['s'] for r in spans_execucao):.2f}s — também em out/desempenho.jsonl")
+
+def _baixar(rotulo: str, df: pd.DataFrame, nome: str, chave: str = None):
+    # o arquivo só é gerado no clique (data=função) e fica em out/downloads para o próximo pedido igual
+    formato = st.session_state.get("formato_download", "csv")
+    ext, mime, desc = exportacao.FORMATOS[formato]
+    st.download_button(f"⬇️ {rotulo} ({desc})", lambda: exportacao.ler(df, formato, chave, max_mb=DOWNLOADS_MAX_MB), f"{nome}{ext}", mime,
+                       key=f"baixar_{nome}", on_click="ignore")
 
 # ---------- sidebar: carregar dados ----------
 st.sidebar.header("Carregamento dos Dados")
+motor_escolhido = st.sidebar.radio(
+    "Motor de comparação", ["pandas (em memória)", "DuckDB (fora da memória)"],
+    help="DuckDB compara direto sobre os arquivos de out/, com spill em disco; só a página exibida vira DataFrame.",
+)
+fora_da_memoria = motor_escolhido.startswith("DuckDB")
 auto_pick = st.sidebar.checkbox("Usar arquivos mais recentes em /out", value=True)
 aws_df = fab_df = None
+aws_path = fab_path = None
+chave_aws = chave_fab = None
 
-if auto_pick:
-    aws_path = _latest_file("out/aws_notas_*.csv") or _latest_file("out/aws_notas.csv")
-    fab_path = _latest_file("out/fabric_notas_*.csv") or _latest_file("out/fabric_notas.csv")
+if auto_pick and fora_da_memoria:
+    # o DuckDB lê o Parquet direto (Arrow IPC também serve, via pyarrow.dataset)
+    aws_path = manifesto.mais_recente("aws", formatos=("parquet", "arrow"))
+    fab_path = manifesto.mais_recente("fabric", formatos=("parquet", "arrow"))
+    st.sidebar.write("AWS:", aws_path or "—")
+    st.sidebar.write("Fabric:", fab_path or "—")
+    chave_aws = _chave_arquivo(aws_path) if aws_path else None
+    chave_fab = _chave_arquivo(fab_path) if fab_path else None
+elif auto_pick:
+    # artefatos colunares do extrator (Arrow IPC > Parquet); CSV só via upload.
+    # O manifesto de out/ (índice SQLite) responde sem glob + stat de todos os arquivos a cada rerun
+    aws_path = manifesto.mais_recente("aws", formatos=("arrow", "parquet"))
+    fab_path = manifesto.mais_recente("fabric", formatos=("arrow", "parquet"))
     st.sidebar.write("AWS:", aws_path or "—")
     st.sidebar.write("Fabric:", fab_path or "—")
-    if aws_path: aws_df = _read_csv_auto(aws_path)
-    if fab_path: fab_df = _read_csv_auto(fab_path)
+    if aws_path:
+        chave_aws = _chave_arquivo(aws_path)
+        with medir("app.carregar_aws", bytes=os.path.getsize(aws_path)) as sp:
+            aws_df = _com_cache("carregar", _carregar, chave_aws, _formato(aws_path), aws_path)
+            sp.linhas = len(aws_df)
+    if fab_path:
+        chave_fab = _chave_arquivo(fab_path)
+        with medir("app.carregar_fabric", bytes=os.path.getsize(fab_path)) as sp:
+            fab_df = _com_cache("carregar", _carregar, chave_fab, _formato(fab_path), fab_path)
+            sp.linhas = len(fab_df)
 else:
-    aws_up = st.sidebar.file_uploader("CSV AWS", type=["csv"])
-    fab_up = st.sidebar.file_uploader("CSV Fabric", type=["csv"])
-    if aws_up: aws_df = _read_csv_auto(aws_up)
-    if fab_up: fab_df = _read_csv_auto(fab_up)
-
-if aws_df is None or fab_df is None:
+    if fora_da_memoria:
+        st.sidebar.warning("O DuckDB usa os arquivos de /out; com upload a comparação roda em pandas.")
+        fora_da_memoria = False
+    tipos = ["csv", "parquet", "arrow", "feather"]
+    aws_up = st.sidebar.file_uploader("Arquivo AWS", type=tipos)
+    fab_up = st.sidebar.file_uploader("Arquivo Fabric", type=tipos)
+    if aws_up:
+        chave_aws = _chave_upload(aws_up)
+        with medir("app.carregar_aws", bytes=aws_up.size) as sp:
+            aws_df = _com_cache("carregar", _carregar, chave_aws, _formato(aws_up.name), io.BytesIO(aws_up.getvalue()))
+            sp.linhas = len(aws_df)
+    if fab_up:
+        chave_fab = _chave_upload(fab_up)
+        with medir("app.carregar_fabric", bytes=fab_up.size) as sp:
+            fab_df = _com_cache("carregar", _carregar, chave_fab, _formato(fab_up.name), io.BytesIO(fab_up.getvalue()))
+            sp.linhas = len(fab_df)
+
+if fora_da_memoria:
+    if not aws_path or not fab_path:
+        st.info("Nenhum par de arquivos Parquet/Arrow em **/out** para o DuckDB comparar.")
+        st.stop()
+elif aws_df is None or fab_df is None:
     st.info("Carregue os dois conjuntos (AWS e Fabric) pela barra lateral ou deixe o app localizar os mais recentes em **/out**.")
     st.stop()
 
@@ -76,6 +388,9 @@ st.sidebar.header("Parâmetros")
 casas = st.sidebar.number_input("Casas decimais (normalização)", min_value=0, max_value=10, value=4, step=1)
 atol  = st.sidebar.number_input("Tolerância absoluta", min_value=0.0, value=0.01, step=0.01, format="%.2f")
 somente_div = st.sidebar.checkbox("Mostrar apenas linhas divergentes", value=True)
+st.sidebar.selectbox("Formato dos downloads", list(exportacao.FORMATOS), key="formato_download",
+                     format_func=lambda f: exportacao.FORMATOS[f][2],
+                     help="CSV comprimido (gzip/zstd) e Parquet ficam muitas vezes menores que o CSV puro.")
 
 # ---------- botão encerrar ----------
 st.sidebar.divider()
@@ -97,67 +412,76 @@ else:
 
 
 
-# ---------- normalização ----------
-aws_n = _normalizar(aws_df, casas)
-fab_n = _normalizar(fab_df, casas)
-
-# ---------- preparar relação AWS x Fabric ----------
-aws_ren = aws_n.rename(columns={"nota_fiscal_id":"nota_fiscal_id_aws"})
-fab_ren = fab_n.rename(columns={"nota_fiscal_id":"nota_fiscal_id_fabric"})
-
-# outer join (preserva IDs dos dois lados)
-merged = aws_ren.merge(
-    fab_ren,
-    left_on="nota_fiscal_id_aws",
-    right_on="nota_fiscal_id_fabric",
-    how="outer",
-    suffixes=("_aws","_fabric")
-)
-
-# ---------- diferenças (aws - fabric) ----------
-diff_cols = []
-for m in METRICAS:
-    a = f"{m}_aws"; b = f"{m}_fabric"
-    if a not in merged.columns: merged[a] = 0.0
-    if b not in merged.columns: merged[b] = 0.0
-    merged[f"diff_{m}"] = merged[a].fillna(0) - merged[b].fillna(0)
-    diff_cols.append(f"diff_{m}")
-
-merged["diverge"] = (merged[diff_cols].abs() > atol).any(axis=1)
+# ---------- motor fora da memória ----------
+if fora_da_memoria:
+    try:
+        with medir("app.duckdb"):
+            motor = _com_cache("comparar", _motor_duckdb, chave_aws, chave_fab, int(casas), aws_path, fab_path)
+    except ImportError:
+        st.error("Motor DuckDB indisponível: instale o pacote duckdb (pip install duckdb).")
+        st.stop()
+    except ValueError as e:
+        st.error(f"Não foi possível comparar: {e}")
+        st.stop()
+    _comparacao_fora_da_memoria(motor, atol, somente_div)
+    _painel_desempenho()
+    st.stop()
 
-diff_table = merged[["nota_fiscal_id_aws","nota_fiscal_id_fabric"] + diff_cols + ["diverge"]].copy()
-if somente_div:
-    diff_table = diff_table[diff_table["diverge"]]
+# ---------- normalização ----------
+with medir("app.normalizar", linhas=len(aws_df) + len(fab_df)):
+    aws_n = _com_cache("normalizar", _normalizado, chave_aws, int(casas), aws_df)
+    fab_n = _com_cache("normalizar", _normalizado, chave_fab, int(casas), fab_df)
+
+# ---------- comparação ----------
+# merge/diff ficam em cache; a tolerância e o filtro são só uma máscara no fim
+try:
+    with medir("app.merge_diff", linhas=len(aws_n) + len(fab_n)):
+        diff_base, so_aws, so_fabric, max_abs = _com_cache("comparar", _diferencas, chave_aws, chave_fab, int(casas), aws_n, fab_n)
+except ValueError as e:
+    st.error(f"Não foi possível comparar: {e}")
+    st.stop()
+with medir("app.divergentes", linhas=len(diff_base)):
+    diff_table = marcar_divergentes(diff_base, max_abs, casas, atol)
+    if somente_div:
+        diff_table = diff_table[diff_table["diverge"]]
 
-# ---------- IDs que existem só em um lado ----------
-so_fabric = merged[merged["nota_fiscal_id_aws"].isna()][["nota_fiscal_id_fabric"]].dropna().astype("Int64")
-so_aws    = merged[merged["nota_fiscal_id_fabric"].isna()][["nota_fiscal_id_aws"]].dropna().astype("Int64")
-so_fabric = so_fabric.rename(columns={"nota_fiscal_id_fabric":"nota_fiscal_id"})
-so_aws    = so_aws.rename(columns={"nota_fiscal_id_aws":"nota_fiscal_id"})
+# ---------- indicador de cache ----------
+with st.sidebar.expander("Cache", expanded=False):
+    for etapa in ("carregar", "normalizar", "comparar"):
+        hits, misses = _cache_execucao.get(etapa, [0, 0])
+        st.write(f"{'🟢' if not misses else '🟠'} {etapa}: {hits} hit / {misses} miss")
 
 # ---------- abas ----------
-tab_diff, tab_fabric, tab_aws = st.tabs(["🔎 Diferenças", "📘 Fabric (dados)", "📗 AWS (dados)"])
+tab_diff, tab_fabric, tab_aws, tab_hist = st.tabs(["🔎 Diferenças", "📘 Fabric (dados)", "📗 AWS (dados)", "📚 Histórico"])
 
 with tab_diff:
     st.subheader("Diferenças (AWS − Fabric)")
-    st.caption(f"Tolerância: {atol:.2f} | Linhas exibidas: {len(diff_table)}")
-    #st.dataframe(diff_table, use_container_width=True)
-    # destaque de linhas com diferenças grandes (>= 1)
-    THRESHOLD = 1.0
+    diff_cols = [f"diff_{m}" for m in METRICAS]
+
+    # filtros/ordenação sobre o resultado em cache; só a página visível é estilizada
+    metrica, min_abs, id_ini, id_fim, ordem = _filtros_diferencas()
+
+    with medir("app.filtrar", linhas=len(diff_table)):
+        if metrica == "(todas)":
+            vis, abs_max = _filtrar_diferencas(diff_table, diff_cols, min_abs, id_ini, id_fim)
+        else:
+            vis, abs_max = _filtrar_diferencas(diff_table, [f"diff_{metrica}"], min_abs, id_ini, id_fim,
+                                               atol=atol, casas=int(casas))
+        if ordem != "nota_fiscal_id":
+            ordem_idx = np.argsort(-abs_max, kind="stable")
+            vis = vis.iloc[ordem_idx]
 
-    def highlight_big_diffs(row):
-        has_big = any(
-            abs(row[c]) >= THRESHOLD
-            for c in row.index
-            if str(c).startswith("diff_") and pd.notna(row[c])
-        )
-        style = 'background-color: #fff3b0; color: black' if has_big else ''
-        return [style for _ in row]
+    pagina, tam_pagina, n_paginas = _seletor_pagina(len(vis))
+    st.caption(f"Tolerância: {atol:.2f} | Linhas: {len(diff_table)} | Após filtros: {len(vis)} | Página {pagina}/{n_paginas}")
 
-    styled = diff_table.style.apply(highlight_big_diffs, axis=1)
-    st.dataframe(styled, use_container_width=True)
+    ini = (pagina - 1) * tam_pagina
+    with medir("app.render", linhas=min(tam_pagina, max(0, len(vis) - ini))):
+        st.dataframe(_estilizar_pagina(vis.iloc[ini:ini + tam_pagina], diff_cols), use_container_width=True)
 
-    st.download_button("⬇️ Baixar diferenças (CSV ;)", _to_bytes_csv(diff_table), "diferencas_aws_fabric.csv", "text/csv")
+    _baixar("Baixar diferenças", diff_table, "diferencas_aws_fabric",
+            f"diferencas|{chave_aws}|{chave_fab}|{int(casas)}|{atol}|{somente_div}")
+    _detalhamento(lambda: ids_divergentes(diff_table), int(diff_table["diverge"].sum()),
+                  manifesto.parametros(aws_path) if aws_path else {}, int(casas), atol)
 
     st.divider()
     col1, col2 = st.columns(2)
@@ -166,20 +490,26 @@ with tab_diff:
         st.markdown("### Somente no **Fabric**")
         st.caption(f"Total: {len(so_fabric)}")
         st.dataframe(so_fabric, use_container_width=True, height=260)
-        st.download_button("⬇️ Baixar (só no Fabric) CSV", _to_bytes_csv(so_fabric), "so_no_fabric.csv", "text/csv")
+        _baixar("Baixar (só no Fabric)", so_fabric, "so_no_fabric", f"so_fabric|{chave_aws}|{chave_fab}|{int(casas)}")
 
     with col2:
         st.markdown("### Somente na **AWS**")
         st.caption(f"Total: {len(so_aws)}")
         st.dataframe(so_aws, use_container_width=True, height=260)
-        st.download_button("⬇️ Baixar (só na AWS) CSV", _to_bytes_csv(so_aws), "so_na_aws.csv", "text/csv")
+        _baixar("Baixar (só na AWS)", so_aws, "so_na_aws", f"so_aws|{chave_aws}|{chave_fab}|{int(casas)}")
 
 with tab_fabric:
     st.subheader("Fabric (dados normalizados)")
     st.dataframe(fab_n, use_container_width=True)
-    st.download_button("⬇️ Baixar Fabric (CSV ;)", _to_bytes_csv(fab_n), "fabric_dados.csv", "text/csv")
+    _baixar("Baixar Fabric", fab_n, "fabric_dados", f"dados|{chave_fab}|{int(casas)}")
 
 with tab_aws:
     st.subheader("AWS (dados normalizados)")
     st.dataframe(aws_n, use_container_width=True)
-    st.download_button("⬇️ Baixar AWS (CSV ;)", _to_bytes_csv(aws_n), "aws_dados.csv", "text/csv")
+    _baixar("Baixar AWS", aws_n, "aws_dados", f"dados|{chave_aws}|{int(casas)}")
+
+with tab_hist:
+    _aba_historico()
+
+# ---------- painel de desempenho (spans deste rerun) ----------
+_painel_desempenho()
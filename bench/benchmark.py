@@ -0,0 +1,172 @@
+# bench/benchmark.py — tempo e pico de memória por etapa sobre dados sintéticos
+#
+#   python -m bench.benchmark --linhas 10000 100000 1000000
+#   python -m bench.benchmark --linhas 100000 --salvar-baseline
+#   python -m bench.benchmark --linhas 100000 --tolerancia 15   # sai com 1 se regredir
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import warnings
+from datetime import datetime
+
+from extracao_notas import (
+    METRICAS, _padronizar_cols, normalizar_numericos, salvar_extrato, extrair_aws, extrair_fabric,
+)
+from comparacao import normalizar, diferencas, marcar_divergentes
+from bench.sintetico import (
+    COLUNAS_ORIGEM, gerar_extratos, gerar_linhas, criar_banco, conectar_fabric, conectar_fabric_adbc, ConexaoPgSQLite,
+)
+
+PASTA = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(PASTA, "baseline.json")
+RESULTADOS = os.path.join("out", "bench")
+MAX_LINHAS_SQL = 200_000  # acima disso o SQLite domina o tempo e não diz nada do código
+
+def medir(func, *args, repeticoes: int = 1):
+    """Executa `func(*args)`; retorna (resultado, melhor tempo em s, pico de memória em MB)."""
+    tempos, pico = [], 0
+    for _ in range(max(1, repeticoes)):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        res = func(*args)
+        tempos.append(time.perf_counter() - t0)
+        pico = max(pico, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return res, min(tempos), pico / 2**20
+
+def rodar(n: int, casas: int = 4, atol: float = 0.01, seed: int = 0, repeticoes: int = 1,
+          sql: bool = True, **taxas) -> dict:
+    """Roda todas as etapas para `n` notas; retorna {etapa: {"s": ..., "mb": ...}}."""
+    aws, fab = gerar_extratos(n, seed=seed, **taxas)
+    etapas = {}
+
+    def etapa(nome, func, *args):
+        res, s, mb = medir(func, *args, repeticoes=repeticoes)
+        etapas[nome] = {"s": round(s, 4), "mb": round(mb, 2)}
+        print(f"  {nome:<22} {s:9.3f} s {mb:10.1f} MB", flush=True)
+        return res
+
+    # como sai do banco: nomes originais, fora de ordem, ids como object
+    bruto = aws.rename(columns=dict(zip(METRICAS, COLUNAS_ORIGEM))).sample(frac=1, random_state=seed)
+    bruto["nota_fiscal_id"] = bruto["nota_fiscal_id"].astype(object)
+    etapa("padronizar_cols", _padronizar_cols, bruto)
+    etapa("normalizar_numericos", normalizar_numericos, aws, casas)
+    aws_n = etapa("normalizar_aws", normalizar, aws, casas)
+    fab_n = etapa("normalizar_fabric", normalizar, fab, casas)
+    diff, _, _, max_abs = etapa("diferencas", diferencas, aws_n, fab_n, casas)
+    etapa("marcar_divergentes", marcar_divergentes, diff, max_abs, casas, atol)
+
+    tmp = tempfile.mkdtemp(prefix="bench_")
+    try:
+        base = os.path.join(tmp, "aws")
+        etapa("salvar_extrato", salvar_extrato, aws, f"{base}.csv", f"{base}.parquet", f"{base}.arrow")
+        if sql and n <= MAX_LINHAS_SQL:
+            db_aws, db_fab = os.path.join(tmp, "aws.db"), os.path.join(tmp, "fabric.db")
+            criar_banco(db_aws, gerar_linhas(aws, seed=seed))
+            criar_banco(db_fab, gerar_linhas(fab, seed=seed + 1))
+            conn_pg, conn_fab = ConexaoPgSQLite(db_aws), conectar_fabric(db_fab)
+            with warnings.catch_warnings():
+                # pandas avisa que só suporta SQLAlchemy; psycopg2/pyodbc crus dão o mesmo aviso
+                warnings.simplefilter("ignore", UserWarning)
+                etapa("extrair_aws_sqlite", extrair_aws, conn_pg, "2025-01-01", [1, 3])
+                etapa("extrair_aws_copy", extrair_aws, conn_pg, "2025-01-01", [1, 3], True)
+                etapa("extrair_fabric_sqlite", extrair_fabric, conn_fab, "2025-01-01", [1, 3])
+            conn_pg.close()
+            conn_fab.close()
+            try:
+                conn_adbc = conectar_fabric_adbc(db_fab)
+            except ImportError:
+                conn_adbc = None  # sem adbc-driver-sqlite a etapa Arrow fica de fora
+            if conn_adbc is not None:
+                etapa("extrair_fabric_arrow", extrair_fabric, conn_adbc, "2025-01-01", [1, 3], True)
+                conn_adbc.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return etapas
+
+def regressoes(atual: dict, baseline: dict, tolerancia: float) -> list:
+    """Etapas (n, etapa, métrica, antes, agora) mais de `tolerancia`% piores que a baseline."""
+    achados = []
+    for n, etapas in atual.items():
+        for nome, med in etapas.items():
+            ref = baseline.get(n, {}).get(nome)
+            if not ref:
+                continue
+            for m in ("s", "mb"):
+                # abaixo de 10 ms / 1 MB a variação é ruído
+                piso = 0.01 if m == "s" else 1.0
+                if max(ref[m], med[m]) >= piso and med[m] > ref[m] * (1 + tolerancia / 100):
+                    achados.append((n, nome, m, ref[m], med[m]))
+    return achados
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark das etapas de extração/comparação com dados sintéticos")
+    ap.add_argument("--linhas", type=int, nargs="+", default=[10_000, 100_000], help="quantidades de notas")
+    ap.add_argument("--divergencia", type=float, default=0.01)
+    ap.add_argument("--so-um-lado", type=float, default=0.005)
+    ap.add_argument("--nan", type=float, default=0.001)
+    ap.add_argument("--meio", type=float, default=0.01, help="taxa de valores …5 (ROUND_HALF_UP)")
+    ap.add_argument("--casas", type=int, default=4)
+    ap.add_argument("--atol", type=float, default=0.01)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeticoes", type=int, default=1, help="vale o melhor tempo")
+    ap.add_argument("--sem-sql", action="store_true", help="pula as etapas contra SQLite")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--salvar-baseline", action="store_true")
+    ap.add_argument("--tolerancia", type=float, default=20.0, help="%% de piora aceita antes de acusar regressão")
+    args = ap.parse_args(argv)
+
+    resultados = {}
+    for n in args.linhas:
+        print(f"▶ {n:,} notas", flush=True)
+        resultados[str(n)] = rodar(
+            n, args.casas, args.atol, args.seed, args.repeticoes, sql=not args.sem_sql,
+            taxa_divergencia=args.divergencia, taxa_so_um_lado=args.so_um_lado,
+            taxa_nan=args.nan, taxa_meio=args.meio,
+        )
+
+    registro = {
+        "quando": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "maquina": platform.node(),
+        "parametros": vars(args),
+        "resultados": resultados,
+    }
+    os.makedirs(RESULTADOS, exist_ok=True)
+    saida = os.path.join(RESULTADOS, datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ".json")
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(registro, f, indent=2, ensure_ascii=False)
+    print(f"✅ Resultados em {saida}")
+
+    if args.salvar_baseline:
+        base = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                base = json.load(f).get("resultados", {})
+        registro["resultados"] = {**base, **resultados}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(registro, f, indent=2, ensure_ascii=False)
+        print(f"✅ Baseline atualizada em {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("ℹ️ Sem baseline para comparar (use --salvar-baseline).")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f).get("resultados", {})
+    achados = regressoes(resultados, baseline, args.tolerancia)
+    for n, nome, m, antes, agora in achados:
+        unidade = "s" if m == "s" else "MB"
+        print(f"❌ {n} notas / {nome}: {antes} → {agora} {unidade} (+{(agora / antes - 1) * 100:.0f}%)")
+    if not achados:
+        print(f"✅ Nenhuma regressão acima de {args.tolerancia:g}%")
+    return 1 if achados else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
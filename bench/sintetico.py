@@ -0,0 +1,255 @@
+# bench/sintetico.py — gerador de notas sintéticas e bancos SQLite no lugar de AWS/Fabric
+import re
+import csv
+import io
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from extracao_notas import METRICAS
+
+# colunas de schema.tabela, na ordem de METRICAS
+COLUNAS_ORIGEM = [
+    "volume_fisico_realizado", "faturamento_bruto_realizado", "faturamento_liquido_realizado",
+    "faturamento_dolar", "faturamento_bruto_bonificado", "custo_comercializacao",
+    "custo_producao_realizado", "custo_materiais_realizado", "custo_financeiro", "valor_frete",
+]
+
+def gerar_extratos(n: int, taxa_divergencia: float = 0.01, taxa_so_um_lado: float = 0.005,
+                   taxa_nan: float = 0.001, taxa_meio: float = 0.01, seed: int = 0):
+    """
+    Par (aws, fabric) de extratos já agregados (nota_fiscal_id + METRICAS),
+    ordenados por nota, como saem de extrair_aws/extrair_fabric.
+
+    - taxa_divergencia: notas com alguma métrica diferente entre os lados
+    - taxa_so_um_lado: notas presentes só na AWS e (outro tanto) só no Fabric
+    - taxa_nan: células NaN
+    - taxa_meio: valores exatamente no meio da 4ª casa (…5), que testam o ROUND_HALF_UP
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.sort(rng.choice(np.arange(1, 4 * n + 1), size=n, replace=False))
+    valores = rng.normal(1_000, 5_000, size=(n, len(METRICAS))).round(6)
+    meio = rng.random(valores.shape) < taxa_meio
+    valores[meio] = (np.trunc(valores[meio] * 1e4) + 0.5) / 1e4
+    aws = pd.DataFrame(valores, columns=METRICAS)
+    aws.insert(0, "nota_fiscal_id", ids)
+
+    fab = aws.copy()
+    div = rng.random(n) < taxa_divergencia
+    col = rng.integers(0, len(METRICAS), size=n)
+    vals = fab[METRICAS].to_numpy(copy=True)
+    vals[np.flatnonzero(div), col[div]] += rng.normal(0, 10, size=div.sum()).round(4)
+    fab[METRICAS] = vals
+
+    for df in (aws, fab):
+        nan = rng.random((n, len(METRICAS))) < taxa_nan
+        df[METRICAS] = df[METRICAS].mask(nan)
+
+    so = rng.random(n)
+    aws = aws[~(so < taxa_so_um_lado)]                               # só no Fabric
+    fab = fab[~((so >= taxa_so_um_lado) & (so < 2 * taxa_so_um_lado))]  # só na AWS
+    aws = aws.astype({"nota_fiscal_id": "Int64"}).reset_index(drop=True)
+    fab = fab.astype({"nota_fiscal_id": "Int64"}).reset_index(drop=True)
+    return aws, fab
+
+def gerar_linhas(extrato: pd.DataFrame, linhas_por_nota: int = 3, dt_inicio: str = "2025-01-01",
+                 dias: int = 180, status=(1, 3), seed: int = 0, espalhar: bool = False) -> pd.DataFrame:
+    """
+    Quebra um extrato agregado em linhas de schema.tabela (tempo_id,
+    status_pedido_id e as colunas originais) cuja soma por nota reproduz o
+    extrato. Valores NaN viram NULL. Por padrão as linhas de uma nota caem
+    no mesmo dia; espalhar=True sorteia um dia por linha (notas que
+    atravessam meses).
+    """
+    rng = np.random.default_rng(seed)
+    n = len(extrato)
+    rep = np.repeat(np.arange(n), linhas_por_nota)
+    pesos = rng.random((n, linhas_por_nota))
+    pesos /= pesos.sum(axis=1, keepdims=True)
+    vals = extrato[METRICAS].to_numpy(dtype="float64")
+    partes = (vals[:, None, :] * pesos[:, :, None]).round(6)
+    partes[:, -1, :] = vals - partes[:, :-1, :].sum(axis=1)  # última linha fecha a soma
+    linhas = pd.DataFrame(partes.reshape(-1, len(METRICAS)), columns=COLUNAS_ORIGEM)
+    base = pd.Timestamp(dt_inicio)
+    dia_nota = rng.integers(0, dias, size=n)
+    linhas.insert(0, "nota_fiscal_id", extrato["nota_fiscal_id"].to_numpy(dtype="int64")[rep])
+    linhas.insert(1, "tempo_id", (base + pd.to_timedelta(dia_nota[rep], unit="D")).strftime("%Y-%m-%d"))
+    linhas.insert(2, "status_pedido_id", np.asarray(status)[rng.integers(0, len(status), size=n)][rep])
+    if espalhar:
+        linhas["tempo_id"] = (base + pd.to_timedelta(rng.integers(0, dias, size=len(linhas)), unit="D")).strftime("%Y-%m-%d")
+    return linhas
+
+def criar_banco(path: str, linhas: pd.DataFrame):
+    """Grava `linhas` em schema.tabela de um arquivo SQLite (anexado como 'schema')."""
+    conn = sqlite3.connect(path)
+    conn.execute("drop table if exists tabela")
+    linhas.to_sql("tabela", conn, index=False)
+    conn.execute("create index ix_tabela_nota on tabela (nota_fiscal_id)")
+    conn.commit()
+    conn.close()
+
+def conectar_fabric(path: str):
+    """Conexão SQLite que roda sql/fabric.sql como está (parâmetros '?')."""
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.execute("attach database ? as schema", (path,))
+    return conn
+
+def conectar_fabric_adbc(path: str):
+    """Como conectar_fabric, mas via ADBC (pip install adbc-driver-sqlite): exercita a leitura Arrow."""
+    import adbc_driver_sqlite.dbapi
+    conn = adbc_driver_sqlite.dbapi.connect(":memory:")
+    cur = conn.cursor()
+    cur.execute("attach database ? as schema", [path])
+    cur.close()
+    return conn
+
+# ---------- stand-in do Postgres (sql/aws.sql em SQLite) ----------
+_PG = re.compile(r"=\s*ANY\(%\((\w+)\)s\)|%\((\w+)\)s|%%|::numeric|::bigint", re.I)
+
+def _traduzir_pg(sql: str, params):
+    """pyformat do psycopg2 (%(x)s, = ANY(%(x)s), %%) -> qmark do SQLite; casts ::numeric/::bigint saem."""
+    params = params or {}
+    valores = []
+
+    def _troca(m):
+        if m.group(1):
+            lista = list(params[m.group(1)])
+            valores.extend(lista)
+            return f"in ({','.join(['?'] * len(lista))})" if lista else "in (null)"
+        if m.group(2):
+            valores.append(params[m.group(2)])
+            return "?"
+        return "%" if m.group(0) == "%%" else ""
+    return _PG.sub(_troca, sql), valores
+
+def _literal_pg(valor) -> str:
+    """Literal como o psycopg2 renderiza no mogrify."""
+    if valor is None:
+        return "NULL"
+    if isinstance(valor, bool):
+        return "true" if valor else "false"
+    if isinstance(valor, (int, float, np.integer, np.floating)):
+        return repr(valor.item() if isinstance(valor, np.generic) else valor)
+    if isinstance(valor, (list, tuple)):
+        return "ARRAY[" + ",".join(_literal_pg(v) for v in valor) + "]"
+    return "'" + str(valor).replace("'", "''") + "'"
+
+_COPY = re.compile(r"^\s*COPY\s*\((.*)\)\s*TO\s+STDOUT\s+WITH\s*\(FORMAT csv, HEADER true\)\s*$", re.I | re.S)
+_ANY_ARRAY = re.compile(r"=\s*ANY\(ARRAY\[(.*?)\]\)", re.I)
+
+class _CursorPg:
+    def __init__(self, conn):
+        self._cur = conn.cursor()
+        self.itersize = 2000
+
+    def execute(self, sql, params=None):
+        self._cur.execute(*_traduzir_pg(sql, params))
+        return self
+
+    def mogrify(self, sql, params=None):
+        params = params or {}
+        sql = re.sub(r"%\((\w+)\)s", lambda m: _literal_pg(params[m.group(1)]), sql)
+        return sql.replace("%%", "%").encode()
+
+    def copy_expert(self, sql, arquivo):
+        """COPY (consulta já com literais) TO STDOUT em CSV, como o Postgres escreve."""
+        consulta = _COPY.match(sql).group(1)
+        consulta = _ANY_ARRAY.sub(lambda m: f"in ({m.group(1) or 'null'})", consulta).replace("::numeric", "")
+        self._cur.execute(consulta)
+        texto = io.StringIO()
+        saida = csv.writer(texto, lineterminator="\n")
+        saida.writerow([d[0] for d in self._cur.description])
+        for linha in self._cur:
+            saida.writerow(["" if v is None else repr(v) if isinstance(v, float) else v for v in linha])
+        arquivo.write(texto.getvalue().encode())
+
+    def __getattr__(self, nome):
+        return getattr(self._cur, nome)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cur.close()
+
+class ConexaoPgSQLite:
+    """
+    Conexão SQLite com a interface usada do psycopg2: aceita sql/aws.sql
+    (pyformat, = ANY, %%, ::numeric, ::bigint), cursor(name=...), mogrify,
+    copy_expert (COPY ... TO STDOUT em CSV), rollback() e cancel().
+    """
+    def __init__(self, path: str):
+        self._conn = conectar_fabric(path)
+        self.closed = 0
+
+    def cursor(self, name=None, **kwargs):
+        return _CursorPg(self._conn)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def cancel(self):
+        """Como o psycopg2: interrompe a consulta em andamento (de outra thread)."""
+        self._conn.interrupt()
+
+    def close(self):
+        self.closed = 1
+        self._conn.close()
+
+# ---------- falhas injetadas (queda de rede, throttling) ----------
+class FalhaInjetada(ConnectionError):
+    """Erro levantado por ConexaoComFalhas no lugar da consulta."""
+
+class _CursorComFalhas:
+    def __init__(self, dono, cur):
+        self._dono, self._cur = dono, cur
+
+    def execute(self, sql, params=None):
+        self._dono._antes(sql, params)
+        self._cur.execute(sql, params) if params is not None else self._cur.execute(sql)
+        return self
+
+    def __getattr__(self, nome):
+        return getattr(self._cur, nome)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cur.close()
+
+class ConexaoComFalhas:
+    """
+    Envolve uma conexão dos stand-ins (conectar_fabric, ConexaoPgSQLite) e
+    faz o execute() levantar FalhaInjetada: nas consultas de número
+    `falhar_em` (1 = a primeira) e/ou enquanto `falhar_se(sql, params)` for
+    verdadeiro. `consultas` e `falhas` contam o que aconteceu. O resto da
+    interface é a da conexão envolvida.
+    """
+    def __init__(self, conn, falhar_em=(), falhar_se=None):
+        self._conn = conn
+        self.falhar_em, self.falhar_se = set(falhar_em), falhar_se
+        self.consultas = 0
+        self.falhas = 0
+
+    def _antes(self, sql, params):
+        self.consultas += 1
+        if self.consultas in self.falhar_em or (self.falhar_se and self.falhar_se(sql, params)):
+            self.falhas += 1
+            raise FalhaInjetada(f"falha injetada na consulta {self.consultas}")
+
+    def cursor(self, *args, **kwargs):
+        return _CursorComFalhas(self, self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
@@ -0,0 +1,105 @@
+# cache_consultas.py — cache dos resultados de extrair_aws/extrair_fabric em out/cache (Arrow IPC)
+#
+# Chave: origem + hash do SQL já montado (com o {{STATUS_FILTER}}
+# substituído) + dt_inicio + status ordenados. Cada resultado é um .arrow sem
+# compressão, lido por memory map. O mtime do arquivo é a hora da consulta
+# (TTL) e o atime, renovado a cada acerto, a ordem de uso para a remoção
+# por tamanho (LRU).
+import os
+import json
+import time
+import glob
+import uuid
+import hashlib
+
+import pandas as pd
+
+from extracao_notas import _SQL
+from desempenho import medir
+
+CACHE_DIR = os.path.join("out", "cache")
+TTL_MIN = 30
+MAX_MB = 2048
+
+def chave(origem: str, dt_inicio: str, status_lista) -> str:
+    status = sorted(int(s) for s in status_lista)
+    sql, _ = _SQL[origem](dt_inicio, status)
+    texto = json.dumps([origem, hashlib.sha256(sql.encode()).hexdigest(), str(dt_inicio), status])
+    return f"{origem}_{hashlib.sha1(texto.encode()).hexdigest()[:20]}"
+
+def buscar(chave_: str, ttl_min: float = TTL_MIN, pasta: str = CACHE_DIR):
+    """(DataFrame, idade em s) se houver resultado com menos de `ttl_min` minutos; senão (None, None)."""
+    import pyarrow as pa
+    import pyarrow.ipc
+
+    path = os.path.join(pasta, f"{chave_}.arrow")
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return None, None
+    idade = time.time() - info.st_mtime
+    if idade > ttl_min * 60:
+        return None, None
+    with medir("cache.leitura", bytes=info.st_size) as sp:
+        df = pa.ipc.open_file(pa.memory_map(path)).read_all().to_pandas()
+        sp.linhas = len(df)
+    os.utime(path, (time.time(), info.st_mtime))  # uso recente, mesma hora de consulta
+    return df, idade
+
+def guardar(chave_: str, df: pd.DataFrame, pasta: str = CACHE_DIR):
+    import pyarrow as pa
+    import pyarrow.ipc
+
+    os.makedirs(pasta, exist_ok=True)
+    path = os.path.join(pasta, f"{chave_}.arrow")
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(tmp, "wb") as f, pa.ipc.new_file(f, tabela.schema) as w:
+        w.write_table(tabela)
+    os.replace(tmp, path)
+
+def limitar(max_mb: float = MAX_MB, pasta: str = CACHE_DIR, padrao: str = "*.arrow") -> int:
+    """Remove os arquivos (`padrao`) usados há mais tempo até a pasta caber em `max_mb`; retorna quantos saíram."""
+    arquivos = []
+    for path in glob.glob(os.path.join(pasta, padrao)):
+        try:
+            info = os.stat(path)
+        except FileNotFoundError:
+            continue
+        arquivos.append((info.st_atime, info.st_size, path))
+    total = sum(a[1] for a in arquivos)
+    removidos = 0
+    for _, tamanho, path in sorted(arquivos):
+        if total <= max_mb * 2**20:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= tamanho
+        removidos += 1
+    return removidos
+
+def extrair_com_cache(origem: str, extrair, dt_inicio: str, status_lista, ttl_min: float = TTL_MIN,
+                      max_mb: float = MAX_MB, forcar: bool = False, pasta: str = CACHE_DIR, log=None) -> pd.DataFrame:
+    """
+    `extrair()` (ex.: lambda: extrair_aws(conn, dt, status)) com cache: um
+    resultado da mesma consulta com menos de `ttl_min` minutos é lido de
+    out/cache em vez de ir ao banco. `forcar` ignora o que estiver guardado
+    e o substitui. `log` recebe se o resultado veio do cache.
+    """
+    log = log or (lambda msg: None)
+    chave_ = chave(origem, dt_inicio, status_lista)
+    if not forcar:
+        df, idade = buscar(chave_, ttl_min, pasta)
+        if df is not None:
+            log(f"⚡ {origem.upper()} servido do cache ({len(df)} linhas, consultado há {idade / 60:.0f} min)")
+            return df
+    df = extrair()
+    try:
+        guardar(chave_, df, pasta)
+        limitar(max_mb, pasta)
+    except Exception as e:  # cache cheio/sem permissão não impede a extração
+        log(f"⚠️ {origem.upper()} resultado não guardado no cache: {e}")
+    log(f"🗄️ {origem.upper()} consultado no banco{' (atualização forçada)' if forcar else ''}")
+    return df
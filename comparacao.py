@@ -0,0 +1,211 @@
+# comparacao.py — comparação AWS × Fabric (sem Streamlit, usada pelo app e por scripts)
+import os
+import numpy as np
+import pandas as pd
+
+from extracao_notas import (
+    METRICAS, escalar_inteiros, desescalar, limite_escalado, _ids_int64, _montar_ordenado,
+)
+
+def normalizar(df: pd.DataFrame, casas: int = 4) -> pd.DataFrame:
+    colunas = {"nota_fiscal_id": _ids_int64(df["nota_fiscal_id"])}
+    for c in METRICAS:
+        if c in df.columns:
+            colunas[c] = desescalar(escalar_inteiros(df[c], casas), casas)
+    return _montar_ordenado(colunas)
+
+# ---------- motor sort-merge (entradas já ordenadas por nota_fiscal_id) ----------
+LOTE_COMPARACAO = 200_000
+_COLUNAS = ["nota_fiscal_id"] + METRICAS
+
+def _frames_arquivo(path, tamanho: int):
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+
+    if str(path).endswith((".arrow", ".feather")):
+        reader = pa.ipc.open_file(pa.memory_map(str(path)))
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i).to_pandas()
+    else:
+        arq = pq.ParquetFile(path)
+        cols = [c for c in _COLUNAS if c in arq.schema_arrow.names]
+        for batch in arq.iter_batches(batch_size=tamanho, columns=cols):
+            yield batch.to_pandas()
+
+def _lotes_ordenados(fonte, casas: int, tamanho: int):
+    """
+    (ids int64, bloco int64 n × len(METRICAS) escalado) por lote, a partir de
+    um DataFrame, de um caminho Parquet/Arrow ou de um iterável de DataFrames.
+    Linhas sem nota_fiscal_id são descartadas.
+    """
+    if isinstance(fonte, pd.DataFrame):
+        frames = (fonte.iloc[i:i + tamanho] for i in range(0, len(fonte), tamanho))
+    elif isinstance(fonte, (str, os.PathLike)):
+        frames = _frames_arquivo(fonte, tamanho)
+    else:
+        frames = fonte
+    ultimo = None
+    for df in frames:
+        ids = pd.to_numeric(df["nota_fiscal_id"], errors="coerce")
+        ok = ids.notna().to_numpy()
+        ids = ids[ok].to_numpy(dtype=np.int64)
+        if not len(ids):
+            continue
+        if np.any(ids[1:] <= ids[:-1]) or (ultimo is not None and ids[0] <= ultimo):
+            raise ValueError("Entrada da comparação precisa estar ordenada por nota_fiscal_id (sem repetição).")
+        ultimo = ids[-1]
+        bloco = np.zeros((len(ids), len(METRICAS)), dtype=np.int64)
+        for j, m in enumerate(METRICAS):
+            if m in df.columns:
+                bloco[:, j] = escalar_inteiros(df[m], casas)[ok]
+        yield ids, bloco
+
+def _casar(ids, a_ids, a_blk, b_ids, b_blk, pos: int, casas: int, atol_int):
+    ia, ib = np.searchsorted(ids, a_ids), np.searchsorted(ids, b_ids)
+    tem_a = np.zeros(len(ids), dtype=bool); tem_a[ia] = True
+    tem_b = np.zeros(len(ids), dtype=bool); tem_b[ib] = True
+    diff = np.zeros((len(ids), len(METRICAS)), dtype=np.int64)
+    diff[ia] += a_blk
+    diff[ib] -= b_blk
+    max_abs = np.abs(diff).max(axis=1) if len(ids) else np.zeros(0, dtype=np.int64)
+    idx = pd.RangeIndex(pos, pos + len(ids))
+
+    so_aws = pd.DataFrame({"nota_fiscal_id": pd.array(ids[tem_a & ~tem_b], dtype="Int64")}, index=idx[tem_a & ~tem_b])
+    so_fabric = pd.DataFrame({"nota_fiscal_id": pd.array(ids[tem_b & ~tem_a], dtype="Int64")}, index=idx[tem_b & ~tem_a])
+    sel = np.ones(len(ids), dtype=bool) if atol_int is None else max_abs > atol_int
+    cols = {
+        "nota_fiscal_id_aws": pd.arrays.IntegerArray(ids[sel], ~tem_a[sel]),
+        "nota_fiscal_id_fabric": pd.arrays.IntegerArray(ids[sel], ~tem_b[sel]),
+    }
+    for j, m in enumerate(METRICAS):
+        cols[f"diff_{m}"] = desescalar(diff[sel, j], casas)
+    # copy=False: uma coluna por bloco, para _juntar liberar as partes coluna a coluna
+    return pd.DataFrame(cols, index=idx[sel], copy=False), max_abs[sel], so_aws, so_fabric
+
+def comparar_ordenado(aws, fabric, casas: int = 4, atol: float = None, tamanho: int = LOTE_COMPARACAO):
+    """
+    Comparação AWS − Fabric por merge de dois ponteiros sobre entradas
+    ordenadas por nota_fiscal_id (DataFrames, arquivos Parquet/Arrow ou
+    iteráveis de DataFrames, como extrair_*_lotes). A memória é
+    proporcional a `tamanho`, não ao total de notas.
+
+    Gera, por lote, (diff_table, max_abs, so_aws, so_fabric): com atol=None
+    todas as linhas do outer join; com atol, só as divergentes
+    (|diff| > atol em alguma métrica). max_abs é o maior |diff| de cada
+    linha em inteiros escalados.
+    """
+    atol_int = None if atol is None else limite_escalado(atol, casas)
+    lotes = (_lotes_ordenados(aws, casas, tamanho), _lotes_ordenados(fabric, casas, tamanho))
+    vazio = (np.zeros(0, dtype=np.int64), np.zeros((0, len(METRICAS)), dtype=np.int64))
+    buf, fim = [vazio, vazio], [False, False]
+    pos = 0
+    while True:
+        for k in (0, 1):
+            if not fim[k] and not len(buf[k][0]):
+                prox = next(lotes[k], None)
+                if prox is None: fim[k] = True
+                else: buf[k] = prox
+        if fim[0] and fim[1] and not len(buf[0][0]) and not len(buf[1][0]):
+            break
+        # só dá para casar até o menor "último id" entre os lados ainda abertos
+        abertos = [buf[k][0][-1] for k in (0, 1) if not fim[k]]
+        limite = min(abertos) if abertos else np.iinfo(np.int64).max
+        partes = []
+        for k in (0, 1):
+            n = np.searchsorted(buf[k][0], limite, side="right")
+            partes.append((buf[k][0][:n], buf[k][1][:n]))
+            buf[k] = (buf[k][0][n:], buf[k][1][n:])
+        (a_ids, a_blk), (b_ids, b_blk) = partes
+        if not len(a_ids) and not len(b_ids):
+            continue
+        ids = np.union1d(a_ids, b_ids)
+        yield _casar(ids, a_ids, a_blk, b_ids, b_blk, pos, casas, atol_int)
+        pos += len(ids)
+
+def _juntar(resultados, casas: int):
+    partes = list(resultados)
+    if not partes:
+        ids, blk = np.zeros(0, dtype=np.int64), np.zeros((0, len(METRICAS)), dtype=np.int64)
+        partes = [_casar(ids, ids, blk, ids, blk, 0, casas, None)]
+    diff, max_abs, so_aws, so_fabric = (list(x) for x in zip(*partes))
+    del partes
+    # concatena coluna a coluna, descartando a coluna das partes em seguida:
+    # o pico fica perto de uma tabela, não de duas (partes + resultado)
+    indice = diff[0].index.append([d.index for d in diff[1:]])
+    colunas = {}
+    for c in list(diff[0].columns):
+        colunas[c] = pd.concat([d[c] for d in diff], ignore_index=True).array
+        for d in diff:
+            del d[c]
+    diff_table = pd.DataFrame(colunas, index=indice, copy=False)
+    return diff_table, pd.concat(so_aws), pd.concat(so_fabric), np.concatenate(max_abs)
+
+def diferencas(aws_n: pd.DataFrame, fab_n: pd.DataFrame, casas: int = 4):
+    """
+    Outer join por nota_fiscal_id e diferenças AWS − Fabric, sem tolerância
+    (via comparar_ordenado). Retorna (diff_table, so_aws, so_fabric, max_abs),
+    onde max_abs é o maior |diff| de cada linha em inteiros escalados — a
+    tolerância vira só uma máscara barata (ver marcar_divergentes).
+    """
+    return _juntar(comparar_ordenado(aws_n, fab_n, casas, atol=None), casas)
+
+def divergentes(aws, fabric, casas: int = 4, atol: float = 0.01, tamanho: int = LOTE_COMPARACAO):
+    """Só as linhas divergentes e os IDs de um lado só: (diff_table, so_aws, so_fabric)."""
+    diff_table, so_aws, so_fabric, _ = _juntar(comparar_ordenado(aws, fabric, casas, atol, tamanho), casas)
+    return diff_table, so_aws, so_fabric
+
+def marcar_divergentes(diff_table: pd.DataFrame, max_abs, casas: int = 4, atol: float = 0.01) -> pd.DataFrame:
+    """Acrescenta "diverge" (|diff| > atol em alguma métrica) sem refazer as diferenças."""
+    out = diff_table.copy(deep=False)  # só acrescenta uma coluna: não duplica a tabela
+    out["diverge"] = np.asarray(max_abs) > limite_escalado(atol, casas)
+    return out
+
+def comparar(aws_n: pd.DataFrame, fab_n: pd.DataFrame, casas: int = 4, atol: float = 0.01):
+    """
+    Outer join por nota_fiscal_id e diferenças AWS − Fabric.
+    Retorna (diff_table, so_aws, so_fabric); diff_table traz todas as linhas
+    com a coluna booleana "diverge" (|diff| > atol em alguma métrica).
+    """
+    diff_table, so_aws, so_fabric, max_abs = diferencas(aws_n, fab_n, casas)
+    return marcar_divergentes(diff_table, max_abs, casas, atol), so_aws, so_fabric
+
+if __name__ == "__main__":
+    # uso: python comparacao.py out/aws_notas_X.parquet out/fabric_notas_Y.parquet [--saida divergentes.parquet]
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Compara dois extratos (Parquet/Arrow) ordenados por nota_fiscal_id.")
+    ap.add_argument("aws")
+    ap.add_argument("fabric")
+    ap.add_argument("--casas", type=int, default=4)
+    ap.add_argument("--atol", type=float, default=0.01)
+    ap.add_argument("--saida", help="Parquet com as linhas divergentes")
+    ap.add_argument("--motor", choices=["pandas", "duckdb"], default="pandas",
+                    help="duckdb: fora da memória, aceita entradas fora de ordem")
+    ap.add_argument("--memoria", help="limite de RAM do DuckDB (ex.: 2GB)")
+    args = ap.parse_args()
+
+    if args.motor == "duckdb":
+        from comparacao_duckdb import ComparacaoDuckDB
+
+        motor = ComparacaoDuckDB(args.aws, args.fabric, args.casas, memoria=args.memoria)
+        n = motor.contagens(args.atol)
+        if args.saida:
+            motor.exportar("diferencas", args.saida, atol=args.atol)
+        motor.fechar()
+        print(f"divergentes: {n['divergentes']} | só AWS: {n['so_aws']} | só Fabric: {n['so_fabric']}")
+        raise SystemExit(0)
+
+    writer = None
+    n_div = n_aws = n_fab = 0
+    for diff, _, so_aws, so_fabric in comparar_ordenado(args.aws, args.fabric, args.casas, args.atol):
+        n_div += len(diff); n_aws += len(so_aws); n_fab += len(so_fabric)
+        if args.saida and len(diff):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            tabela = pa.Table.from_pandas(diff, preserve_index=False)
+            writer = writer or pq.ParquetWriter(args.saida, tabela.schema)
+            writer.write_table(tabela)
+    if writer:
+        writer.close()
+    print(f"divergentes: {n_div} | só AWS: {n_aws} | só Fabric: {n_fab}")
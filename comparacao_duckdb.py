@@ -0,0 +1,245 @@
+# comparacao_duckdb.py — comparação fora da memória (DuckDB) sobre os Parquet/Arrow de out/
+#
+# Mesmo pipeline de comparacao.py (normalizar → outer join → diff →
+# tolerância), mas executado pelo DuckDB num banco temporário em disco: o
+# que não cabe na RAM vai para temp_directory. Só a página pedida (ou o
+# que for explicitamente materializado) vira DataFrame.
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from extracao_notas import METRICAS, escalar_inteiros, desescalar, limite_escalado
+
+ERRO_ORDEM = "Entrada da comparação precisa estar ordenada por nota_fiscal_id (sem repetição)."
+
+def _dataset(path):
+    import pyarrow.dataset as ds
+    formato = "ipc" if str(path).endswith((".arrow", ".feather")) else "parquet"
+    return ds.dataset(str(path), format=formato)
+
+def _literal(texto: str) -> str:
+    return "'" + str(texto).replace("'", "''") + "'"
+
+def _fechar(con, pasta):
+    try: con.close()
+    except Exception: pass
+    shutil.rmtree(pasta, ignore_errors=True)
+
+class ComparacaoDuckDB:
+    """
+    Comparação AWS × Fabric de dois arquivos (Parquet ou Arrow IPC) sem
+    carregá-los no pandas. Na construção, normaliza os dois lados (mesmo
+    ROUND_HALF_UP de escalar_inteiros, via UDF vetorizada) e grava o outer
+    join com as diferenças em inteiros escalados; os métodos consultam essa
+    tabela. Resultados idênticos a comparacao.diferencas/comparar.
+
+    `memoria` limita a RAM do DuckDB (ex.: "2GB"); o excedente vai para
+    disco em `pasta_temp` (default: diretório temporário do sistema).
+    """
+
+    def __init__(self, aws, fabric, casas: int = 4, memoria: str = None, pasta_temp: str = None):
+        import duckdb
+
+        self.casas = int(casas)
+        self._escala = 10.0 ** self.casas
+        self._pasta = tempfile.mkdtemp(prefix="nf_duckdb_", dir=pasta_temp)
+        self._con = duckdb.connect(os.path.join(self._pasta, "comparacao.duckdb"))
+        self._finalizar = weakref.finalize(self, _fechar, self._con, self._pasta)
+        con = self._con
+        con.execute(f"set temp_directory = {_literal(self._pasta)}")
+        con.execute("set enable_progress_bar = false")
+        if memoria:
+            con.execute(f"set memory_limit = {_literal(memoria)}")
+        con.create_function("escalar", self._escalar, ["DOUBLE"], "BIGINT", type="arrow")
+
+        for lado, path in (("aws", aws), ("fabric", fabric)):
+            dataset = _dataset(path)
+            con.register(f"fonte_{lado}", dataset)
+            metricas = ", ".join(
+                f'coalesce(escalar("{m}"::DOUBLE), 0) as "{m}"' if m in dataset.schema.names else f'0::BIGINT as "{m}"'
+                for m in METRICAS
+            )
+            con.execute(f"""
+                create table {lado} as
+                select "nota_fiscal_id"::BIGINT as id, {metricas}
+                from fonte_{lado} where "nota_fiscal_id" is not null
+            """)
+            con.unregister(f"fonte_{lado}")
+            n, distintos = con.execute(f"select count(*), count(distinct id) from {lado}").fetchone()
+            if n != distintos:
+                self.fechar()
+                raise ValueError(ERRO_ORDEM)
+
+        diffs = ", ".join(f'coalesce(a."{m}", 0) - coalesce(f."{m}", 0) as "{m}"' for m in METRICAS)
+        maximo = ", ".join(f'abs("{m}")' for m in METRICAS)
+        con.execute(f"""
+            create table dif as
+            select *, greatest({maximo}) as max_abs from (
+                select row_number() over (order by coalesce(a.id, f.id)) - 1 as pos,
+                       coalesce(a.id, f.id) as id,
+                       a.id is not null as tem_a,
+                       f.id is not null as tem_b,
+                       {diffs}
+                from aws a full outer join fabric f on a.id = f.id
+            )
+        """)
+
+    def _escalar(self, valores):
+        import pyarrow as pa
+        return pa.array(escalar_inteiros(valores.to_numpy(zero_copy_only=False), self.casas), type=pa.int64())
+
+    def _consultar(self, sql: str, params=()):
+        cur = self._con.cursor()
+        try:
+            return cur.execute(sql, list(params)).fetchnumpy()
+        finally:
+            cur.close()
+
+    def _contar(self, sql: str, params=()) -> int:
+        cur = self._con.cursor()
+        try:
+            return int(cur.execute(sql, list(params)).fetchone()[0])
+        finally:
+            cur.close()
+
+    def fechar(self):
+        self._finalizar()
+
+    # ---------- montagem dos DataFrames (mesmo formato de comparacao._casar) ----------
+    def _diff_table(self, linhas: dict, atol: float = None) -> pd.DataFrame:
+        ids = np.asarray(linhas["id"], dtype=np.int64)
+        tem_a = np.asarray(linhas["tem_a"], dtype=bool)
+        tem_b = np.asarray(linhas["tem_b"], dtype=bool)
+        cols = {
+            "nota_fiscal_id_aws": pd.arrays.IntegerArray(ids, ~tem_a),
+            "nota_fiscal_id_fabric": pd.arrays.IntegerArray(ids.copy(), ~tem_b),
+        }
+        for m in METRICAS:
+            cols[f"diff_{m}"] = desescalar(np.asarray(linhas[m], dtype=np.int64), self.casas)
+        if atol is not None:
+            cols["diverge"] = np.asarray(linhas["max_abs"], dtype=np.int64) > limite_escalado(atol, self.casas)
+        indice = pd.Index(np.asarray(linhas["pos"], dtype=np.int64))
+        return pd.DataFrame(cols, index=indice, copy=False)
+
+    def _so_um_lado(self, condicao: str) -> pd.DataFrame:
+        linhas = self._consultar(f"select pos, id from dif where {condicao} order by pos")
+        return pd.DataFrame(
+            {"nota_fiscal_id": pd.array(np.asarray(linhas["id"], dtype=np.int64), dtype="Int64")},
+            index=pd.Index(np.asarray(linhas["pos"], dtype=np.int64)),
+        )
+
+    # ---------- consultas ----------
+    def contagens(self, atol: float = 0.01) -> dict:
+        """Totais do outer join: linhas, divergentes, só AWS e só Fabric."""
+        cur = self._con.cursor()
+        try:
+            total, div, so_aws, so_fab = cur.execute(
+                "select count(*), count(*) filter (max_abs > ?), count(*) filter (tem_a and not tem_b), "
+                "count(*) filter (tem_b and not tem_a) from dif",
+                [limite_escalado(atol, self.casas)],
+            ).fetchone()
+        finally:
+            cur.close()
+        return {"total": total, "divergentes": div, "so_aws": so_aws, "so_fabric": so_fab}
+
+    def _filtro(self, atol, somente_div, metricas, min_abs, id_ini, id_fim):
+        escolhidas = bool(metricas)
+        metricas = list(metricas or METRICAS)
+        sel = "greatest(" + ", ".join(f'abs("{m}")' for m in metricas) + ")"
+        where, params = [f"{sel}::DOUBLE / {self._escala!r} >= ?"], [float(min_abs or 0.0)]
+        if escolhidas:  # métricas escolhidas: só as linhas em que alguma delas passa da tolerância
+            where.append(f"{sel} > ?"); params.append(limite_escalado(atol, self.casas))
+        if somente_div:
+            where.append("max_abs > ?"); params.append(limite_escalado(atol, self.casas))
+        if id_ini is not None:
+            where.append("id >= ?"); params.append(id_ini)
+        if id_fim is not None:
+            where.append("id <= ?"); params.append(id_fim)
+        return sel, " and ".join(where), params
+
+    def contar(self, atol: float = 0.01, somente_div: bool = True, metricas=None, min_abs: float = 0.0,
+               id_ini=None, id_fim=None) -> int:
+        """Quantas linhas passam pelos filtros de pagina()."""
+        _, where, params = self._filtro(atol, somente_div, metricas, min_abs, id_ini, id_fim)
+        return self._contar(f"select count(*) from dif where {where}", params)
+
+    def pagina(self, atol: float = 0.01, somente_div: bool = True, metricas=None, min_abs: float = 0.0,
+               id_ini=None, id_fim=None, por_maior_diff: bool = False, limite: int = 100, deslocamento: int = 0):
+        """
+        Uma página das diferenças com os mesmos filtros da aba "Diferenças"
+        do app (tolerância, métricas, |diff| mínimo, faixa de IDs, ordem).
+        Retorna (DataFrame com "diverge", total de linhas após os filtros).
+        """
+        sel, where, params = self._filtro(atol, somente_div, metricas, min_abs, id_ini, id_fim)
+        total = self.contar(atol, somente_div, metricas, min_abs, id_ini, id_fim)
+        ordem = f"{sel} desc, pos" if por_maior_diff else "pos"
+        linhas = self._consultar(
+            f"select * from dif where {where} order by {ordem} limit ? offset ?",
+            params + [int(limite), int(deslocamento)],
+        )
+        return self._diff_table(linhas, atol), total
+
+    def diferencas(self):
+        """Tudo materializado, como comparacao.diferencas: (diff_table, so_aws, so_fabric, max_abs)."""
+        linhas = self._consultar("select * from dif order by pos")
+        return (self._diff_table(linhas), self.so_aws(), self.so_fabric(),
+                np.asarray(linhas["max_abs"], dtype=np.int64))
+
+    def divergentes(self, atol: float = 0.01):
+        """Como comparacao.divergentes: (diff_table só com as divergentes, so_aws, so_fabric)."""
+        linhas = self._consultar("select * from dif where max_abs > ? order by pos", [limite_escalado(atol, self.casas)])
+        return self._diff_table(linhas), self.so_aws(), self.so_fabric()
+
+    def so_aws(self) -> pd.DataFrame:
+        return self._so_um_lado("tem_a and not tem_b")
+
+    def so_fabric(self) -> pd.DataFrame:
+        return self._so_um_lado("tem_b and not tem_a")
+
+    def dados(self, lado: str, limite: int = 1000, deslocamento: int = 0):
+        """Página dos dados normalizados de um lado ("aws"/"fabric"); retorna (DataFrame, total)."""
+        tabela = {"aws": "aws", "fabric": "fabric"}[lado]
+        total = self._contar(f"select count(*) from {tabela}")
+        linhas = self._consultar(f"select * from {tabela} order by id limit ? offset ?", [int(limite), int(deslocamento)])
+        cols = {"nota_fiscal_id": pd.array(np.asarray(linhas["id"], dtype=np.int64), dtype="Int64")}
+        for m in METRICAS:
+            cols[m] = desescalar(np.asarray(linhas[m], dtype=np.int64), self.casas)
+        return pd.DataFrame(cols), total
+
+    def exportar(self, o_que: str, destino: str, atol: float = 0.01, somente_div: bool = True):
+        """
+        Grava direto do DuckDB, sem passar pelo pandas, um de "diferencas",
+        "so_aws", "so_fabric", "aws" ou "fabric" em `destino` (.parquet ou
+        CSV com sep=';').
+        """
+        valores = ", ".join(f'"{m}"::DOUBLE / {self._escala!r} as "{m}"' for m in METRICAS)
+        diffs = ", ".join(f'"{m}"::DOUBLE / {self._escala!r} as "diff_{m}"' for m in METRICAS)
+        atol_int = limite_escalado(atol, self.casas)
+        consultas = {
+            "diferencas": f"select case when tem_a then id end as nota_fiscal_id_aws, "
+                          f"case when tem_b then id end as nota_fiscal_id_fabric, {diffs}, max_abs > {atol_int} as diverge "
+                          f"from dif {'where max_abs > ' + str(atol_int) if somente_div else ''} order by pos",
+            "so_aws": "select id as nota_fiscal_id from dif where tem_a and not tem_b order by pos",
+            "so_fabric": "select id as nota_fiscal_id from dif where tem_b and not tem_a order by pos",
+            "aws": f"select id as nota_fiscal_id, {valores} from aws order by id",
+            "fabric": f"select id as nota_fiscal_id, {valores} from fabric order by id",
+        }
+        formato = "(format parquet)" if str(destino).endswith(".parquet") else "(header, delimiter ';')"
+        cur = self._con.cursor()
+        try:
+            cur.execute(f"copy ({consultas[o_que]}) to {_literal(destino)} {formato}")
+        finally:
+            cur.close()
+        return destino
+
+def divergentes(aws, fabric, casas: int = 4, atol: float = 0.01, memoria: str = None):
+    """comparacao.divergentes fora da memória, a partir de caminhos Parquet/Arrow."""
+    motor = ComparacaoDuckDB(aws, fabric, casas, memoria)
+    try:
+        return motor.divergentes(atol)
+    finally:
+        motor.fechar()
@@ -0,0 +1,38 @@
+# conexoes.py — abertura de conexões (PostgreSQL/AWS e Fabric) a partir do .env
+import os
+
+import psycopg2
+import pyodbc
+
+def require_env(key: str) -> str:
+    val = os.getenv(key)
+    if not val:
+        raise RuntimeError(f"Variável de ambiente '{key}' ausente no .env")
+    return val
+
+def nova_conexao_pg():
+    host = require_env("PG_HOST")
+    port = os.getenv("PG_PORT", "5432")
+    db   = require_env("PG_DB")
+    user = require_env("PG_USER")
+    pwd  = require_env("PG_PASSWORD")
+    return psycopg2.connect(
+        host=host, port=port, database=db, user=user, password=pwd,
+        connect_timeout=10, sslmode=os.getenv("PG_SSLMODE","require")
+    )
+
+def string_conexao_fabric() -> str:
+    driver = os.getenv("FABRIC_ODBC_DRIVER", "ODBC Driver 18 for SQL Server")
+    server = require_env("FABRIC_SERVER")
+    db     = require_env("FABRIC_DB")
+    user   = require_env("FABRIC_USER")
+    pwd    = require_env("FABRIC_PASSWORD")
+    auth   = os.getenv("FABRIC_AUTH", "ActiveDirectoryPassword")
+    return (
+        f"DRIVER={{{driver}}};SERVER={server};DATABASE={db};"
+        f"UID={user};PWD={pwd};Authentication={auth};"
+        "Encrypt=yes;TrustServerCertificate=no;Connection Timeout=15;"
+    )
+
+def nova_conexao_fabric():
+    return pyodbc.connect(string_conexao_fabric())
@@ -0,0 +1,158 @@
+# desempenho.py — spans de tempo, vazão e memória por etapa (log da GUI + JSON lines em out/)
+#
+#   with medir("aws.leitura") as sp:
+#       rows = cur.fetchall()
+#       sp.linhas = len(rows)
+#
+# Desligado (padrão), medir() devolve sempre o mesmo objeto nulo: nada é
+# cronometrado, gravado ou alocado. O span nulo é falso em `if sp:`, para
+# pular contas que só servem à medição (ex.: memory_usage).
+import os
+import json
+import time
+import threading
+import tracemalloc
+from collections import deque
+from datetime import datetime
+
+_config = {"ativo": False, "memoria": True, "arquivo": None}
+_destinos = []
+_recentes = deque(maxlen=500)
+_local = threading.local()
+_trava = threading.Lock()
+_abertos = []            # spans abertos (todas as threads) que medem memória
+_tracemalloc_nosso = False
+
+def configurar(ativo: bool = True, memoria: bool = True, arquivo: str = "out/desempenho.jsonl"):
+    """
+    Liga/desliga a medição. `memoria` usa tracemalloc (pico de memória
+    alocada durante o span; custa algum tempo em código Python puro) e
+    `arquivo` recebe uma linha JSON por span (None = não grava).
+    """
+    _config.update(ativo=bool(ativo), memoria=bool(memoria), arquivo=arquivo)
+
+def ativo() -> bool:
+    return _config["ativo"]
+
+def assinar(destino):
+    """Registra `destino(registro)` para cada span encerrado (ex.: log da GUI)."""
+    _destinos.append(destino)
+    return destino
+
+def cancelar(destino):
+    if destino in _destinos:
+        _destinos.remove(destino)
+
+def iniciar_coleta() -> list:
+    """Lista que passa a receber os spans encerrados nesta thread (ex.: um rerun do Streamlit)."""
+    _local.coleta = []
+    return _local.coleta
+
+def recentes() -> list:
+    return list(_recentes)
+
+class _SpanNulo:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+    def __bool__(self): return False
+    def __setattr__(self, nome, valor): pass
+
+_NULO = _SpanNulo()
+
+def _repassar_pico():
+    # tracemalloc tem um único pico global: antes de zerá-lo, repassa aos spans abertos
+    atual, pico = tracemalloc.get_traced_memory()
+    for s in _abertos:
+        s.pico = max(s.pico, pico - s.mem_inicio)
+    tracemalloc.reset_peak()
+    return atual
+
+class Span:
+    """Uma etapa cronometrada; `linhas` e `bytes` podem ser preenchidos dentro do with."""
+
+    def __init__(self, etapa: str, linhas=None, bytes=None, **extra):
+        self.etapa, self.linhas, self.bytes, self.extra = etapa, linhas, bytes, extra
+        self.mem_inicio = self.pico = 0
+        self.memoria = False
+
+    def __enter__(self):
+        global _tracemalloc_nosso
+        if _config["memoria"]:
+            with _trava:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _tracemalloc_nosso = True
+                self.mem_inicio = _repassar_pico()
+                self.memoria = True
+                _abertos.append(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, exc, tb):
+        global _tracemalloc_nosso
+        s = time.perf_counter() - self.t0
+        if self.memoria:
+            with _trava:
+                _repassar_pico()
+                _abertos.remove(self)
+                if not _abertos and _tracemalloc_nosso:
+                    tracemalloc.stop()
+                    _tracemalloc_nosso = False
+        registro = {
+            "quando": datetime.now().isoformat(timespec="milliseconds"),
+            "etapa": self.etapa,
+            "s": round(s, 4),
+            "linhas": self.linhas,
+            "linhas_s": round(self.linhas / s) if self.linhas is not None and s > 0 else None,
+            "bytes": self.bytes,
+            "mb_s": round(self.bytes / 2**20 / s, 2) if self.bytes is not None and s > 0 else None,
+            "pico_mb": round(self.pico / 2**20, 2) if self.memoria else None,
+            "thread": threading.current_thread().name,
+            **self.extra,
+        }
+        if tipo is not None:
+            registro["erro"] = tipo.__name__
+        _emitir(registro)
+        return False
+
+def medir(etapa: str, linhas=None, bytes=None, **extra):
+    """Context manager que mede `etapa`; com a medição desligada não faz nada."""
+    if not _config["ativo"]:
+        return _NULO
+    return Span(etapa, linhas, bytes, **extra)
+
+def _emitir(registro: dict):
+    _recentes.append(registro)
+    coleta = getattr(_local, "coleta", None)
+    if coleta is not None:
+        coleta.append(registro)
+    arquivo = _config["arquivo"]
+    if arquivo:
+        try:
+            with _trava:
+                os.makedirs(os.path.dirname(arquivo) or ".", exist_ok=True)
+                with open(arquivo, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+        except OSError:
+            pass
+    for destino in list(_destinos):
+        try:
+            destino(registro)
+        except Exception:
+            pass
+
+def formatar(registro: dict) -> str:
+    """Linha curta para log: etapa, tempo, linhas/s, MB, MB/s e pico de memória."""
+    partes = [f"⏱️ {registro['etapa']}: {registro['s']:.2f}s"]
+    if registro.get("linhas") is not None:
+        vazao = f" ({registro['linhas_s']:,}/s)" if registro.get("linhas_s") is not None else ""
+        partes.append(f"{registro['linhas']:,} linhas{vazao}")
+    if registro.get("bytes") is not None:
+        vazao = f" ({registro['mb_s']} MB/s)" if registro.get("mb_s") is not None else ""
+        partes.append(f"{registro['bytes'] / 2**20:.1f} MB{vazao}")
+    if registro.get("pico_mb") is not None:
+        partes.append(f"pico {registro['pico_mb']} MB")
+    if registro.get("erro"):
+        partes.append(f"erro {registro['erro']}")
+    return " | ".join(partes)
@@ -0,0 +1,143 @@
+# detalhamento.py — linhas (sem agregação) das notas divergentes, nos dois bancos
+#
+# sql/aws_detalhe.sql e sql/fabric_detalhe.sql trazem as linhas de
+# schema.tabela que o group by de aws.sql/fabric.sql soma, só para os IDs
+# pedidos: em lotes de `= ANY(%(f0)s)` no Postgres e, no Fabric, por uma
+# tabela temporária com os IDs (ou lotes de `in (?, ...)` se ela não puder
+# ser criada). As duas origens rodam em paralelo.
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from extracao_notas import METRICAS, _SQL, _conexao, _ler_consulta, escalar_inteiros, desescalar, limite_escalado
+from desempenho import medir
+
+CHAVE_LINHA = ["nota_fiscal_id", "tempo_id", "status_pedido_id"]
+LOTE_AWS = 10_000
+LOTE_FABRIC = 2_000  # o SQL Server aceita até 2100 parâmetros por comando
+# (criar, nome, remover) da tabela temporária de IDs no Fabric
+TEMP_FABRIC = ("create table #nf_detalhe (nota_fiscal_id bigint not null)", "#nf_detalhe", "drop table #nf_detalhe")
+
+def ids_divergentes(diff_table: pd.DataFrame, limite: int = None) -> list:
+    """IDs (ordenados, sem repetição) das linhas com diverge=True, ou de todas se não houver a coluna."""
+    if "diverge" in diff_table.columns:
+        diff_table = diff_table[diff_table["diverge"].to_numpy(dtype=bool)]
+    ids = diff_table["nota_fiscal_id_aws"].fillna(diff_table["nota_fiscal_id_fabric"]).dropna()
+    ids = np.unique(ids.to_numpy(dtype=np.int64))
+    return ids[:limite].tolist() if limite else ids.tolist()
+
+def _lotes(ids, tamanho: int):
+    for i in range(0, len(ids), tamanho):
+        yield ids[i:i + tamanho]
+
+def _padronizar_linhas(partes) -> pd.DataFrame:
+    colunas = CHAVE_LINHA + METRICAS
+    df = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=colunas)
+    df = df[[c for c in colunas if c in df.columns]]
+    df["nota_fiscal_id"] = pd.to_numeric(df["nota_fiscal_id"], errors="coerce").astype("Int64")
+    # date (psycopg2/pyodbc), datetime ou texto (SQLite) → mesmo texto AAAA-MM-DD
+    df["tempo_id"] = pd.to_datetime(df["tempo_id"], errors="coerce").dt.strftime("%Y-%m-%d")
+    df["status_pedido_id"] = pd.to_numeric(df["status_pedido_id"], errors="coerce").astype("Int64")
+    for c in METRICAS:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    return df.sort_values(CHAVE_LINHA, kind="stable").reset_index(drop=True)
+
+def detalhar_aws(conn_pg, dt_inicio: str, status_lista, ids, lote: int = LOTE_AWS) -> pd.DataFrame:
+    """Linhas de schema.tabela (AWS) das notas `ids`, em lotes de `= ANY(array)`."""
+    partes = []
+    with _conexao(conn_pg) as conn_pg, medir("aws.detalhe", ids=len(ids)) as sp:
+        for parte in _lotes(list(ids), lote):
+            sql, params = _SQL["aws"](dt_inicio, status_lista, [("nota_fiscal_id", "in", parte)],
+                                      arquivo="aws_detalhe.sql")
+            partes.append(_ler_consulta(conn_pg, sql, params, "aws.detalhe"))
+        df = _padronizar_linhas(partes)
+        sp.linhas = len(df)
+    return df
+
+def _detalhar_fabric_temp(conn, dt_inicio, status_lista, ids, temporaria) -> pd.DataFrame:
+    criar, nome, remover = temporaria
+    cur = conn.cursor()
+    try:
+        cur.execute(criar)
+        if hasattr(cur, "fast_executemany"):
+            cur.fast_executemany = True  # pyodbc: um round-trip por lote em vez de um por ID
+        cur.executemany(f"insert into {nome} (nota_fiscal_id) values (?)", [(int(i),) for i in ids])
+    finally:
+        cur.close()
+    try:
+        sql, params = _SQL["fabric"](dt_inicio, status_lista, arquivo="fabric_detalhe.sql")
+        sql = sql.replace("-- {{IDS_FILTER}}", f"and nota_fiscal_id in (select nota_fiscal_id from {nome})")
+        return _ler_consulta(conn, sql, params, "fabric.detalhe")
+    finally:
+        cur = conn.cursor()
+        try:
+            cur.execute(remover)
+        finally:
+            cur.close()
+
+def detalhar_fabric(conn_fabric, dt_inicio: str, status_lista, ids, lote: int = LOTE_FABRIC,
+                    temporaria=TEMP_FABRIC) -> pd.DataFrame:
+    """
+    Linhas de schema.tabela (Fabric) das notas `ids`: um único SELECT
+    juntando com a tabela temporária de IDs; se ela não puder ser criada
+    (permissão, driver), lotes de `in (?, ...)`.
+    """
+    ids = list(ids)
+    with _conexao(conn_fabric) as conn_fabric, medir("fabric.detalhe", ids=len(ids)) as sp:
+        partes = None
+        if temporaria and ids:
+            try:
+                partes = [_detalhar_fabric_temp(conn_fabric, dt_inicio, status_lista, ids, temporaria)]
+            except Exception:
+                try: conn_fabric.rollback()
+                except Exception: pass
+        if partes is None:
+            partes = []
+            for parte in _lotes(ids, lote):
+                sql, params = _SQL["fabric"](dt_inicio, status_lista, [("nota_fiscal_id", "in", parte)],
+                                             arquivo="fabric_detalhe.sql")
+                partes.append(_ler_consulta(conn_fabric, sql, params, "fabric.detalhe"))
+        df = _padronizar_linhas(partes)
+        sp.linhas = len(df)
+    return df
+
+def detalhar(conn_pg, conn_fabric, dt_inicio: str, status_lista, ids, **kwargs_fabric):
+    """(linhas AWS, linhas Fabric) das notas `ids`, com as duas consultas em paralelo."""
+    ids = sorted({int(i) for i in ids})
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        aws = pool.submit(detalhar_aws, conn_pg, dt_inicio, status_lista, ids)
+        fab = pool.submit(detalhar_fabric, conn_fabric, dt_inicio, status_lista, ids, **kwargs_fabric)
+        return aws.result(), fab.result()
+
+def diff_linhas(aws: pd.DataFrame, fabric: pd.DataFrame, casas: int = 4, atol: float = 0.01) -> pd.DataFrame:
+    """
+    Casa as linhas dos dois lados por (nota, tempo_id, status) — e pela
+    ordem dentro dessa chave, quando ela se repete — e devolve, lado a
+    lado, cada métrica da AWS, do Fabric e a diferença (mesmo ROUND_HALF_UP
+    da comparação), com `situacao`: igual, diverge, so_aws ou so_fabric.
+    """
+    def _com_ordem(df):
+        df = df.sort_values(CHAVE_LINHA + [m for m in METRICAS if m in df.columns], kind="stable")
+        return df.assign(linha=df.groupby(CHAVE_LINHA, dropna=False).cumcount())
+
+    chave = CHAVE_LINHA + ["linha"]
+    juntos = _com_ordem(aws).merge(_com_ordem(fabric), on=chave, how="outer",
+                                   suffixes=("_aws", "_fabric"), indicator=True)
+    limite = limite_escalado(atol, casas)
+    diverge = np.zeros(len(juntos), dtype=bool)
+    saida = {c: juntos[c] for c in chave}
+    for m in METRICAS:
+        a = escalar_inteiros(juntos[f"{m}_aws"], casas)
+        f = escalar_inteiros(juntos[f"{m}_fabric"], casas)
+        saida[f"{m}_aws"] = juntos[f"{m}_aws"]
+        saida[f"{m}_fabric"] = juntos[f"{m}_fabric"]
+        saida[f"diff_{m}"] = desescalar(a - f, casas)
+        diverge |= np.abs(a - f) > limite
+    situacao = np.where(juntos["_merge"] == "left_only", "so_aws",
+                        np.where(juntos["_merge"] == "right_only", "so_fabric",
+                                 np.where(diverge, "diverge", "igual")))
+    res = pd.DataFrame(saida)
+    res.insert(len(chave), "situacao", situacao)
+    return res.sort_values(chave, kind="stable").reset_index(drop=True)
@@ -0,0 +1,146 @@
+# execucao_lote.py — extração + comparação AWS × Fabric sem interface (agendamentos noturnos)
+#
+# uso:
+#   python execucao_lote.py --params 2025-08-01:1,3 --params 2025-09-01:1 --processos 4 --limite 0.001
+#   python execucao_lote.py --arquivo parametros.csv        (colunas: dt_inicio;status_lista)
+#
+# Código de saída: 0 = tudo dentro do limite, 1 = algum conjunto acima do limite, 2 = erro.
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from extracao_notas import extrair_aws, extrair_fabric, normalizar_numericos
+from comparacao import divergentes
+import historico
+
+def parse_status(s: str):
+    return [int(x.strip()) for x in str(s).split(",") if x.strip()]
+
+def _ler_parametros(args):
+    conjuntos = []
+    for p in args.params or []:
+        dt, _, status = p.partition(":")
+        conjuntos.append((dt.strip(), parse_status(status)))
+    if args.arquivo:
+        df = pd.read_csv(args.arquivo, sep=None, engine="python", dtype=str)
+        for _, row in df.iterrows():
+            conjuntos.append((row["dt_inicio"].strip(), parse_status(row["status_lista"])))
+    return conjuntos
+
+def executar_conjunto(dt_inicio: str, status_lista, destino: str, casas: int = 4, atol: float = 0.01,
+                      pasta_historico: str = None, quando: datetime = None) -> dict:
+    """
+    Extrai AWS e Fabric para um (dt_inicio, status_lista), compara e grava
+    diferencas/so_aws/so_fabric em Parquet dentro de `destino`; com
+    `pasta_historico`, registra também a execução no histórico.
+    Roda em um processo do pool: abre e fecha as próprias conexões.
+    """
+    t0 = time.perf_counter()
+    resumo = {"dt_inicio": dt_inicio, "status_lista": status_lista, "destino": destino}
+    conn_pg = conn_fabric = None
+    try:
+        from conexoes import nova_conexao_pg, nova_conexao_fabric
+        conn_pg, conn_fabric = nova_conexao_pg(), nova_conexao_fabric()
+        aws = extrair_aws(conn_pg, dt_inicio, status_lista, os.getenv("AWS_COPY", "0") == "1", log=print)
+        aws = normalizar_numericos(aws, casas=casas)
+        fab = extrair_fabric(conn_fabric, dt_inicio, status_lista, os.getenv("FABRIC_ARROW", "0") == "1",
+                             int(os.getenv("FABRIC_ARROW_LOTE", "100000")), log=print)
+        fab = normalizar_numericos(fab, casas=casas)
+        diff, so_aws, so_fabric = divergentes(aws, fab, casas=casas, atol=atol)
+
+        os.makedirs(destino, exist_ok=True)
+        diff.to_parquet(os.path.join(destino, "diferencas.parquet"), index=False)
+        so_aws.to_parquet(os.path.join(destino, "so_aws.parquet"), index=False)
+        so_fabric.to_parquet(os.path.join(destino, "so_fabric.parquet"), index=False)
+
+        total = len(aws) + len(so_fabric)  # notas distintas nos dois lados
+        n_div = len(diff)  # inclui as notas de um lado só que passam da tolerância
+        resumo.update({
+            "linhas_aws": len(aws), "linhas_fabric": len(fab),
+            "divergentes": n_div, "so_aws": len(so_aws), "so_fabric": len(so_fabric),
+            "taxa_divergencia": (n_div / total) if total else 0.0,
+        })
+        if pasta_historico:
+            try:
+                resumo["historico"] = historico.registrar_execucao(
+                    diff, so_aws, so_fabric, dt_inicio, status_lista, aws, fab,
+                    casas=casas, atol=atol, quando=quando, pasta=pasta_historico,
+                )
+            except Exception as e:  # o histórico não invalida a comparação
+                resumo["erro_historico"] = f"{type(e).__name__}: {e}"
+    except Exception as e:
+        resumo["erro"] = f"{type(e).__name__}: {e}"
+    finally:
+        for conn in (conn_pg, conn_fabric):
+            try:
+                if conn: conn.close()
+            except Exception:
+                pass
+    resumo["segundos"] = round(time.perf_counter() - t0, 2)
+    return resumo
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Extração e comparação AWS × Fabric em lote (sem GUI).")
+    ap.add_argument("--params", action="append", help="dt_inicio:status1,status2 (pode repetir)")
+    ap.add_argument("--arquivo", help="CSV com colunas dt_inicio e status_lista")
+    ap.add_argument("--processos", type=int, default=int(os.getenv("LOTE_PROCESSOS", "2")))
+    ap.add_argument("--casas", type=int, default=4)
+    ap.add_argument("--atol", type=float, default=0.01)
+    ap.add_argument("--limite", type=float, default=float(os.getenv("LOTE_LIMITE_DIVERGENCIA", "0")),
+                    help="taxa máxima de notas divergentes (0–1) antes de sair com código 1")
+    ap.add_argument("--saida", default=os.path.join("out", "lote"))
+    ap.add_argument("--historico", default=historico.HISTORICO_DIR, help="pasta do histórico de execuções")
+    ap.add_argument("--sem-historico", action="store_true", help="não registra as execuções no histórico")
+    args = ap.parse_args(argv)
+
+    load_dotenv()
+    conjuntos = _ler_parametros(args)
+    if not conjuntos:
+        ap.error("informe --params e/ou --arquivo")
+
+    agora = datetime.now()
+    raiz = os.path.join(args.saida, agora.strftime("%Y-%m-%d_%H-%M-%S"))
+    pasta_historico = None if args.sem_historico else args.historico
+    with ProcessPoolExecutor(max_workers=max(1, args.processos)) as pool:
+        futuros = [
+            pool.submit(executar_conjunto, dt, status,
+                        os.path.join(raiz, f"{dt}_{'-'.join(map(str, status)) or 'todos'}"),
+                        args.casas, args.atol, pasta_historico, agora)
+            for dt, status in conjuntos
+        ]
+        resumos = [f.result() for f in futuros]
+
+    os.makedirs(raiz, exist_ok=True)
+    with open(os.path.join(raiz, "resumo.json"), "w", encoding="utf-8") as f:
+        json.dump(resumos, f, ensure_ascii=False, indent=2)
+
+    if pasta_historico:
+        # retenção + compactação (HISTORICO_DIAS / HISTORICO_MAX_ARQUIVOS); aqui não há mais ninguém gravando
+        historico.compactar(pasta_historico)
+
+    codigo = 0
+    for r in resumos:
+        if "erro" in r:
+            print(f"❌ {r['dt_inicio']} {r['status_lista']}: {r['erro']}")
+            codigo = 2
+            continue
+        acima = r["taxa_divergencia"] > args.limite
+        print(f"{'⚠️' if acima else '✅'} {r['dt_inicio']} {r['status_lista']}: "
+              f"{r['divergentes']} divergentes ({r['taxa_divergencia']:.4%}) | "
+              f"só AWS {r['so_aws']} | só Fabric {r['so_fabric']} | {r['segundos']}s")
+        if "erro_historico" in r:
+            print(f"   ⚠️ histórico não gravado: {r['erro_historico']}")
+        if acima and codigo == 0:
+            codigo = 1
+    print(f"Resumo: {os.path.join(raiz, 'resumo.json')}")
+    return codigo
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+# exportacao.py — arquivos dos downloads do app, gerados só quando pedidos
+#
+# O app passa ao st.download_button uma função (executada só no clique) que
+# chama exportar(): o DataFrame é escrito em lotes pelo pyarrow (CSV com ';',
+# CSV gzip/zstd ou Parquet zstd) em out/downloads, com nome derivado da chave
+# dos dados. Um segundo pedido dos mesmos dados no mesmo formato lê o
+# arquivo pronto. A pasta é limitada por tamanho (LRU, como out/cache).
+import os
+import gzip
+import time
+import uuid
+import hashlib
+
+import pandas as pd
+
+from cache_consultas import limitar
+from desempenho import medir
+
+EXPORT_DIR = os.path.join("out", "downloads")
+MAX_MB = 1024
+LOTE = 100_000
+# formato → (extensão, mime, rótulo)
+FORMATOS = {
+    "csv": (".csv", "text/csv", "CSV ;"),
+    "csv.gz": (".csv.gz", "application/gzip", "CSV ; gzip"),
+    "csv.zst": (".csv.zst", "application/zstd", "CSV ; zstd"),
+    "parquet": (".parquet", "application/vnd.apache.parquet", "Parquet"),
+}
+GZIP_NIVEL = 6  # o gzip do pyarrow é fixo no nível 9, várias vezes mais lento para quase o mesmo tamanho
+
+def chave_conteudo(df: pd.DataFrame) -> str:
+    """Hash de colunas + linhas, para quando o chamador não tem uma chave dos dados."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update("\x1f".join(map(str, df.columns)).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def caminho(chave: str, formato: str, pasta: str = EXPORT_DIR) -> str:
+    nome = hashlib.sha1(f"{chave}|{formato}".encode()).hexdigest()[:24]
+    return os.path.join(pasta, nome + FORMATOS[formato][0])
+
+def _lotes(df: pd.DataFrame, schema, lote: int):
+    import pyarrow as pa
+    for ini in range(0, len(df), lote):
+        yield pa.RecordBatch.from_pandas(df.iloc[ini:ini + lote], schema=schema, preserve_index=False)
+
+def _escrever(df: pd.DataFrame, destino: str, formato: str, lote: int):
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+
+    schema = pa.Schema.from_pandas(df, preserve_index=False).remove_metadata()
+    if formato == "parquet":
+        with pq.ParquetWriter(destino, schema, compression="zstd") as w:
+            for b in _lotes(df, schema, lote):
+                w.write_batch(b)
+        return
+    if formato == "csv.gz":
+        sink = pa.PythonFile(gzip.open(destino, "wb", compresslevel=GZIP_NIVEL), mode="w")
+    elif formato == "csv.zst":
+        sink = pa.CompressedOutputStream(destino, "zstd")
+    else:
+        sink = pa.OSFile(destino, "wb")
+    opcoes = pacsv.WriteOptions(delimiter=";", quoting_style="needed")
+    with sink, pacsv.CSVWriter(sink, schema, write_options=opcoes) as w:
+        for b in _lotes(df, schema, lote):
+            w.write_batch(b)
+
+def exportar(df: pd.DataFrame, formato: str = "csv", chave: str = None, pasta: str = EXPORT_DIR,
+             max_mb: float = MAX_MB, lote: int = LOTE) -> str:
+    """
+    Caminho do arquivo de `df` em `formato` (ver FORMATOS). Se já existir um
+    para a mesma `chave` (default: hash do conteúdo), é reaproveitado; senão
+    é escrito em lotes de `lote` linhas num temporário e renomeado.
+    """
+    chave = chave or chave_conteudo(df)
+    destino = caminho(chave, formato, pasta)
+    if os.path.exists(destino):
+        os.utime(destino, (time.time(), os.path.getmtime(destino)))  # uso recente (LRU)
+        return destino
+    os.makedirs(pasta, exist_ok=True)
+    # oculto (.nome) para o limitar() abaixo não pegar um temporário em escrita
+    tmp = os.path.join(pasta, f".{os.path.basename(destino)}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with medir(f"exportar.{formato}", linhas=len(df)) as sp:
+            _escrever(df, tmp, formato, lote)
+            if sp:
+                sp.bytes = os.path.getsize(tmp)
+        limitar(max_mb, pasta, padrao="*")  # antes do rename: o arquivo novo nunca é o removido
+        os.replace(tmp, destino)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return destino
+
+def ler(df: pd.DataFrame, formato: str = "csv", chave: str = None, pasta: str = EXPORT_DIR,
+        max_mb: float = MAX_MB) -> bytes:
+    """Bytes de exportar() — o que o st.download_button recebe no clique."""
+    with open(exportar(df, formato, chave, pasta, max_mb), "rb") as f:
+        return f.read()
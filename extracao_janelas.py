@@ -0,0 +1,153 @@
+# extracao_janelas.py — extração retomável por janelas de tempo_id, com checkpoint em out/janelas
+#
+# O período [dt_inicio, ...) é dividido em janelas de `meses` meses; cada
+# janela é uma consulta sem HAVING (somas parciais por nota, ver
+# extracao_notas.extrair_parcial) gravada como uma parte Parquet, e o
+# checkpoint.json registra as janelas concluídas. Se a extração cair no
+# meio (rede, throttling do Fabric), a próxima chamada com os mesmos
+# parâmetros pula as janelas já gravadas. No fim as partes são somadas por
+# nota (reagregar, que aplica o HAVING): notas que atravessam janelas
+# terminam com o mesmo total da consulta única.
+import os
+import time
+import shutil
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from extracao_notas import extrair_parcial, reagregar, ExtracaoCancelada
+from incremental import _ler_estado, _gravar_estado
+from desempenho import medir
+
+JANELAS_DIR = os.path.join("out", "janelas")
+MESES_PADRAO = 1
+VALIDADE_H = 24  # checkpoint mais antigo que isso é descartado (as janelas podem ter mudado no banco)
+
+def janelas(dt_inicio: str, meses: int = MESES_PADRAO, hoje: date = None):
+    """
+    [(inicio, fim)] de `meses` em `meses` meses (limites no dia 1) a partir
+    de dt_inicio; a última janela vai até o fim da tabela (fim=None), como
+    a consulta única.
+    """
+    hoje = hoje or date.today()
+    meses = max(1, int(meses))
+    inicio, atual = dt_inicio, date.fromisoformat(dt_inicio[:10])
+    res = []
+    while True:
+        m = atual.year * 12 + atual.month - 1 + meses
+        prox = date(m // 12, m % 12 + 1, 1)
+        if prox > hoje:
+            break
+        res.append((inicio, prox.isoformat()))
+        inicio, atual = prox.isoformat(), prox
+    res.append((inicio, None))
+    return res
+
+def _pasta(origem: str, dt_inicio: str, status_lista, pasta: str = JANELAS_DIR) -> str:
+    status = "-".join(str(s) for s in sorted(status_lista)) or "todos"
+    return os.path.join(pasta, f"{origem}_{dt_inicio}_{status}")
+
+def _carregar(estado_path: str, origem: str, dt_inicio: str, status_lista, meses: int, validade_h: float):
+    """Janelas concluídas do checkpoint {(inicio, fim): registro}, se ele for destes parâmetros e recente."""
+    estado = _ler_estado(estado_path)
+    if not estado:
+        return {}
+    if (estado.get("origem"), estado.get("dt_inicio"), estado.get("status_lista"), estado.get("meses")) \
+            != (origem, dt_inicio, sorted(status_lista), meses):
+        return {}
+    if datetime.now() - datetime.fromisoformat(estado["criado"]) > timedelta(hours=validade_h):
+        return {}
+    pasta = os.path.dirname(estado_path)
+    return {(j["inicio"], j["fim"]): j for j in estado.get("janelas", [])
+            if os.path.exists(os.path.join(pasta, j["arquivo"]))}
+
+def _consultar_janela(origem: str, conn, dt_inicio: str, status_lista, fim, tentativas: int, backoff_s: float,
+                      log, progresso, cancelamento) -> pd.DataFrame:
+    """extrair_parcial da janela, com novas tentativas (espera exponencial) para falhas passageiras."""
+    for tentativa in range(tentativas):
+        try:
+            return extrair_parcial(origem, conn, dt_inicio, status_lista, dt_fim=fim,
+                                   progresso=progresso, cancelamento=cancelamento)
+        except ExtracaoCancelada:
+            raise
+        except Exception as e:
+            if tentativa + 1 == tentativas:
+                raise
+            espera = backoff_s * 2 ** tentativa
+            log(f"⚠️ {origem.upper()} janela [{dt_inicio}, {fim or '…'}): falhou ({type(e).__name__}: {e}); "
+                f"nova tentativa em {espera:.1f}s")
+            if cancelamento:
+                cancelamento.verificar()
+            time.sleep(espera)
+
+def extrair_janelas(origem: str, conn, dt_inicio: str, status_lista, meses: int = MESES_PADRAO,
+                    recomecar: bool = False, manter: bool = False, tentativas: int = 3, backoff_s: float = 2.0,
+                    validade_h: float = VALIDADE_H, pasta: str = JANELAS_DIR, hoje: date = None, log=None,
+                    progresso=None, cancelamento=None) -> pd.DataFrame:
+    """
+    Extrai `origem` ("aws"/"fabric") janela a janela (ver janelas()) e
+    devolve o mesmo que extrair_aws/extrair_fabric. Cada janela concluída
+    vira uma parte Parquet + entrada no checkpoint de
+    out/janelas/<origem>_<dt_inicio>_<status>/; uma janela que falha é
+    tentada `tentativas` vezes e, se ainda falhar, o erro sobe com o
+    checkpoint intacto — chamar de novo retoma da primeira janela que
+    falta. recomecar=True descarta o checkpoint; ao terminar ele é apagado
+    (manter=True o preserva). `conn` pode ser um PoolConexoes: cada
+    tentativa empresta de novo e o pool troca a conexão que caiu.
+    `progresso(linhas)` recebe as linhas (somas parciais) de todas as janelas.
+    """
+    log = log or (lambda msg: None)
+    base = _pasta(origem, dt_inicio, status_lista, pasta)
+    estado_path = os.path.join(base, "checkpoint.json")
+    if recomecar and os.path.isdir(base):
+        shutil.rmtree(base)
+    plano = janelas(dt_inicio, meses, hoje)
+    feitas = _carregar(estado_path, origem, dt_inicio, status_lista, meses, validade_h)
+    if not feitas and os.path.isdir(base):
+        shutil.rmtree(base)  # checkpoint de outro plano ou vencido: partes órfãs
+    os.makedirs(base, exist_ok=True)
+    estado = _ler_estado(estado_path) if feitas else None
+    if estado is not None:
+        estado["janelas"] = [j for j in estado["janelas"] if (j["inicio"], j["fim"]) in feitas]
+    else:
+        estado = {"origem": origem, "dt_inicio": dt_inicio, "status_lista": sorted(status_lista), "meses": meses,
+                  "criado": datetime.now().isoformat(timespec="seconds"), "janelas": []}
+        _gravar_estado(estado_path, estado)
+    reaproveitadas = [j for j in plano if j in feitas]
+    if reaproveitadas:
+        log(f"♻️ {origem.upper()}: retomando do checkpoint — {len(reaproveitadas)}/{len(plano)} janelas já gravadas")
+
+    partes, lidas = [], 0
+    for i, (ini, fim) in enumerate(plano):
+        rotulo = f"{origem.upper()} janela {i + 1}/{len(plano)} [{ini}, {fim or '…'})"
+        if (ini, fim) in feitas:
+            partes.append(pd.read_parquet(os.path.join(base, feitas[(ini, fim)]["arquivo"])))
+            lidas += len(partes[-1])
+            continue
+        if cancelamento:
+            cancelamento.verificar()
+        anteriores = lidas
+        t0 = time.perf_counter()
+        with medir(f"{origem}.janela", janela=[ini, fim]) as sp:
+            df = _consultar_janela(origem, conn, ini, status_lista, fim, tentativas, backoff_s, log,
+                                   (lambda n: progresso(anteriores + n)) if progresso else None, cancelamento)
+            sp.linhas = len(df)
+        arquivo = f"parte_{ini}_{fim or 'fim'}.parquet"
+        tmp = os.path.join(base, arquivo + ".tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, os.path.join(base, arquivo))
+        estado["janelas"].append({"inicio": ini, "fim": fim, "arquivo": arquivo, "linhas": int(len(df)),
+                                  "segundos": round(time.perf_counter() - t0, 3),
+                                  "concluida_em": datetime.now().isoformat(timespec="seconds")})
+        _gravar_estado(estado_path, estado)
+        partes.append(df)
+        lidas += len(df)
+        if progresso:
+            progresso(lidas)
+        log(f"⏱️ {rotulo}: {len(df)} notas em {time.perf_counter() - t0:.1f}s")
+
+    with medir(f"{origem}.reagregar", linhas=lidas):
+        df = reagregar(partes)
+    if not manter:
+        shutil.rmtree(base, ignore_errors=True)
+    return df
@@ -1,82 +1,765 @@
 # extracao_notas.py
 import os
+import re
+import math
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+import numpy as np
 import pandas as pd
 from decimal import Decimal, ROUND_HALF_UP
 
+from desempenho import medir
+
 SQL_DIR = os.path.join(os.path.dirname(__file__), "sql")
 METRICAS = ["vol","fat","fatliq","fatdol","fatbon","cc","cp","ci","cf","frete"]
 
+def _conexao(conn):
+    """Empresta do pool (pool_conexoes.PoolConexoes) ou usa a conexão recebida como está."""
+    return conn.emprestar() if hasattr(conn, "emprestar") else nullcontext(conn)
+
 def _ler_sql(nome_arquivo: str) -> str:
     path = os.path.join(SQL_DIR, nome_arquivo)
     with open(path, "r", encoding="utf-8") as f:
         return f.read()
 
-def extrair_aws(conn_pg, dt_inicio: str, status_lista):
+def _sql_aws(dt_inicio: str, status_lista, filtros=(), arquivo: str = "aws.sql"):
+    """
+    Monta SQL + parâmetros nomeados do Postgres. `filtros` é uma sequência
+    de (expressão, operador, valor) que entra no lugar de -- {{EXTRA_FILTER}};
+    operador "in" recebe uma lista de valores.
+    """
+    sql = _ler_sql(arquivo)
+    params = {"dt_inicio": dt_inicio, "status_lista": status_lista}
+    extra = ""
+    for i, (expr, op, valor) in enumerate(filtros):
+        expr = expr.replace("%", "%%")  # operador módulo com parâmetros do psycopg2
+        if op == "in":
+            extra += f" and {expr} = ANY(%(f{i})s)"
+            valor = list(valor)
+        else:
+            extra += f" and {expr} {op} %(f{i})s"
+        params[f"f{i}"] = valor
+    return sql.replace("-- {{EXTRA_FILTER}}", extra), params
+
+def _sql_fabric(dt_inicio: str, status_lista, filtros=(), arquivo: str = "fabric.sql"):
+    """Mesmo que _sql_aws, com parâmetros posicionais ('?') do Fabric."""
+    base_sql = _ler_sql(arquivo)
+    params = [dt_inicio]
+    status_clause = ""
+    if status_lista:
+        qmarks = ",".join(["?"] * len(status_lista))
+        status_clause = f" and status_pedido_id in ({qmarks})"
+        params.extend(status_lista)
+    extra = ""
+    for expr, op, valor in filtros:
+        if op == "in":
+            valor = list(valor)
+            extra += f" and {expr} in ({','.join(['?'] * len(valor))})"
+            params.extend(valor)
+        else:
+            extra += f" and {expr} {op} ?"
+            params.append(valor)
+    sql = base_sql.replace("-- {{STATUS_FILTER}}", status_clause)
+    return sql.replace("-- {{EXTRA_FILTER}}", extra), params
+
+# ---------- progresso e cancelamento ----------
+LOTE_PROGRESSO = 50_000  # linhas por fetchmany quando há progresso/cancelamento
+
+class ExtracaoCancelada(Exception):
+    """A extração foi interrompida por Cancelamento.cancelar()."""
+
+def _interromper(conn, cur):
+    # psycopg2: conn.cancel(); pyodbc: cursor.cancel(); sqlite3: conn.interrupt(); ADBC: cursor.adbc_cancel()
+    for alvo, metodo in ((cur, "cancel"), (cur, "adbc_cancel"), (conn, "cancel"), (conn, "interrupt")):
+        f = getattr(alvo, metodo, None)
+        if callable(f):
+            try:
+                f()
+                return
+            except Exception:
+                pass
+
+class Cancelamento:
+    """
+    Pedido de cancelamento compartilhado com as threads de extração.
+    cancelar() vale para as consultas em andamento (o driver interrompe a
+    consulta no servidor) e para as próximas (ExtracaoCancelada antes de
+    executar e entre os lotes lidos).
+    """
+    def __init__(self):
+        self._evento = threading.Event()
+        self._trava = threading.Lock()
+        self._ativas = []
+
+    @property
+    def cancelado(self) -> bool:
+        return self._evento.is_set()
+
+    def verificar(self):
+        if self._evento.is_set():
+            raise ExtracaoCancelada("extração cancelada pelo usuário")
+
+    def cancelar(self):
+        self._evento.set()
+        with self._trava:
+            ativas = list(self._ativas)
+        for conn, cur in ativas:
+            _interromper(conn, cur)
+
+    def reiniciar(self):
+        self._evento.clear()
+
+    @contextmanager
+    def consulta(self, conn, cur):
+        """Registra (conn, cur) como alvo de cancelar() enquanto o bloco roda."""
+        self.verificar()
+        item = (conn, cur)
+        with self._trava:
+            self._ativas.append(item)
+        try:
+            yield
+        except ExtracaoCancelada:
+            raise
+        except Exception as e:
+            if self._evento.is_set():  # o erro do driver é a própria interrupção
+                raise ExtracaoCancelada("extração cancelada pelo usuário") from e
+            raise
+        finally:
+            with self._trava:
+                self._ativas.remove(item)
+
+def _cancelavel(cancelamento, conn, cur):
+    return cancelamento.consulta(conn, cur) if cancelamento else nullcontext()
+
+def extrair_aws(conn_pg, dt_inicio: str, status_lista, copy: bool = False, log=None,
+                progresso=None, cancelamento: Cancelamento = None):
     """
     Lê sql/aws.sql (Postgres), com parâmetros:
       tempo_id >= %(dt_inicio)s
       status_pedido_id = ANY(%(status_lista)s)
+
+    Com `copy`, o resultado sai por COPY (...) TO STDOUT em CSV e é lido
+    em colunas pelo pyarrow, sem Decimal por valor. Se falhar, volta para o
+    cursor (avisando em `log`). `conn_pg` pode ser um PoolConexoes.
+
+    `progresso(linhas)` é chamado a cada lote lido; `cancelamento`
+    interrompe a consulta (ExtracaoCancelada).
     """
-    sql = _ler_sql("aws.sql")
-    df = pd.read_sql_query(sql, conn_pg, params={
-        "dt_inicio": dt_inicio,
-        "status_lista": status_lista
-    })
-    return _padronizar_cols(df)
+    sql, params = _sql_aws(dt_inicio, status_lista)
+    df = None
+    with _conexao(conn_pg) as conn_pg:
+        if copy:
+            try:
+                df = _ler_copy(conn_pg, sql, params, "aws", progresso, cancelamento)
+            except ExtracaoCancelada:
+                raise
+            except Exception as e:
+                try: conn_pg.rollback()
+                except Exception: pass
+                if log:
+                    log(f"⚠️ AWS COPY indisponível ({type(e).__name__}: {e}); usando o cursor")
+        if df is None:
+            df = _ler_consulta(conn_pg, sql, params, "aws", progresso, cancelamento)
+    with medir("aws.padronizar", linhas=len(df)):
+        return _padronizar_cols(df)
 
-def extrair_fabric(conn_fabric, dt_inicio: str, status_lista):
+def extrair_fabric(conn_fabric, dt_inicio: str, status_lista, arrow: bool = False, lote: int = None, log=None,
+                   progresso=None, cancelamento: Cancelamento = None):
     """
     Lê sql/fabric.sql (Fabric/SQL Server). O arquivo deve conter o comentário:
       -- {{STATUS_FILTER}}
     que será substituído por: and status_pedido_id in (?,?,...)
     O parâmetro da data é o primeiro '?'
+
+    Com `arrow`, as linhas chegam em lotes Arrow de até `lote` linhas direto
+    do driver (ADBC, se conn_fabric for uma conexão ADBC; senão arrow-odbc
+    com a string de conexão do .env), sem tupla Python por linha. Sem o
+    pacote/driver, ou se a leitura falhar, volta para o cursor DBAPI
+    (avisando em `log`). `conn_fabric` pode ser um PoolConexoes.
+    `progresso`/`cancelamento` como em extrair_aws.
     """
-    base_sql = _ler_sql("fabric.sql")
-    params = [dt_inicio]
-    status_clause = ""
-    if status_lista:
-        qmarks = ",".join(["?"] * len(status_lista))
-        status_clause = f" and status_pedido_id in ({qmarks})"
-        params.extend(status_lista)
-    sql = base_sql.replace("-- {{STATUS_FILTER}}", status_clause)
-    df = pd.read_sql(sql, conn_fabric, params=params)
+    sql, params = _sql_fabric(dt_inicio, status_lista)
+    df = None
+    with _conexao(conn_fabric) as conn_fabric:
+        if arrow:
+            try:
+                df = _ler_arrow(conn_fabric, sql, params, "fabric", lote or LOTE_ARROW, progresso, cancelamento)
+            except ExtracaoCancelada:
+                raise
+            except Exception as e:
+                if log:
+                    log(f"⚠️ FABRIC leitura Arrow indisponível ({type(e).__name__}: {e}); usando o cursor DBAPI")
+        if df is None:
+            df = _ler_consulta(conn_fabric, sql, params, "fabric", progresso, cancelamento)
+    with medir("fabric.padronizar", linhas=len(df)):
+        return _padronizar_cols(df)
+
+def _ler_consulta(conn, sql: str, params, origem: str, progresso=None,
+                  cancelamento: Cancelamento = None) -> pd.DataFrame:
+    """
+    O mesmo que pd.read_sql sobre uma conexão DBAPI (execute → fetchall →
+    from_records com coerce_float), em três passos para que consulta no
+    banco, transferência das linhas e montagem do DataFrame sejam medidos
+    separadamente. Com progresso/cancelamento, lê em fetchmany de
+    LOTE_PROGRESSO linhas.
+    """
+    cur = conn.cursor()
+    try:
+        with _cancelavel(cancelamento, conn, cur):
+            with medir(f"{origem}.consulta"):
+                cur.execute(sql, params)
+            cols = [d[0] for d in cur.description]
+            with medir(f"{origem}.leitura") as sp:
+                if progresso is None and cancelamento is None:
+                    rows = cur.fetchall()
+                else:
+                    rows = []
+                    while lote := cur.fetchmany(LOTE_PROGRESSO):
+                        rows.extend(lote)
+                        if cancelamento:
+                            cancelamento.verificar()
+                        if progresso:
+                            progresso(len(rows))
+                sp.linhas = len(rows)
+    except Exception:
+        try: conn.rollback()
+        except Exception: pass
+        raise
+    finally:
+        cur.close()
+    with medir(f"{origem}.dataframe", linhas=len(rows)) as sp:
+        df = pd.DataFrame.from_records([tuple(r) for r in rows], columns=cols, coerce_float=True)
+        if sp:
+            sp.bytes = int(df.memory_usage(deep=True).sum())
+    return df
+
+# ---------- leitura colunar (Arrow) ----------
+LOTE_ARROW = 100_000
+# opção de tamanho de lote de cada driver ADBC (driver_name de adbc_get_info)
+_LOTE_ADBC = {"ADBC SQLite Driver": "adbc.sqlite.query.batch_rows"}
+
+def _lotes_adbc(conn, sql: str, params, tamanho: int, cancelamento: Cancelamento = None):
+    cur = conn.cursor()
+    try:
+        with _cancelavel(cancelamento, conn, cur):
+            opcao = _LOTE_ADBC.get(conn.adbc_get_info().get("driver_name"))
+            if opcao:
+                cur.adbc_statement.set_options(**{opcao: str(tamanho)})
+            cur.execute(sql, list(params))
+            yield from cur.fetch_record_batch()
+    finally:
+        cur.close()
+
+def _lotes_arrow_odbc(sql: str, params, tamanho: int):
+    from arrow_odbc import read_arrow_batches_from_odbc
+    from conexoes import string_conexao_fabric
+    # arrow-odbc abre a própria conexão e só liga parâmetros texto; o SQL Server converte
+    yield from read_arrow_batches_from_odbc(
+        query=sql, connection_string=string_conexao_fabric(), batch_size=tamanho,
+        parameters=[None if p is None else str(p) for p in params],
+    )
+
+def _decimal_para_float(coluna) -> np.ndarray:
+    """
+    decimal128 → float64 igual a float(Decimal) (o que o cursor DBAPI entrega):
+    inteiro sem escala / 10**escala é exato quando o inteiro cabe em 2**53;
+    só o resto passa por Decimal.
+    """
+    coluna = coluna.combine_chunks() if hasattr(coluna, "combine_chunks") else coluna
+    n, escala = len(coluna), coluna.type.scale
+    palavras = np.frombuffer(coluna.buffers()[1], dtype=np.int64)[2 * coluna.offset: 2 * (coluna.offset + n)]
+    baixo, alto = palavras[0::2], palavras[1::2]
+    inteiro = (alto == (baixo >> 63)) & (np.abs(baixo) < 2**53)
+    res = baixo.astype(np.float64)
+    if 0 <= escala <= 22:
+        res /= 10.0 ** escala
+    else:
+        inteiro[:] = False
+    if not inteiro.all():
+        for i in np.flatnonzero(~inteiro):
+            v = coluna[int(i)].as_py()
+            res[i] = float(v) if v is not None else np.nan
+    if coluna.null_count:
+        res[np.asarray(coluna.is_null())] = np.nan
+    return res
+
+def _coluna_pandas(coluna):
+    import pyarrow as pa
+    tipo = coluna.type
+    if pa.types.is_decimal(tipo):
+        return _decimal_para_float(coluna)
+    if pa.types.is_integer(tipo):
+        valores = coluna.fill_null(0).to_numpy().astype(np.int64, copy=False)
+        return pd.arrays.IntegerArray(valores, np.asarray(coluna.is_null()))
+    if pa.types.is_floating(tipo):
+        return coluna.to_numpy().astype(np.float64, copy=False)
+    return coluna.to_pandas()
+
+def _ler_arrow(conn, sql: str, params, origem: str, tamanho: int = LOTE_ARROW, progresso=None,
+               cancelamento: Cancelamento = None) -> pd.DataFrame:
+    """
+    Como _ler_consulta, mas lendo lotes Arrow do driver; decimais viram
+    float64 como no cursor e inteiros viram Int64 — a saída de
+    _padronizar_cols é a mesma. O arrow-odbc não expõe cancelamento da
+    consulta: ali o cancelamento vale entre os lotes.
+    """
+    import pyarrow as pa
+
+    if cancelamento:
+        cancelamento.verificar()
+    if hasattr(conn, "adbc_get_info"):
+        lotes = _lotes_adbc(conn, sql, params, tamanho, cancelamento)
+    else:
+        lotes = _lotes_arrow_odbc(sql, params, tamanho)
+    with medir(f"{origem}.consulta"):
+        primeiro = next(lotes, None)  # a consulta roda até o primeiro lote
+    with medir(f"{origem}.leitura") as sp:
+        partes = [primeiro] if primeiro is not None else []
+        linhas = len(primeiro) if primeiro is not None else 0
+        for lote in lotes:
+            partes.append(lote)
+            linhas += len(lote)
+            if cancelamento:
+                cancelamento.verificar()
+            if progresso:
+                progresso(linhas)
+        if not partes:
+            return pd.DataFrame(columns=["nota_fiscal_id"] + METRICAS)
+        tabela = pa.Table.from_batches(partes)
+        sp.linhas = tabela.num_rows
+        sp.bytes = tabela.nbytes
+    with medir(f"{origem}.dataframe", linhas=tabela.num_rows):
+        return pd.DataFrame({nome: _coluna_pandas(tabela.column(nome)) for nome in tabela.column_names}, copy=False)
+
+# ---------- COPY (Postgres) ----------
+COPY_MEMORIA = 256 * 2**20  # acima disso o CSV do COPY vai para um arquivo temporário
+
+def _ler_copy(conn, sql: str, params, origem: str, progresso=None,
+              cancelamento: Cancelamento = None) -> pd.DataFrame:
+    """
+    Como _ler_consulta, mas com COPY (consulta) TO STDOUT (CSV) via
+    copy_expert. Os parâmetros entram pelo cur.mogrify — o mesmo escape do
+    execute. O Postgres escreve numeric em texto exato e o leitor CSV do
+    pyarrow converte com arredondamento correto, então o float64 é o mesmo
+    de float(Decimal) no cursor. O COPY não tem lotes: o progresso só chega
+    no fim.
+    """
+    import tempfile
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    cur = conn.cursor()
+    try:
+        consulta = cur.mogrify(sql.strip().rstrip(";"), params)
+        if isinstance(consulta, bytes):
+            consulta = consulta.decode("utf-8")
+        with tempfile.SpooledTemporaryFile(max_size=COPY_MEMORIA) as buf:
+            with _cancelavel(cancelamento, conn, cur), medir(f"{origem}.copy") as sp:
+                cur.copy_expert(f"COPY ({consulta}) TO STDOUT WITH (FORMAT csv, HEADER true)", buf)
+                sp.bytes = buf.tell()
+            buf.seek(0)
+            with medir(f"{origem}.leitura") as sp:
+                tipos = {"nota_fiscal_id": pa.int64(), **{c: pa.float64() for c in METRICAS}}
+                tabela = pacsv.read_csv(buf, convert_options=pacsv.ConvertOptions(column_types=tipos))
+                sp.linhas = tabela.num_rows
+    finally:
+        cur.close()
+    if progresso:
+        progresso(tabela.num_rows)
+    with medir(f"{origem}.dataframe", linhas=tabela.num_rows):
+        return pd.DataFrame({nome: _coluna_pandas(tabela.column(nome)) for nome in tabela.column_names}, copy=False)
+
+# ---------- extração em lotes (streaming) ----------
+LOTE_PADRAO = 50_000
+
+def _lotes_cursor(cur, tamanho: int, progresso=None, cancelamento: Cancelamento = None):
+    cols = [d[0] for d in cur.description]
+    linhas = 0
+    while True:
+        if cancelamento:
+            cancelamento.verificar()
+        rows = cur.fetchmany(tamanho)
+        if not rows:
+            break
+        linhas += len(rows)
+        if progresso:
+            progresso(linhas)
+        df = pd.DataFrame.from_records([tuple(r) for r in rows], columns=cols, coerce_float=True)
+        yield _padronizar_cols(df)
+
+def extrair_aws_lotes(conn_pg, dt_inicio: str, status_lista, tamanho: int = LOTE_PADRAO, progresso=None,
+                      cancelamento: Cancelamento = None):
+    """
+    Igual a extrair_aws, mas gera DataFrames de até `tamanho` linhas lidos
+    de um cursor nomeado (server-side) — o resultado nunca fica inteiro
+    na memória do cliente.
+    """
+    sql, params = _sql_aws(dt_inicio, status_lista)
+    with _conexao(conn_pg) as conn_pg:
+        cur = conn_pg.cursor(name=f"nf_aws_{uuid.uuid4().hex}")
+        cur.itersize = tamanho
+        try:
+            with _cancelavel(cancelamento, conn_pg, cur):
+                cur.execute(sql, params)
+                yield from _lotes_cursor(cur, tamanho, progresso, cancelamento)
+        finally:
+            cur.close()
+            conn_pg.rollback()  # encerra a transação aberta pelo cursor nomeado
+
+def extrair_fabric_lotes(conn_fabric, dt_inicio: str, status_lista, tamanho: int = LOTE_PADRAO, progresso=None,
+                         cancelamento: Cancelamento = None):
+    """Igual a extrair_fabric, mas gera DataFrames via fetchmany(tamanho)."""
+    sql, params = _sql_fabric(dt_inicio, status_lista)
+    with _conexao(conn_fabric) as conn_fabric:
+        cur = conn_fabric.cursor()
+        try:
+            with _cancelavel(cancelamento, conn_fabric, cur):
+                cur.execute(sql, params)
+                yield from _lotes_cursor(cur, tamanho, progresso, cancelamento)
+        finally:
+            cur.close()
+
+def _schema_arrow():
+    import pyarrow as pa
+    return pa.schema([("nota_fiscal_id", pa.int64())] + [(c, pa.float64()) for c in METRICAS])
+
+def gravar_lotes(lotes, parquet_path: str, csv_path: str = None, casas: int = 4, arrow_path: str = None) -> int:
+    """
+    Normaliza cada lote e o anexa ao Parquet (um row group por lote) e,
+    opcionalmente, ao CSV (sep=';') e a um arquivo Arrow IPC sem compressão.
+    Retorna o total de linhas gravadas.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _schema_arrow()
+    total = 0
+    ipc = pa.ipc.new_file(arrow_path, schema) if arrow_path else None
+    sp = medir("gravar_lotes")
+    try:
+        with sp, pq.ParquetWriter(parquet_path, schema) as writer:
+            for lote in lotes:
+                lote = normalizar_numericos(lote, casas=casas)
+                tabela = pa.Table.from_pandas(lote, schema=schema, preserve_index=False)
+                writer.write_table(tabela)
+                if ipc:
+                    ipc.write_table(tabela)
+                if csv_path:
+                    lote.to_csv(csv_path, index=False, sep=";", mode="a" if total else "w", header=not total)
+                total += len(lote)
+                sp.linhas = total
+    finally:
+        if ipc:
+            ipc.close()
+    if csv_path and not total:
+        pd.DataFrame(columns=schema.names).to_csv(csv_path, index=False, sep=";")
+    return total
+
+# ---------- persistência em out/ ----------
+def caminhos_saida(prefix: str, dt_inicio: str, pasta: str = "out"):
+    """(csv, parquet, arrow) com timestamp para um novo extrato de `prefix`."""
+    os.makedirs(pasta, exist_ok=True)
+    ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    base = f"{pasta}/{prefix}_notas_{dt_inicio}_{ts}"
+    return f"{base}.csv", f"{base}.parquet", f"{base}.arrow"
+
+def salvar_extrato(df: pd.DataFrame, csv: str, pq: str, arq: str) -> bool:
+    """Grava CSV (sep=';'), Parquet e Arrow IPC; False se Parquet/Arrow não puderam ser salvos."""
+    with medir("salvar.csv", linhas=len(df)) as sp:
+        df.to_csv(csv, index=False, sep=";")
+        if sp: sp.bytes = os.path.getsize(csv)
+    try:
+        with medir("salvar.parquet", linhas=len(df)) as sp:
+            df.to_parquet(pq, index=False)
+            if sp: sp.bytes = os.path.getsize(pq)
+        # Arrow IPC sem compressão: o app.py abre via memory map, sem parsing
+        with medir("salvar.arrow", linhas=len(df)) as sp:
+            df.reset_index(drop=True).to_feather(arq, compression="uncompressed")
+            if sp: sp.bytes = os.path.getsize(arq)
+        return True
+    except Exception:
+        return False
+
+# ---------- consultas genéricas sobre os templates de sql/ ----------
+_SQL = {"aws": _sql_aws, "fabric": _sql_fabric}
+
+def consultar(origem: str, conn, dt_inicio: str, status_lista, filtros=(), arquivo: str = None,
+              substituir: dict = None, sem_having: bool = False, progresso=None,
+              cancelamento: Cancelamento = None) -> pd.DataFrame:
+    """
+    Executa sql/<arquivo> (default <origem>.sql) de `origem` ("aws"/"fabric")
+    com os mesmos parâmetros de data/status, os `filtros` extras de
+    _sql_aws/_sql_fabric e substituições literais ({{CHAVE}} -> valor).
+    Devolve o DataFrame cru, sem padronizar.
+    """
+    sql, params = _SQL[origem](dt_inicio, status_lista, filtros, arquivo=arquivo or f"{origem}.sql")
+    for chave, valor in (substituir or {}).items():
+        sql = sql.replace("{{" + chave + "}}", str(valor))
+    if sem_having:
+        sql = _sem_having(sql)
+    with _conexao(conn) as conn:
+        return _ler_consulta(conn, sql, params, origem, progresso, cancelamento)
+
+def extrair(origem: str, conn, dt_inicio: str, status_lista, filtros=()) -> pd.DataFrame:
+    """extrair_aws/extrair_fabric com filtros extras (ver _sql_aws)."""
+    return _padronizar_cols(consultar(origem, conn, dt_inicio, status_lista, filtros))
+
+# ---------- extração particionada (faixas de nota_fiscal_id) ----------
+
+def faixas_ids(id_min, id_max, particoes: int):
+    """Divide [id_min, id_max] em até `particoes` faixas [ini, fim) contíguas."""
+    if id_min is None or id_max is None or pd.isna(id_min) or pd.isna(id_max):
+        return []
+    id_min, id_max = int(id_min), int(id_max)
+    passo = max(1, -(-(id_max - id_min + 1) // max(1, particoes)))
+    return [(ini, min(ini + passo, id_max + 1)) for ini in range(id_min, id_max + 1, passo)]
+
+def extrair_particionado(origem: str, conectar, dt_inicio: str, status_lista,
+                         particoes: int = 4, conexoes: int = 2, log=None, progresso=None,
+                         cancelamento: Cancelamento = None) -> pd.DataFrame:
+    """
+    Extrai `origem` ("aws" ou "fabric") em `particoes` faixas de nota_fiscal_id,
+    executadas em paralelo sobre até `conexoes` conexões abertas com
+    `conectar()` — ou emprestadas de `conectar`, se for um PoolConexoes. As
+    partes são concatenadas na ordem das faixas, então o resultado é o
+    mesmo de extrair_aws/extrair_fabric. `progresso` recebe a soma das
+    linhas lidas em todas as partições.
+    """
+    log = log or (lambda msg: None)
+    local = threading.local()
+    abertas = []
+    trava = threading.Lock()
+    lidas = {}
+
+    def _progresso(i):
+        if progresso is None:
+            return None
+        def _parcial(linhas):
+            with trava:
+                lidas[i] = linhas
+                total = sum(lidas.values())
+            progresso(total)
+        return _parcial
+
+    def _conn():
+        if hasattr(conectar, "emprestar"):
+            return conectar  # consultar() empresta uma conexão por partição
+        if not hasattr(local, "conn"):
+            local.conn = conectar()
+            with trava:
+                abertas.append(local.conn)
+        return local.conn
+
+    def _parte(i, ini, fim):
+        t0 = time.perf_counter()
+        with medir(f"{origem}.particao", particao=i + 1, faixa=[ini, fim]) as sp:
+            df = consultar(origem, _conn(), dt_inicio, status_lista,
+                           [("nota_fiscal_id", ">=", ini), ("nota_fiscal_id", "<", fim)],
+                           progresso=_progresso(i), cancelamento=cancelamento)
+            sp.linhas = len(df)
+        log(f"⏱️ {origem.upper()} partição {i + 1}/{len(faixas)} [{ini}, {fim}): "
+            f"{len(df)} linhas em {time.perf_counter() - t0:.1f}s")
+        return df
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, conexoes)) as pool:
+            limites = pool.submit(lambda: consultar(origem, _conn(), dt_inicio, status_lista,
+                                                    arquivo=f"{origem}_limites.sql",
+                                                    cancelamento=cancelamento)).result()
+            faixas = faixas_ids(limites.iloc[0, 0], limites.iloc[0, 1], particoes)
+            partes = list(pool.map(lambda a: _parte(*a), [(i, ini, fim) for i, (ini, fim) in enumerate(faixas)]))
+    finally:
+        for conn in abertas:
+            try: conn.close()
+            except Exception: pass
+    if not partes:
+        return _padronizar_cols(pd.DataFrame(columns=["nota_fiscal_id"] + METRICAS))
+    return _padronizar_cols(pd.concat(partes, ignore_index=True))
+
+# ---------- extração por janelas de tempo_id ----------
+def _sem_having(sql: str) -> str:
+    return re.sub(r"(?im)^\s*having\b.*$", "", sql)
+
+def extrair_parcial(origem: str, conn, dt_inicio: str, status_lista, dt_fim: str = None,
+                    progresso=None, cancelamento: Cancelamento = None) -> pd.DataFrame:
+    """
+    Somas por nota apenas das linhas com dt_inicio <= tempo_id < dt_fim (sem
+    limite superior se dt_fim=None), SEM o HAVING e sem normalizar: são somas
+    parciais, que só viram o resultado final depois de reagregar().
+    """
+    filtros = [("tempo_id", "<", dt_fim)] if dt_fim else []
+    return _padronizar_cols(consultar(origem, conn, dt_inicio, status_lista, filtros, sem_having=True,
+                                      progresso=progresso, cancelamento=cancelamento))
+
+def reagregar(partes, aplicar_having: bool = True) -> pd.DataFrame:
+    """
+    Soma por nota_fiscal_id as somas parciais de várias janelas e aplica o
+    HAVING sum(vol) <> 0 do SQL original (aplicar_having=False mantém o
+    resultado parcial). Notas que atravessam janelas terminam com o mesmo
+    total da consulta única.
+    """
+    partes = [p for p in partes if p is not None and len(p)]
+    if not partes:
+        return _padronizar_cols(pd.DataFrame(columns=["nota_fiscal_id"] + METRICAS))
+    df = pd.concat(partes, ignore_index=True)
+    df = df[df["nota_fiscal_id"].notna()]  # como o groupby: nota nula não entra
+    repetidas = df["nota_fiscal_id"].duplicated(keep=False).to_numpy()
+    if repetidas.any():
+        df = pd.concat([df[~repetidas], _somar_exato(df[repetidas])], ignore_index=True)
+    if aplicar_having:
+        df = df[df["vol"].notna() & (df["vol"] != 0)]
     return _padronizar_cols(df)
 
+_CASAS_SOMA = 9
+
+def _somar_coluna(valores: np.ndarray, nulos: np.ndarray, inicios: np.ndarray) -> np.ndarray:
+    # valores = m / 10^s com m inteiro (numeric do banco): soma exata em m, float só na divisão final
+    for casas in range(_CASAS_SOMA + 1):
+        m = np.where(nulos, 0.0, np.rint(valores * 10.0 ** casas))
+        if (nulos | (m / 10.0 ** casas == valores)).all() and np.abs(m).sum() < 2.0 ** 53:
+            return np.add.reduceat(m, inicios) / 10.0 ** casas
+    dec = np.array([Decimal(0) if n else Decimal(str(x)) for x, n in zip(valores.tolist(), nulos)], dtype=object)
+    return np.add.reduceat(dec, inicios).astype("float64")
+
+def _somar_exato(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Soma por nota as somas parciais em decimal exato, como o numeric do
+    banco, e converte para float só no fim: somadas em float, as parciais
+    podem ficar a 1 ulp do total da consulta única e virar a 4ª casa de um
+    valor no meio (…5). Em inteiros escalados quando os valores têm até
+    _CASAS_SOMA casas; senão em Decimal(str(x)). NaN fica de fora; nota só
+    com NaN continua NaN, como o sum() do banco.
+    """
+    df = df.sort_values("nota_fiscal_id", kind="stable")
+    ids = df["nota_fiscal_id"].to_numpy()
+    inicios = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    res = {"nota_fiscal_id": ids[inicios]}
+    for c in METRICAS:
+        if c not in df.columns:
+            continue
+        valores = pd.to_numeric(df[c], errors="coerce").to_numpy(dtype="float64")
+        nulos = np.isnan(valores)
+        somas = _somar_coluna(valores, nulos, inicios)
+        somas[np.add.reduceat(~nulos, inicios) == 0] = np.nan
+        res[c] = somas
+    return pd.DataFrame(res)
+
+_RENOMEAR = {
+    "volume_fisico_realizado":"vol",
+    "faturamento_bruto_realizado":"fat",
+    "faturamento_liquido_realizado":"fatliq",
+    "faturamento_dolar":"fatdol",
+    "faturamento_bruto_bonificado":"fatbon",
+    "custo_comercializacao":"cc",
+    "custo_producao_realizado":"cp",
+    "custo_materiais_realizado":"ci",
+    "custo_financeiro":"cf",
+    "valor_frete":"frete",
+}
+
+def _ids_int64(serie: pd.Series):
+    """nota_fiscal_id como Int64 (int64 + máscara de nulos), sem converter se já for."""
+    if serie.dtype == "Int64":
+        return serie.array
+    return pd.to_numeric(serie, errors="coerce").astype("Int64").array
+
+def _montar_ordenado(colunas: dict) -> pd.DataFrame:
+    """
+    DataFrame com as colunas (arrays já novos) sem copiá-las de novo, ordenado
+    por nota_fiscal_id e com índice 0..n-1. Como o SQL já traz order by, a
+    ordenação (única cópia inteira) só acontece se as notas vierem fora de ordem.
+    """
+    df = pd.DataFrame(colunas, copy=False)
+    if not df["nota_fiscal_id"].is_monotonic_increasing:
+        df = df.sort_values("nota_fiscal_id")
+    df.index = pd.RangeIndex(len(df))
+    return df
+
 def _padronizar_cols(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    renames = {
-        "volume_fisico_realizado":"vol",
-        "faturamento_bruto_realizado":"fat",
-        "faturamento_liquido_realizado":"fatliq",
-        "faturamento_dolar":"fatdol",
-        "faturamento_bruto_bonificado":"fatbon",
-        "custo_comercializacao":"cc",
-        "custo_producao_realizado":"cp",
-        "custo_materiais_realizado":"ci",
-        "custo_financeiro":"cf",
-        "valor_frete":"frete",
-    }
-    for k,v in renames.items():
-        if k in df.columns and v not in df.columns:
-            df = df.rename(columns={k:v})
-    if "nota_fiscal_id" in df.columns:
-        df["nota_fiscal_id"] = pd.to_numeric(df["nota_fiscal_id"], errors="coerce").astype("Int64")
+    origem = {c: c for c in df.columns}
+    for k, v in _RENOMEAR.items():
+        if k in df.columns and v not in origem:
+            origem[v] = k
+    colunas = {"nota_fiscal_id": _ids_int64(df[origem["nota_fiscal_id"]])}
+    for c in METRICAS:
+        if c in origem:
+            # float64 sempre: resultado vazio (ou só inteiros) não vira int64/object conforme o leitor
+            colunas[c] = pd.to_numeric(df[origem[c]], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    return _montar_ordenado(colunas)
+
+def escalar_inteiros(valores, casas: int = 4) -> np.ndarray:
+    """
+    Converte valores para inteiros escalados (valor × 10^casas) em int64,
+    com arredondamento ROUND_HALF_UP idêntico ao de
+    Decimal(str(x)).quantize(...). NaN vira 0; |valor| × 10^casas deve
+    caber em int64 (OverflowError caso contrário).
+
+    O caminho vetorizado resolve quase todos os valores; apenas os que ficam
+    a um erro de ponto flutuante do meio (…5 exato) caem no Decimal.
+    """
+    # operações in-place: com 5M linhas cada temporário float64 custa 40 MB
+    x = np.array(pd.to_numeric(pd.Series(valores), errors="coerce"), dtype="float64")
+    x[np.isnan(x)] = 0.0
+    y = np.abs(x)
+    y *= 10.0 ** casas
+    base = np.floor(y)
+    frac = y - base
+    # erro relativo de str(x) -> float e da multiplicação: ~2 ulp de y
+    y *= 1e-15
+    ambiguo = np.abs(frac - 0.5) <= y
+    ambiguo |= base >= 2.0 ** 52
+    base += frac >= 0.5
+    del y, frac
+    np.copysign(base, x, out=base)
+    base[ambiguo] = 0.0
+    res = base.astype(np.int64)
+    if ambiguo.any():
+        quant = Decimal(1).scaleb(-casas)
+        for i in np.flatnonzero(ambiguo):
+            d = Decimal(str(x[i])).quantize(quant, rounding=ROUND_HALF_UP)
+            res[i] = int(d.scaleb(casas))
+    return res
+
+def limite_escalado(atol: float, casas: int = 4) -> int:
+    """
+    Tolerância na escala inteira: para d inteiro, |d| > atol × 10^casas
+    equivale a |d| > limite_escalado(atol, casas).
+    """
+    return math.floor(Decimal(str(atol)).scaleb(casas))
+
+def escalar_metricas(df: pd.DataFrame, casas: int = 4) -> pd.DataFrame:
+    """
+    Igual a normalizar_numericos, mas mantém as métricas como int64
+    escalados (valor × 10^casas), próprios para comparação exata.
+    """
+    df = df.copy(deep=False)  # as colunas trocadas são novas; as demais são compartilhadas
     for c in METRICAS:
         if c in df.columns:
-            df[c] = pd.to_numeric(df[c], errors="coerce")
-    cols = ["nota_fiscal_id"] + [c for c in METRICAS if c in df.columns]
-    return df[cols].sort_values("nota_fiscal_id").reset_index(drop=True)
+            df[c] = escalar_inteiros(df[c], casas)
+    return df
 
 def normalizar_numericos(df: pd.DataFrame, casas: int = 4) -> pd.DataFrame:
     """
-    Normaliza números para mesma escala (default 4 casas) com Decimal
-    para evitar diferenças de ponto flutuante entre bancos.
+    Normaliza números para mesma escala (default 4 casas) com ROUND_HALF_UP
+    exato (mesmo resultado do Decimal) para evitar diferenças de ponto
+    flutuante entre bancos.
     """
-    df = df.copy()
-    quant = Decimal("1") if casas == 0 else Decimal("0." + "0"*casas)
+    df = df.copy(deep=False)  # as colunas trocadas são novas; as demais são compartilhadas
     for c in METRICAS:
         if c in df.columns:
-            df[c] = df[c].apply(
-                lambda x: float(Decimal(str(x if pd.notna(x) else 0)).quantize(quant, rounding=ROUND_HALF_UP))
-            )
+            df[c] = desescalar(escalar_inteiros(df[c], casas), casas)
     return df
+
+def desescalar(inteiros, casas: int = 4) -> np.ndarray:
+    """Volta de int64 escalado para float (mesmo valor que float(Decimal))."""
+    inteiros = np.asarray(inteiros, dtype=np.int64)
+    out = inteiros.astype(np.float64)
+    out /= 10.0 ** casas
+    # acima de 2^53 o int não cabe exato no float: divide via Decimal
+    for i in np.flatnonzero(np.abs(inteiros) > 2 ** 53):
+        out[i] = float(Decimal(int(inteiros[i])).scaleb(-casas))
+    return out
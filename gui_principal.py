@@ -3,221 +3,435 @@ import os
 import re
 import sys
 import time
+import queue
 import threading
 import subprocess
 import webbrowser
-from datetime import datetime
 import tkinter as tk
 from tkinter import messagebox
 
-import psycopg2
-import pyodbc
 import pandas as pd
 from dotenv import load_dotenv
 
-from extracao_notas import extrair_aws, extrair_fabric, normalizar_numericos
+from extracao_notas import (
+    extrair_aws, extrair_fabric, normalizar_numericos,
+    extrair_aws_lotes, extrair_fabric_lotes, gravar_lotes, extrair_particionado,
+    caminhos_saida, Cancelamento, ExtracaoCancelada,
+)
+from incremental import atualizar_snapshot, verificar_snapshot
+from extracao_janelas import extrair_janelas
+from amostragem import pre_checar
+from conexoes import nova_conexao_pg, nova_conexao_fabric
+from pool_conexoes import PoolConexoes
+import manifesto
+from cache_consultas import extrair_com_cache
+from desempenho import configurar as configurar_desempenho, assinar, formatar, medir
 
 load_dotenv()
 
-conn_pg = None
-conn_fabric = None
+pool_pg = None
+pool_fabric = None
 streamlit_proc = None
 
-# ---------- helpers ----------
-def log(msg: str):
-    log_text.configure(state=tk.NORMAL)
-    log_text.insert(tk.END, msg.rstrip() + "\n")
-    log_text.see(tk.END)
-    log_text.configure(state=tk.DISABLED)
+# streaming: lê em lotes (cursor server-side / fetchmany) direto para o Parquet
+EXTRACAO_STREAMING = os.getenv("EXTRACAO_STREAMING", "0") == "1"
+EXTRACAO_LOTE = int(os.getenv("EXTRACAO_LOTE", "50000"))
+# particionamento: N faixas de nota_fiscal_id sobre um pool pequeno de conexões por origem
+EXTRACAO_PARTICOES = int(os.getenv("EXTRACAO_PARTICOES", "1"))
+EXTRACAO_CONEXOES = int(os.getenv("EXTRACAO_CONEXOES", "2"))
+# incremental: só a janela recente (dias) é consultada; o histórico fica em out/snapshot
+EXTRACAO_INCREMENTAL = os.getenv("EXTRACAO_INCREMENTAL", "0") == "1"
+EXTRACAO_JANELA_DIAS = int(os.getenv("EXTRACAO_JANELA_DIAS", "7"))
+# retomável: janelas de N meses de tempo_id, cada uma gravada com checkpoint em out/janelas (0 = desligado)
+EXTRACAO_JANELAS_MESES = int(os.getenv("EXTRACAO_JANELAS_MESES", "0"))
+# AWS via COPY ... TO STDOUT (CSV lido em colunas pelo pyarrow); se falhar volta ao cursor
+AWS_COPY = os.getenv("AWS_COPY", "0") == "1"
+# Fabric em lotes Arrow (arrow-odbc/ADBC) em vez de tuplas do pyodbc; sem o pacote volta ao pyodbc
+FABRIC_ARROW = os.getenv("FABRIC_ARROW", "0") == "1"
+FABRIC_ARROW_LOTE = int(os.getenv("FABRIC_ARROW_LOTE", "100000"))
+# pool por origem: cada extração/ping empresta uma conexão exclusiva; ociosas são validadas e mantidas vivas
+POOL_MIN = int(os.getenv("POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("POOL_MAX", str(max(2, EXTRACAO_CONEXOES))))
+POOL_VALIDAR_APOS_S = float(os.getenv("POOL_VALIDAR_APOS_S", "30"))
+POOL_KEEPALIVE_S = float(os.getenv("POOL_KEEPALIVE_S", "120"))
+POOL_TENTATIVAS = int(os.getenv("POOL_TENTATIVAS", "3"))
+# cache de consultas: mesma origem/SQL/dt_inicio/status dentro do TTL é lida de out/cache
+CACHE_CONSULTAS = os.getenv("CACHE_CONSULTAS", "1") == "1"
+CACHE_TTL_MIN = float(os.getenv("CACHE_TTL_MIN", "30"))
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", "2048"))
+# desempenho: spans por etapa no log e em out/desempenho.jsonl (desligado não custa nada)
+DESEMPENHO = os.getenv("DESEMPENHO", "0") == "1"
+DESEMPENHO_MEMORIA = os.getenv("DESEMPENHO_MEMORIA", "1") == "1"
+configurar_desempenho(DESEMPENHO, memoria=DESEMPENHO_MEMORIA, arquivo="out/desempenho.jsonl")
+# pré-checagem: fração das notas (mesmo hash de nota_fiscal_id nos dois lados) comparada antes da extração completa
+AMOSTRA_TAXA = float(os.getenv("AMOSTRA_TAXA", "0.01"))
+# caixa de log: linhas mantidas (as mais antigas saem) e intervalo de atualização da tela
+LOG_MAX_LINHAS = int(os.getenv("LOG_MAX_LINHAS", "5000"))
+LOG_INTERVALO_MS = 100
+
+# ---------- fila da UI ----------
+# Só a thread do Tk mexe nos widgets: as outras threads (extrações,
+# conexões, leitor do stdout do Streamlit) enfileiram linhas de log e
+# chamadas, e _drenar_ui aplica tudo em lote a cada LOG_INTERVALO_MS.
+_fila_ui = queue.SimpleQueue()
+cancelamento = Cancelamento()
 
-def safe_disable(w): 
-    try: w.config(state=tk.DISABLED)
+def log(msg: str):
+    _fila_ui.put(msg.rstrip() + "\n")
+
+def na_ui(func, *args, **kwargs):
+    """Executa func(*args, **kwargs) na thread do Tk, na ordem dos logs."""
+    _fila_ui.put(lambda: func(*args, **kwargs))
+
+def _drenar_ui():
+    texto = []
+
+    def _escrever():
+        if not texto:
+            return
+        log_text.configure(state=tk.NORMAL)
+        log_text.insert(tk.END, "".join(texto))
+        excesso = int(log_text.index("end-1c").split(".")[0]) - 1 - LOG_MAX_LINHAS
+        if excesso > 0:
+            log_text.delete("1.0", f"{excesso + 1}.0")
+        log_text.see(tk.END)
+        log_text.configure(state=tk.DISABLED)
+        texto.clear()
+
+    for _ in range(10_000):  # teto por ciclo: a janela continua respondendo sob rajadas
+        try:
+            item = _fila_ui.get_nowait()
+        except queue.Empty:
+            break
+        if callable(item):
+            _escrever()
+            try: item()
+            except tk.TclError: pass
+        else:
+            texto.append(item)
+    _escrever()
+    root.after(LOG_INTERVALO_MS, _drenar_ui)
+
+def _estado(w, estado):
+    try: w.config(state=estado)
     except: pass
 
-def safe_enable(w): 
-    try: w.config(state=tk.NORMAL)
-    except: pass
+def safe_disable(w): na_ui(_estado, w, tk.DISABLED)
 
-def require_env(key: str) -> str:
-    val = os.getenv(key)
-    if not val:
-        raise RuntimeError(f"Variável de ambiente '{key}' ausente no .env")
-    return val
+def safe_enable(w): na_ui(_estado, w, tk.NORMAL)
 
 def parse_status(s: str):
     return [int(x.strip()) for x in s.split(",") if x.strip()]
 
+if DESEMPENHO:
+    assinar(lambda registro: log(formatar(registro)))
+
 # ---------- conexões ----------
 def conectar_postgres_async(): threading.Thread(target=conectar_postgres, daemon=True).start()
 def conectar_fabric_async():   threading.Thread(target=conectar_fabric,  daemon=True).start()
 def ping_postgres_async():     threading.Thread(target=ping_postgres,    daemon=True).start()
 def ping_fabric_async():       threading.Thread(target=ping_fabric,      daemon=True).start()
 
+def _novo_pool(nome: str, conectar) -> PoolConexoes:
+    return PoolConexoes(conectar, nome, minimo=POOL_MIN, maximo=POOL_MAX, validar_apos_s=POOL_VALIDAR_APOS_S,
+                        keepalive_s=POOL_KEEPALIVE_S, tentativas=POOL_TENTATIVAS, log=log)
+
 def conectar_postgres():
-    global conn_pg
+    global pool_pg
     safe_disable(btn_con_pg); safe_disable(btn_descon_pg); safe_disable(btn_pg_ping)
-    status_pg.config(text="⏳ Conectando ao PostgreSQL...", fg="orange"); log("PostgreSQL: conectando...")
+    na_ui(status_pg.config, text="⏳ Conectando ao PostgreSQL...", fg="orange"); log("PostgreSQL: conectando...")
     try:
-        host = require_env("PG_HOST")
-        port = os.getenv("PG_PORT", "5432")
-        db   = require_env("PG_DB")
-        user = require_env("PG_USER")
-        pwd  = require_env("PG_PASSWORD")
-        conn_pg = psycopg2.connect(
-            host=host, port=port, database=db, user=user, password=pwd,
-            connect_timeout=10, sslmode=os.getenv("PG_SSLMODE","require")
-        )
-        status_pg.config(text="✅ PostgreSQL conectado", fg="green")
+        pool_pg = _novo_pool("aws", nova_conexao_pg)
+        na_ui(status_pg.config, text="✅ PostgreSQL conectado", fg="green")
         log("PostgreSQL: conexão estabelecida.")
         safe_disable(btn_con_pg); safe_enable(btn_descon_pg); safe_enable(btn_pg_ping)
     except Exception as e:
-        conn_pg = None
-        status_pg.config(text=f"❌ PostgreSQL: {e}", fg="red")
+        pool_pg = None
+        na_ui(status_pg.config, text=f"❌ PostgreSQL: {e}", fg="red")
         log(f"PostgreSQL ERRO: {e}")
         safe_enable(btn_con_pg); safe_disable(btn_descon_pg); safe_disable(btn_pg_ping)
 
 def desconectar_postgres():
-    global conn_pg
+    global pool_pg
     try:
-        if conn_pg: conn_pg.close()
-        status_pg.config(text="🔌 PostgreSQL desconectado", fg="gray")
+        if pool_pg: pool_pg.fechar()
+        na_ui(status_pg.config, text="🔌 PostgreSQL desconectado", fg="gray")
         log("PostgreSQL: desconectado.")
     except Exception as e:
         messagebox.showerror("Erro", f"Falha ao desconectar PostgreSQL: {e}")
         log(f"PostgreSQL ERRO ao desconectar: {e}")
     finally:
-        conn_pg = None
+        pool_pg = None
         safe_enable(btn_con_pg); safe_disable(btn_descon_pg); safe_disable(btn_pg_ping)
 
 def conectar_fabric():
-    global conn_fabric
+    global pool_fabric
     safe_disable(btn_con_fab); safe_disable(btn_descon_fab); safe_disable(btn_fab_ping)
-    status_fabric.config(text="⏳ Conectando ao Fabric...", fg="orange"); log("Fabric: conectando...")
+    na_ui(status_fabric.config, text="⏳ Conectando ao Fabric...", fg="orange"); log("Fabric: conectando...")
     try:
-        driver = os.getenv("FABRIC_ODBC_DRIVER", "ODBC Driver 18 for SQL Server")
-        server = require_env("FABRIC_SERVER")
-        db     = require_env("FABRIC_DB")
-        user   = require_env("FABRIC_USER")
-        pwd    = require_env("FABRIC_PASSWORD")
-        auth   = os.getenv("FABRIC_AUTH", "ActiveDirectoryPassword")
-        conn_str = (
-            f"DRIVER={{{driver}}};SERVER={server};DATABASE={db};"
-            f"UID={user};PWD={pwd};Authentication={auth};"
-            "Encrypt=yes;TrustServerCertificate=no;Connection Timeout=15;"
-        )
-        conn_fabric = pyodbc.connect(conn_str)
-        status_fabric.config(text="✅ Fabric conectado", fg="green")
+        pool_fabric = _novo_pool("fabric", nova_conexao_fabric)
+        na_ui(status_fabric.config, text="✅ Fabric conectado", fg="green")
         log("Fabric: conexão estabelecida.")
         safe_disable(btn_con_fab); safe_enable(btn_descon_fab); safe_enable(btn_fab_ping)
     except Exception as e:
-        conn_fabric = None
-        status_fabric.config(text=f"❌ Fabric: {e}", fg="red")
+        pool_fabric = None
+        na_ui(status_fabric.config, text=f"❌ Fabric: {e}", fg="red")
         log(f"Fabric ERRO: {e}")
         safe_enable(btn_con_fab); safe_disable(btn_descon_fab); safe_disable(btn_fab_ping)
 
 def desconectar_fabric():
-    global conn_fabric
+    global pool_fabric
     try:
-        if conn_fabric: conn_fabric.close()
-        status_fabric.config(text="🔌 Fabric desconectado", fg="gray")
+        if pool_fabric: pool_fabric.fechar()
+        na_ui(status_fabric.config, text="🔌 Fabric desconectado", fg="gray")
         log("Fabric: desconectado.")
     except Exception as e:
         messagebox.showerror("Erro", f"Falha ao desconectar Fabric: {e}")
         log(f"Fabric ERRO ao desconectar: {e}")
     finally:
-        conn_fabric = None
+        pool_fabric = None
         safe_enable(btn_con_fab); safe_disable(btn_descon_fab); safe_disable(btn_fab_ping)
 
 # ---------- pings ----------
 def ping_postgres():
-    if not conn_pg: return log("PostgreSQL: não conectado.")
+    if not pool_pg: return log("PostgreSQL: não conectado.")
     safe_disable(btn_pg_ping)
     try:
-        t0 = time.perf_counter()
-        with conn_pg.cursor() as cur:
-            cur.execute("SELECT 1")
-            val = cur.fetchone()[0]
-        dt = (time.perf_counter() - t0) * 1000
-        log(f"PostgreSQL PING ok (SELECT 1 = {val}) — {dt:.1f} ms")
+        dt = pool_pg.ping()
+        log(f"PostgreSQL PING ok (SELECT 1) — {dt:.1f} ms | {pool_pg.resumo()}")
     except Exception as e:
         log(f"PostgreSQL PING ERRO: {e}")
     finally:
         safe_enable(btn_pg_ping)
 
 def ping_fabric():
-    if not conn_fabric: return log("Fabric: não conectado.")
+    if not pool_fabric: return log("Fabric: não conectado.")
     safe_disable(btn_fab_ping)
     try:
-        t0 = time.perf_counter()
-        df = pd.read_sql("SELECT 1 AS ok", conn_fabric)
-        dt = (time.perf_counter() - t0) * 1000
-        log(f"Fabric PING ok (SELECT 1 = {int(df.iloc[0,0])}) — {dt:.1f} ms")
+        dt = pool_fabric.ping()
+        log(f"Fabric PING ok (SELECT 1) — {dt:.1f} ms | {pool_fabric.resumo()}")
     except Exception as e:
         log(f"Fabric PING ERRO: {e}")
     finally:
         safe_enable(btn_fab_ping)
 
 # ---------- extração ----------
-def extrair_aws_async():    threading.Thread(target=_extrair_aws,    daemon=True).start()
-def extrair_fabric_async(): threading.Thread(target=_extrair_fabric, daemon=True).start()
-def extrair_ambos_async():  threading.Thread(target=_extrair_ambos,  daemon=True).start()
+# os campos são lidos aqui, na thread do Tk; a extração só recebe os valores
+def _campos() -> dict:
+    return dict(dt=entry_data.get().strip(), status=entry_status.get().strip(),
+                forcar=var_forcar.get(), resync=var_resync.get())
+
+def extrair_aws_async():    threading.Thread(target=_extrair_aws,    args=(_campos(),), daemon=True).start()
+def extrair_fabric_async(): threading.Thread(target=_extrair_fabric, args=(_campos(),), daemon=True).start()
+def extrair_ambos_async():  threading.Thread(target=_extrair_ambos,  args=(_campos(),), daemon=True).start()
+
+def cancelar_extracao():
+    # psycopg2 conn.cancel() fala com o servidor: fora da thread do Tk
+    log("⏹️ Cancelando a extração…")
+    safe_disable(btn_cancelar)
+    threading.Thread(target=cancelamento.cancelar, daemon=True).start()
+
+def _extrair_aws(campos: dict):
+    if not pool_pg: return log("⚠️ Conecte no PostgreSQL antes de extrair AWS.")
+    _toggle_extract_buttons(False)
+    try:
+        _executar_extracao("aws", campos)
+    finally:
+        _toggle_extract_buttons(True)
 
-def _extrair_aws():
-    if not conn_pg: return log("⚠️ Conecte no PostgreSQL antes de extrair AWS.")
+def _extrair_fabric(campos: dict):
+    if not pool_fabric: return log("⚠️ Conecte no Fabric antes de extrair Fabric.")
     _toggle_extract_buttons(False)
     try:
-        dt = entry_data.get().strip()
-        status = parse_status(entry_status.get().strip())
-        log(f"🔎 Extraindo AWS: dt_inicio={dt} status={status}")
-        df = extrair_aws(conn_pg, dt, status)
-        df = normalizar_numericos(df, casas=4)
-        _salvar(df, "aws", dt)
-    except Exception as e:
-        log(f"❌ Extração AWS ERRO: {e}")
+        _executar_extracao("fabric", campos)
     finally:
         _toggle_extract_buttons(True)
 
-def _extrair_fabric():
-    if not conn_fabric: return log("⚠️ Conecte no Fabric antes de extrair Fabric.")
+def _extrair_ambos(campos: dict):
+    if not pool_pg or not pool_fabric:
+        return log("⚠️ Conecte nos dois bancos antes de 'Extrair Ambos'.")
     _toggle_extract_buttons(False)
     try:
-        dt = entry_data.get().strip()
-        status = parse_status(entry_status.get().strip())
-        log(f"🔎 Extraindo Fabric: dt_inicio={dt} status={status}")
-        df = extrair_fabric(conn_fabric, dt, status)
-        df = normalizar_numericos(df, casas=4)
-        _salvar(df, "fabric", dt)
+        # as duas origens rodam ao mesmo tempo; cada uma empresta do próprio pool
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=_executar_extracao, args=(p, campos), daemon=True) for p in ("aws", "fabric")]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        log(f"⏱️ Extrair Ambos concluído em {time.perf_counter() - t0:.1f}s")
+    finally:
+        _toggle_extract_buttons(True)
+
+class _Progresso:
+    """Callback progresso(linhas) das extrações → rótulo com linhas, linhas/s, tempo e ETA."""
+    def __init__(self, prefix: str, dt: str, status):
+        self.rotulo = lbl_prog_aws if prefix == "aws" else lbl_prog_fab
+        self.nome = prefix.upper()
+        self.t0 = time.perf_counter()
+        try:  # ETA pelo tamanho do último extrato com os mesmos parâmetros
+            self.esperado = manifesto.linhas_anteriores(prefix, dt, status)
+        except Exception:
+            self.esperado = None
+        self._mostrar("consultando…")
+
+    def _mostrar(self, texto: str):
+        na_ui(self.rotulo.config, text=f"{self.nome}: {texto}")
+
+    def __call__(self, linhas: int):
+        decorrido = time.perf_counter() - self.t0
+        taxa = linhas / decorrido if decorrido > 0 else 0.0
+        texto = f"{linhas:,} linhas | {taxa:,.0f} linhas/s | {decorrido:.1f}s".replace(",", ".")
+        if self.esperado and taxa and linhas < self.esperado:
+            texto += f" | ETA ~{(self.esperado - linhas) / taxa:.0f}s"
+        self._mostrar(texto)
+
+    def fim(self, texto: str):
+        self._mostrar(f"{texto} em {time.perf_counter() - self.t0:.1f}s")
+
+def _executar_extracao(prefix: str, campos: dict):
+    """Extrai, normaliza e salva uma origem ("aws" ou "fabric"), logando erros."""
+    nome = "AWS" if prefix == "aws" else "Fabric"
+    progresso = None
+    try:
+        dt = campos["dt"]
+        status = parse_status(campos["status"])
+        log(f"🔎 Extraindo {nome}: dt_inicio={dt} status={status}")
+        progresso = _Progresso(prefix, dt, status)
+        with medir(f"{prefix}.total"):
+            linhas = _extrair_origem(prefix, dt, status, campos, progresso)
+        progresso.fim(f"✅ {linhas:,} linhas".replace(",", "."))
+    except ExtracaoCancelada:
+        log(f"⏹️ Extração {nome} cancelada.")
+        if progresso: progresso.fim("⏹️ cancelada")
     except Exception as e:
-        log(f"❌ Extração Fabric ERRO: {e}")
+        log(f"❌ Extração {nome} ERRO: {e}")
+        if progresso: progresso.fim("❌ erro")
+
+def _extrair_origem(prefix: str, dt: str, status, campos: dict, progresso) -> int:
+    """Escolhe o modo de extração (incremental, janelas, particionado, streaming ou único) pelo .env; retorna as linhas."""
+    pool = pool_pg if prefix == "aws" else pool_fabric
+    # "Ressincronizar tudo" também passa por cima do cache (senão o recomeço das janelas nunca rodaria)
+    forcar = campos["forcar"] or campos["resync"]
+    if EXTRACAO_INCREMENTAL:
+        df = atualizar_snapshot(prefix, pool, dt, status, janela_dias=EXTRACAO_JANELA_DIAS,
+                                completo=campos["resync"], casas=4, log=log)
+        _salvar(df, prefix, dt, status)
+    elif EXTRACAO_JANELAS_MESES > 0:
+        # se cair no meio, o próximo "Extrair" retoma da primeira janela que falta
+        df = _com_cache(prefix, dt, status, forcar, lambda: extrair_janelas(
+            prefix, pool, dt, status, meses=EXTRACAO_JANELAS_MESES, recomecar=campos["resync"], log=log,
+            progresso=progresso, cancelamento=cancelamento))
+        with medir(f"{prefix}.normalizar", linhas=len(df)):
+            df = normalizar_numericos(df, casas=4)
+        _salvar(df, prefix, dt, status)
+    elif EXTRACAO_PARTICOES > 1:
+        # as partições emprestam do pool (até POOL_MAX simultâneas), sem login novo a cada extração
+        df = _com_cache(prefix, dt, status, forcar, lambda: extrair_particionado(
+            prefix, pool, dt, status, particoes=EXTRACAO_PARTICOES, conexoes=EXTRACAO_CONEXOES, log=log,
+            progresso=progresso, cancelamento=cancelamento))
+        with medir(f"{prefix}.normalizar", linhas=len(df)):
+            df = normalizar_numericos(df, casas=4)
+        _salvar(df, prefix, dt, status)
+    elif EXTRACAO_STREAMING:
+        lotes = (extrair_aws_lotes(pool, dt, status, EXTRACAO_LOTE, progresso, cancelamento) if prefix == "aws"
+                 else extrair_fabric_lotes(pool, dt, status, EXTRACAO_LOTE, progresso, cancelamento))
+        return _salvar_lotes(lotes, prefix, dt, status)
+    else:
+        df = _com_cache(prefix, dt, status, forcar, lambda: (
+            extrair_aws(pool, dt, status, AWS_COPY, log=log, progresso=progresso, cancelamento=cancelamento)
+            if prefix == "aws" else
+            extrair_fabric(pool, dt, status, FABRIC_ARROW, FABRIC_ARROW_LOTE, log=log,
+                           progresso=progresso, cancelamento=cancelamento)))
+        with medir(f"{prefix}.normalizar", linhas=len(df)):
+            df = normalizar_numericos(df, casas=4)
+        _salvar(df, prefix, dt, status)
+    return len(df)
+
+def _com_cache(prefix: str, dt: str, status, forcar: bool, extrair):
+    # streaming e incremental não passam por aqui: gravam direto / mantêm o próprio snapshot
+    if not CACHE_CONSULTAS:
+        return extrair()
+    return extrair_com_cache(prefix, extrair, dt, status, ttl_min=CACHE_TTL_MIN, max_mb=CACHE_MAX_MB,
+                             forcar=forcar, log=log)
+
+def pre_checagem_async(): threading.Thread(target=_pre_checagem, args=(_campos(),), daemon=True).start()
+
+def _pre_checagem(campos: dict):
+    """Compara só uma amostra determinística das notas e estima a divergência total."""
+    if not pool_pg or not pool_fabric:
+        return log("⚠️ Conecte nos dois bancos antes da pré-checagem.")
+    _toggle_extract_buttons(False)
+    try:
+        dt = campos["dt"]
+        status = parse_status(campos["status"])
+        log(f"🎯 Pré-checagem: {AMOSTRA_TAXA:.2%} das notas, dt_inicio={dt} status={status}")
+        with medir("pre_checagem"):
+            pre_checar(pool_pg, pool_fabric, dt, status, taxa=AMOSTRA_TAXA, log=log)
+    except Exception as e:
+        log(f"❌ Pré-checagem ERRO: {e}")
     finally:
         _toggle_extract_buttons(True)
 
-def _extrair_ambos():
-    if not conn_pg or not conn_fabric:
-        return log("⚠️ Conecte nos dois bancos antes de 'Extrair Ambos'.")
+def verificar_incremental_async(): threading.Thread(target=_verificar_incremental, args=(_campos(),), daemon=True).start()
+
+def _verificar_incremental(campos: dict):
+    """Atualiza os snapshots e compara com uma extração completa de cada origem conectada."""
     _toggle_extract_buttons(False)
     try:
-        _extrair_aws()
-        _extrair_fabric()
+        dt = campos["dt"]
+        status = parse_status(campos["status"])
+        for prefix, pool in (("aws", pool_pg), ("fabric", pool_fabric)):
+            if not pool: continue
+            inc = atualizar_snapshot(prefix, pool, dt, status, janela_dias=EXTRACAO_JANELA_DIAS, casas=4, log=log)
+            res = verificar_snapshot(inc, prefix, pool, dt, status, casas=4)
+            log(f"{'✅' if res['ok'] else '❌'} {prefix.upper()} incremental × completo: {res}")
+    except Exception as e:
+        log(f"❌ Verificação incremental ERRO: {e}")
     finally:
         _toggle_extract_buttons(True)
 
-def _salvar(df: pd.DataFrame, prefix: str, dt_inicio: str):
-    os.makedirs("out", exist_ok=True)
-    ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    csv = f"out/{prefix}_notas_{dt_inicio}_{ts}.csv"
-    pq  = f"out/{prefix}_notas_{dt_inicio}_{ts}.parquet"
-    df.to_csv(csv, index=False, sep=";")
+def _salvar(df: pd.DataFrame, prefix: str, dt_inicio: str, status):
+    # extrato idêntico a um já gravado não é escrito de novo: o manifesto aponta para o existente
+    art, reaproveitado = manifesto.salvar(df, prefix, dt_inicio, status)
+    if reaproveitado:
+        log(f"♻️ {prefix.upper()} extraído: {len(df)} linhas, idêntico a {art['arrow'] or art['parquet'] or art['csv']} (nada gravado)")
+    elif art["parquet"]:
+        log(f"✅ {prefix.upper()} extraído: {len(df)} linhas | CSV: {art['csv']} | Parquet: {art['parquet']} | Arrow: {art['arrow']}")
+    else:
+        log(f"✅ {prefix.upper()} extraído: {len(df)} linhas | CSV: {art['csv']} (Parquet/Arrow não salvos: instale pyarrow)")
+    _limpar_out()
+
+def _salvar_lotes(lotes, prefix: str, dt_inicio: str, status):
+    csv, pq, arq = caminhos_saida(prefix, dt_inicio)
     try:
-        df.to_parquet(pq, index=False)
-        log(f"✅ {prefix.upper()} extraído: {len(df)} linhas | CSV: {csv} | Parquet: {pq}")
-    except Exception:
-        log(f"✅ {prefix.upper()} extraído: {len(df)} linhas | CSV: {csv} (Parquet não salvo: instale pyarrow/fastparquet)")
+        n = gravar_lotes(lotes, pq, csv, casas=4, arrow_path=arq)
+    except BaseException:
+        for path in (csv, pq, arq):  # extrato incompleto (cancelado/erro) não fica em out/
+            try: os.remove(path)
+            except OSError: pass
+        raise
+    art, reaproveitado = manifesto.registrar_arquivos(prefix, dt_inicio, status, csv, pq, arq)
+    if reaproveitado:
+        log(f"♻️ {prefix.upper()} extraído (streaming): {n} linhas, idêntico a {art['arrow'] or art['parquet']} (arquivos novos descartados)")
+    else:
+        log(f"✅ {prefix.upper()} extraído (streaming, lotes de {EXTRACAO_LOTE}): {n} linhas | CSV: {csv} | Parquet: {pq} | Arrow: {arq}")
+    _limpar_out()
+    return n
+
+def _limpar_out():
+    # retenção de out/ (OUT_RETENCAO_DIAS / OUT_MAX_ARTEFATOS); o mais recente de cada origem fica
+    res = manifesto.remover_antigos()
+    if res["artefatos"]:
+        log(f"🧹 out/: {res['artefatos']} extratos antigos removidos ({res['bytes'] / 2**20:.1f} MB)")
 
 def _toggle_extract_buttons(enable: bool):
+    if not enable:
+        cancelamento.reiniciar()  # um cancelamento anterior não vale para a nova extração
+    (safe_disable if enable else safe_enable)(btn_cancelar)
     (safe_enable if enable else safe_disable)(btn_ext_aws)
     (safe_enable if enable else safe_disable)(btn_ext_fab)
     (safe_enable if enable else safe_disable)(btn_ext_both)
+    (safe_enable if enable else safe_disable)(btn_ver_inc)
+    (safe_enable if enable else safe_disable)(btn_pre)
 
 # ---------- STREAMLIT ----------
 def start_streamlit_async(): threading.Thread(target=start_streamlit, daemon=True).start()
@@ -242,7 +456,7 @@ def start_streamlit():
             cwd=os.path.dirname(os.path.abspath(__file__)),
             env=os.environ.copy(),
         )
-        status_st.config(text=f"🟢 Streamlit rodando na porta {port}", fg="green")
+        na_ui(status_st.config, text=f"🟢 Streamlit rodando na porta {port}", fg="green")
         safe_disable(btn_st_start); safe_enable(btn_st_stop)
 
         # abre o navegador após um pequeno delay
@@ -262,7 +476,7 @@ def start_streamlit():
 
     except Exception as e:
         streamlit_proc = None
-        status_st.config(text="🔴 Streamlit parado", fg="red")
+        na_ui(status_st.config, text="🔴 Streamlit parado", fg="red")
         safe_enable(btn_st_start); safe_disable(btn_st_stop)
         log(f"❌ Falha ao iniciar Streamlit: {e}")
 
@@ -271,7 +485,7 @@ def stop_streamlit():
     global streamlit_proc
     if not streamlit_proc or streamlit_proc.poll() is not None:
         log("ℹ️ Streamlit não está em execução.")
-        status_st.config(text="🔴 Streamlit parado", fg="red")
+        na_ui(status_st.config, text="🔴 Streamlit parado", fg="red")
         safe_enable(btn_st_start); safe_disable(btn_st_stop)
         return
     log("🛑 Encerrando Streamlit…")
@@ -285,7 +499,7 @@ def stop_streamlit():
     except Exception as e:
         log(f"⚠️ Erro ao encerrar Streamlit: {e}")
     finally:
-        status_st.config(text="🔴 Streamlit parado", fg="red")
+        na_ui(status_st.config, text="🔴 Streamlit parado", fg="red")
         safe_enable(btn_st_start); safe_disable(btn_st_stop)
         streamlit_proc = None
 
@@ -300,7 +514,7 @@ frame_pg = tk.LabelFrame(root, text="PostgreSQL (AWS)", padx=10, pady=10, bg="#f
 frame_pg.pack(fill="x", padx=10, pady=8)
 btn_con_pg     = tk.Button(frame_pg, text="Conectar", bg="#2e7d32", fg="white", width=16, command=conectar_postgres_async)
 btn_descon_pg  = tk.Button(frame_pg, text="Desconectar", bg="#757575", fg="white", width=16, command=desconectar_postgres, state=tk.DISABLED)
-btn_pg_ping    = tk.Button(frame_pg, text="Testar Query (SELECT 1)", bg="#455a64", fg="white", width=22, command=ping_postgres, state=tk.DISABLED)
+btn_pg_ping    = tk.Button(frame_pg, text="Testar Query (SELECT 1)", bg="#455a64", fg="white", width=22, command=ping_postgres_async, state=tk.DISABLED)
 status_pg      = tk.Label(frame_pg, text="🔌 Desconectado", fg="gray", bg="#f7f7f7")
 btn_con_pg.grid(row=0, column=0, padx=6, pady=6)
 btn_descon_pg.grid(row=0, column=1, padx=6, pady=6)
@@ -312,7 +526,7 @@ frame_fab = tk.LabelFrame(root, text="Microsoft Fabric (SQL)", padx=10, pady=10,
 frame_fab.pack(fill="x", padx=10, pady=8)
 btn_con_fab    = tk.Button(frame_fab, text="Conectar", bg="#1565c0", fg="white", width=16, command=conectar_fabric_async)
 btn_descon_fab = tk.Button(frame_fab, text="Desconectar", bg="#757575", fg="white", width=16, command=desconectar_fabric, state=tk.DISABLED)
-btn_fab_ping   = tk.Button(frame_fab, text="Testar Query (SELECT 1)", bg="#455a64", fg="white", width=22, command=ping_fabric, state=tk.DISABLED)
+btn_fab_ping   = tk.Button(frame_fab, text="Testar Query (SELECT 1)", bg="#455a64", fg="white", width=22, command=ping_fabric_async, state=tk.DISABLED)
 status_fabric  = tk.Label(frame_fab, text="🔌 Desconectado", fg="gray", bg="#f7f7f7")
 btn_con_fab.grid(row=0, column=0, padx=6, pady=6)
 btn_descon_fab.grid(row=0, column=1, padx=6, pady=6)
@@ -341,6 +555,22 @@ btn_ext_both = tk.Button(frame_extract, text="Extrair Ambos",  bg="#7b1fa2", fg=
 btn_ext_aws.grid(row=0, column=0, padx=6, pady=6)
 btn_ext_fab.grid(row=0, column=1, padx=6, pady=6)
 btn_ext_both.grid(row=0, column=2, padx=6, pady=6)
+var_resync   = tk.BooleanVar(value=False)
+chk_resync   = tk.Checkbutton(frame_extract, text="Ressincronizar tudo (incremental/janelas)", variable=var_resync, bg="#f7f7f7")
+btn_ver_inc  = tk.Button(frame_extract, text="Verificar incremental", bg="#455a64", fg="white", width=18, command=verificar_incremental_async)
+chk_resync.grid(row=0, column=3, padx=6, pady=6)
+btn_ver_inc.grid(row=0, column=4, padx=6, pady=6)
+var_forcar   = tk.BooleanVar(value=False)
+chk_forcar   = tk.Checkbutton(frame_extract, text="Forçar atualização (ignorar cache)", variable=var_forcar, bg="#f7f7f7")
+chk_forcar.grid(row=1, column=0, columnspan=2, padx=6, pady=2, sticky="w")
+btn_cancelar = tk.Button(frame_extract, text="Cancelar", bg="#9c2c2c", fg="white", width=16, command=cancelar_extracao, state=tk.DISABLED)
+btn_cancelar.grid(row=1, column=2, padx=6, pady=2)
+btn_pre      = tk.Button(frame_extract, text="Pré-checagem (amostra)", bg="#455a64", fg="white", width=18, command=pre_checagem_async)
+btn_pre.grid(row=1, column=4, padx=6, pady=2)
+lbl_prog_aws = tk.Label(frame_extract, text="AWS: —", bg="#f7f7f7", anchor="w")
+lbl_prog_fab = tk.Label(frame_extract, text="FABRIC: —", bg="#f7f7f7", anchor="w")
+lbl_prog_aws.grid(row=2, column=0, columnspan=5, padx=6, sticky="w")
+lbl_prog_fab.grid(row=3, column=0, columnspan=5, padx=6, sticky="w")
 
 # Controle do Streamlit
 frame_st = tk.LabelFrame(root, text="Streamlit (app.py)", padx=10, pady=10, bg="#f7f7f7")
@@ -357,6 +587,7 @@ log_frame = tk.LabelFrame(root, text="Log", padx=6, pady=6, bg="#f7f7f7")
 log_frame.pack(fill="both", expand=True, padx=10, pady=8)
 log_text = tk.Text(log_frame, height=12, width=100, state=tk.DISABLED)
 log_text.pack(fill="both", expand=True)
+root.after(LOG_INTERVALO_MS, _drenar_ui)
 
 footer = tk.Label(root, text="FIVS trademark", bg="#f7f7f7", fg="#555")
 footer.pack(pady=4)
@@ -365,6 +596,8 @@ footer.pack(pady=4)
 def on_close():
     try: stop_streamlit()
     except: pass
+    for pool in (pool_pg, pool_fabric):
+        if pool: pool.fechar()
     root.destroy()
 
 root.protocol("WM_DELETE_WINDOW", on_close)
@@ -0,0 +1,223 @@
+# historico.py — histórico de comparações (Parquet particionado) com busca por nota
+#
+# out/historico/
+#   notas/dt_inicio=2025-08-01/status=1-3/exec_<execucao>_<id>.parquet   divergentes e IDs de um lado só
+#   execucoes/exec_<execucao>_<id>.parquet                                 uma linha de totais por execução
+#
+# Cada arquivo de notas vem ordenado por nota_fiscal_id em row groups
+# pequenos: a busca por uma nota usa a partição e as estatísticas min/max
+# do Parquet para abrir só os row groups que podem contê-la. compactar()
+# junta os arquivos de cada partição num só e descarta execuções antigas.
+import os
+import glob
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from extracao_notas import METRICAS
+
+HISTORICO_DIR = os.path.join("out", "historico")
+LINHAS_POR_GRUPO = 64_000
+
+def _chave_status(status_lista) -> str:
+    if isinstance(status_lista, str):  # já é a chave da partição ("1-3")
+        return status_lista
+    return "-".join(str(int(s)) for s in sorted(status_lista)) or "todos"
+
+def _schema_notas():
+    import pyarrow as pa
+    return pa.schema(
+        [("execucao", pa.string()), ("nota_fiscal_id", pa.int64()), ("situacao", pa.string())]
+        + [(f"diff_{m}", pa.float64()) for m in METRICAS]
+    )
+
+def _particionamento():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    return ds.partitioning(pa.schema([("dt_inicio", pa.string()), ("status", pa.string())]), flavor="hive")
+
+def _gravar(df: pd.DataFrame, pasta: str, nome: str, schema=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(pasta, exist_ok=True)
+    final = os.path.join(pasta, f"{nome}_{uuid.uuid4().hex[:8]}.parquet")
+    tabela = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    # grava com outro nome e renomeia: quem lê nunca vê um arquivo pela metade
+    pq.write_table(tabela, final + ".tmp", row_group_size=LINHAS_POR_GRUPO)
+    os.replace(final + ".tmp", final)
+    return final
+
+# ---------- gravação ----------
+def registrar_execucao(diff_table: pd.DataFrame, so_aws: pd.DataFrame, so_fabric: pd.DataFrame,
+                       dt_inicio: str, status_lista, aws: pd.DataFrame = None, fabric: pd.DataFrame = None,
+                       casas: int = 4, atol: float = 0.01, quando: datetime = None,
+                       pasta: str = HISTORICO_DIR) -> str:
+    """
+    Acrescenta ao histórico o resultado de uma comparação: as linhas
+    divergentes de diff_table (todas, se não houver a coluna "diverge"), os
+    IDs de um lado só e uma linha de totais por métrica (somas de cada lado
+    quando `aws`/`fabric` normalizados são informados). Retorna o id da
+    execução (timestamp ISO).
+    """
+    execucao = (quando or datetime.now()).strftime("%Y-%m-%dT%H:%M:%S")
+    if "diverge" in diff_table.columns:
+        diff_table = diff_table[diff_table["diverge"].to_numpy(dtype=bool)]
+
+    id_aws, id_fab = diff_table["nota_fiscal_id_aws"], diff_table["nota_fiscal_id_fabric"]
+    situacao = np.where(id_aws.isna(), "so_fabric", np.where(id_fab.isna(), "so_aws", "divergente"))
+    notas = pd.DataFrame({
+        "nota_fiscal_id": id_aws.fillna(id_fab).to_numpy(dtype=np.int64),
+        "situacao": situacao,
+        **{f"diff_{m}": diff_table[f"diff_{m}"].to_numpy(dtype=np.float64) for m in METRICAS},
+    })
+    # IDs de um lado só que ficaram dentro da tolerância (ex.: valores zerados) entram sem diff
+    for lado, df in (("so_aws", so_aws), ("so_fabric", so_fabric)):
+        ids = df["nota_fiscal_id"].dropna().to_numpy(dtype=np.int64)
+        ids = ids[~np.isin(ids, notas["nota_fiscal_id"].to_numpy())]
+        notas = pd.concat([notas, pd.DataFrame({"nota_fiscal_id": ids, "situacao": lado})], ignore_index=True)
+    notas.insert(0, "execucao", execucao)
+    notas = notas.sort_values("nota_fiscal_id", kind="stable")
+
+    base = os.path.join(pasta, "notas", f"dt_inicio={dt_inicio}", f"status={_chave_status(status_lista)}")
+    _gravar(notas, base, f"exec_{execucao.replace(':', '-')}", _schema_notas())
+
+    totais = {
+        "execucao": execucao, "dt_inicio": str(dt_inicio), "status": _chave_status(status_lista),
+        "casas": int(casas), "atol": float(atol),
+        "linhas_aws": len(aws) if aws is not None else None,
+        "linhas_fabric": len(fabric) if fabric is not None else None,
+        "divergentes": int((notas["situacao"] == "divergente").sum()),
+        "so_aws": len(so_aws), "so_fabric": len(so_fabric),
+    }
+    for m in METRICAS:
+        totais[f"soma_aws_{m}"] = float(aws[m].sum()) if aws is not None and m in aws else None
+        totais[f"soma_fabric_{m}"] = float(fabric[m].sum()) if fabric is not None and m in fabric else None
+        totais[f"soma_diff_{m}"] = float(np.nansum(notas[f"diff_{m}"].to_numpy()))
+    # tipos fixos: sem aws/fabric as somas ficam nulas e o schema precisa bater com os outros arquivos
+    tipos = {c: "float64" for c in totais if c.startswith("soma_")}
+    tipos.update(linhas_aws="Int64", linhas_fabric="Int64")
+    _gravar(pd.DataFrame([totais]).astype(tipos), os.path.join(pasta, "execucoes"), f"exec_{execucao.replace(':', '-')}")
+    return execucao
+
+# ---------- consultas ----------
+def execucoes(dt_inicio: str = None, status_lista=None, pasta: str = HISTORICO_DIR) -> pd.DataFrame:
+    """Totais de cada execução (para gráficos de tendência), em ordem cronológica."""
+    import pyarrow.dataset as ds
+
+    raiz = os.path.join(pasta, "execucoes")
+    if not glob.glob(os.path.join(raiz, "*.parquet")):
+        return pd.DataFrame(columns=["execucao", "dt_inicio", "status", "divergentes", "so_aws", "so_fabric"])
+    filtro = None
+    if dt_inicio is not None:
+        filtro = ds.field("dt_inicio") == str(dt_inicio)
+    if status_lista is not None:
+        f = ds.field("status") == _chave_status(status_lista)
+        filtro = f if filtro is None else filtro & f
+    tabela = ds.dataset(raiz, format="parquet").to_table(filter=filtro)
+    return tabela.to_pandas().sort_values("execucao", kind="stable").reset_index(drop=True)
+
+def historico_nota(nota_fiscal_id: int, dt_inicio: str = None, status_lista=None,
+                   pasta: str = HISTORICO_DIR) -> pd.DataFrame:
+    """Todas as execuções em que a nota apareceu divergente ou de um lado só."""
+    import pyarrow.dataset as ds
+
+    raiz = os.path.join(pasta, "notas")
+    if not glob.glob(os.path.join(raiz, "*", "*", "*.parquet")):
+        return pd.DataFrame(columns=_schema_notas().names + ["dt_inicio", "status"])
+    filtro = ds.field("nota_fiscal_id") == int(nota_fiscal_id)
+    if dt_inicio is not None:
+        filtro &= ds.field("dt_inicio") == str(dt_inicio)
+    if status_lista is not None:
+        filtro &= ds.field("status") == _chave_status(status_lista)
+    dataset = ds.dataset(raiz, format="parquet", partitioning=_particionamento(), exclude_invalid_files=True)
+    df = dataset.to_table(filter=filtro).to_pandas()
+    return df.sort_values(["dt_inicio", "status", "execucao"], kind="stable").reset_index(drop=True)
+
+def inicio_divergencia(nota_fiscal_id: int, dt_inicio: str, status_lista, pasta: str = HISTORICO_DIR) -> dict:
+    """
+    Para um (dt_inicio, status): primeira e última execução em que a nota
+    apareceu e a execução em que começou a sequência atual (None se a nota
+    não apareceu na execução mais recente).
+    """
+    todas = execucoes(dt_inicio, status_lista, pasta)["execucao"].tolist()
+    presentes = set(historico_nota(nota_fiscal_id, dt_inicio, status_lista, pasta)["execucao"])
+    vistas = [e for e in todas if e in presentes]
+    inicio = None
+    for e in reversed(todas):
+        if e not in presentes:
+            break
+        inicio = e
+    return {"primeira": vistas[0] if vistas else None, "ultima": vistas[-1] if vistas else None,
+            "inicio_sequencia_atual": inicio, "execucoes": len(todas), "vezes": len(vistas)}
+
+# ---------- retenção e compactação ----------
+def _mais_antiga(path: str):
+    import pyarrow.parquet as pq
+    meta = pq.ParquetFile(path).metadata
+    col = meta.schema.to_arrow_schema().get_field_index("execucao")
+    minimos = [meta.row_group(i).column(col).statistics.min for i in range(meta.num_row_groups)
+               if meta.row_group(i).column(col).statistics is not None]
+    return min(minimos) if minimos else None
+
+def _compactar_pasta(pasta: str, corte: str, max_arquivos: int, ordenar_por) -> tuple:
+    import pyarrow.parquet as pq
+
+    arquivos = sorted(glob.glob(os.path.join(pasta, "*.parquet")))
+    antigas = [a for a in arquivos if (_mais_antiga(a) or corte) < corte]
+    if len(arquivos) <= max_arquivos and not antigas:
+        return 0, 0
+    tabelas = [pq.read_table(a) for a in arquivos]
+    df = pd.concat([t.to_pandas() for t in tabelas], ignore_index=True)
+    manter = df["execucao"] >= corte
+    descartadas = int((~manter).sum())
+    df = df[manter].sort_values(ordenar_por, kind="stable")
+    if len(df):
+        _gravar(df, pasta, "compacto", tabelas[0].schema.remove_metadata())
+    for a in arquivos:
+        os.remove(a)
+    return len(arquivos), descartadas
+
+def compactar(pasta: str = HISTORICO_DIR, dias: int = None, max_arquivos: int = None, agora: datetime = None) -> dict:
+    """
+    Retenção e compactação: remove execuções com mais de `dias` dias
+    (default HISTORICO_DIAS do .env, 180) e junta num arquivo só, ordenado
+    por nota, cada partição com mais de `max_arquivos` arquivos (default
+    HISTORICO_MAX_ARQUIVOS, 20) ou com execuções vencidas.
+    """
+    dias = int(os.getenv("HISTORICO_DIAS", "180")) if dias is None else dias
+    max_arquivos = int(os.getenv("HISTORICO_MAX_ARQUIVOS", "20")) if max_arquivos is None else max_arquivos
+    corte = ((agora or datetime.now()) - timedelta(days=dias)).strftime("%Y-%m-%dT%H:%M:%S")
+    res = {"particoes": 0, "arquivos": 0, "linhas_descartadas": 0}
+    pastas = [(p, ["nota_fiscal_id", "execucao"]) for p in glob.glob(os.path.join(pasta, "notas", "*", "*"))]
+    pastas.append((os.path.join(pasta, "execucoes"), ["execucao"]))
+    for p, ordem in pastas:
+        if not os.path.isdir(p):
+            continue
+        arquivos, descartadas = _compactar_pasta(p, corte, max_arquivos, ordem)
+        if arquivos:
+            res["particoes"] += 1
+            res["arquivos"] += arquivos
+            res["linhas_descartadas"] += descartadas
+    return res
+
+if __name__ == "__main__":
+    # uso: python historico.py nota 123456 | python historico.py compactar [--dias 90]
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Histórico de comparações AWS × Fabric.")
+    sub = ap.add_subparsers(dest="comando", required=True)
+    p_nota = sub.add_parser("nota", help="execuções em que a nota divergiu")
+    p_nota.add_argument("nota_fiscal_id", type=int)
+    p_comp = sub.add_parser("compactar", help="aplica retenção e junta arquivos pequenos")
+    p_comp.add_argument("--dias", type=int)
+    p_comp.add_argument("--max-arquivos", type=int)
+    args = ap.parse_args()
+
+    if args.comando == "nota":
+        df = historico_nota(args.nota_fiscal_id)
+        print(df.to_string(index=False) if len(df) else "Nota sem divergências no histórico.")
+    else:
+        print(compactar(dias=args.dias, max_arquivos=args.max_arquivos))
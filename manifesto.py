@@ -0,0 +1,319 @@
+# manifesto.py — índice (SQLite) dos extratos gravados em out/
+#
+# Cada extrato vira um artefato (csv/parquet/arrow) com origem, linhas,
+# schema e hash do conteúdo; cada extração aponta para um artefato. Extrato
+# idêntico a um já gravado não é escrito de novo, "o mais recente da AWS
+# (com tais parâmetros)" é uma busca num índice em vez de glob + getmtime
+# em out/, e remover_antigos() apaga o que não é usado há muito tempo.
+import os
+import re
+import glob
+import json
+import sqlite3
+import hashlib
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from extracao_notas import METRICAS, caminhos_saida, salvar_extrato
+
+MANIFESTO = os.path.join("out", "manifesto.sqlite")
+FORMATOS = ("arrow", "parquet", "csv")
+
+_ESQUEMA = """
+create table if not exists artefatos (
+    id integer primary key,
+    origem text not null,
+    hash text,
+    linhas integer,
+    schema text,
+    csv text, parquet text, arrow text,
+    bytes integer,
+    criado text not null,
+    usado text not null
+);
+create unique index if not exists ux_artefatos_hash on artefatos (origem, hash);
+create index if not exists ix_artefatos_usado on artefatos (usado);
+create table if not exists extracoes (
+    id integer primary key,
+    artefato_id integer not null references artefatos (id) on delete cascade,
+    origem text not null,
+    chave text not null,
+    parametros text not null,
+    quando text not null
+);
+create index if not exists ix_extracoes_chave on extracoes (origem, chave, quando);
+create index if not exists ix_extracoes_origem on extracoes (origem, quando);
+"""
+
+def _agora() -> str:
+    return datetime.now().isoformat(timespec="microseconds")
+
+def _conectar(caminho: str) -> sqlite3.Connection:
+    pasta = os.path.dirname(caminho) or "."
+    novo = not os.path.exists(caminho)
+    os.makedirs(pasta, exist_ok=True)
+    conn = sqlite3.connect(caminho, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("pragma journal_mode = wal")  # o app lê enquanto a GUI grava
+    conn.execute("pragma foreign_keys = on")
+    conn.executescript(_ESQUEMA)
+    if novo:
+        with conn:
+            _importar_existentes(conn, pasta)
+    return conn
+
+def chave_parametros(dt_inicio: str, status_lista) -> tuple:
+    """(chave, json) canônicos de uma extração: mesma data e mesmo conjunto de status → mesma chave."""
+    parametros = {"dt_inicio": str(dt_inicio), "status_lista": sorted(int(s) for s in status_lista)}
+    texto = json.dumps(parametros, sort_keys=True)
+    return hashlib.sha1(texto.encode()).hexdigest()[:16], texto
+
+# ---------- hash do conteúdo ----------
+def _tipos_hash(df: pd.DataFrame) -> pd.DataFrame:
+    # id Int64/int64/float e métricas float32/64 geram o mesmo hash
+    cols = {}
+    for c in df.columns:
+        if c == "nota_fiscal_id":
+            cols[c] = pd.to_numeric(df[c], errors="coerce").astype("Int64")
+        elif c in METRICAS:
+            cols[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+        else:
+            cols[c] = df[c]
+    return pd.DataFrame(cols, copy=False)
+
+def _acumular_hash(h, df: pd.DataFrame):
+    linhas = pd.util.hash_pandas_object(_tipos_hash(df), index=False).to_numpy()
+    h.update(np.ascontiguousarray(linhas).tobytes())
+
+def hash_conteudo(df: pd.DataFrame) -> str:
+    """Hash das colunas e linhas (na ordem), independente do formato em disco."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps(list(map(str, df.columns))).encode())
+    _acumular_hash(h, df)
+    return h.hexdigest()
+
+def _hash_parquet(path: str) -> tuple:
+    """(hash, linhas, schema) lendo o Parquet em lotes — mesmo hash de hash_conteudo(df)."""
+    import pyarrow.parquet as pq
+
+    arquivo = pq.ParquetFile(path)
+    nomes = arquivo.schema_arrow.names
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps(nomes).encode())
+    linhas = 0
+    for lote in arquivo.iter_batches(batch_size=500_000):
+        df = lote.to_pandas()
+        _acumular_hash(h, df)
+        linhas += len(df)
+    schema = {f.name: str(f.type) for f in arquivo.schema_arrow}
+    return h.hexdigest(), linhas, schema
+
+# ---------- gravação ----------
+def _artefato_por_hash(conn, origem: str, hash_: str):
+    linha = conn.execute("select * from artefatos where origem = ? and hash = ?", (origem, hash_)).fetchone()
+    if linha is None:
+        return None
+    if not any(linha[f] and os.path.exists(linha[f]) for f in FORMATOS):
+        # arquivos apagados fora do manifesto: a entrada não serve mais
+        conn.execute("delete from artefatos where id = ?", (linha["id"],))
+        return None
+    return linha
+
+def _tamanho(*paths) -> int:
+    return sum(os.path.getsize(p) for p in paths if p and os.path.exists(p))
+
+def _registrar(conn, origem: str, dt_inicio: str, status_lista, hash_: str, linhas: int, schema: dict,
+               csv: str, pq: str, arq: str) -> dict:
+    agora = _agora()
+    cur = conn.execute(
+        "insert into artefatos (origem, hash, linhas, schema, csv, parquet, arrow, bytes, criado, usado) "
+        "values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (origem, hash_, linhas, json.dumps(schema), csv,
+         pq if pq and os.path.exists(pq) else None, arq if arq and os.path.exists(arq) else None,
+         _tamanho(csv, pq, arq), agora, agora),
+    )
+    return _extracao(conn, cur.lastrowid, origem, dt_inicio, status_lista)
+
+def _extracao(conn, artefato_id: int, origem: str, dt_inicio: str, status_lista) -> dict:
+    chave, parametros = chave_parametros(dt_inicio, status_lista)
+    agora = _agora()
+    conn.execute("insert into extracoes (artefato_id, origem, chave, parametros, quando) values (?, ?, ?, ?, ?)",
+                 (artefato_id, origem, chave, parametros, agora))
+    conn.execute("update artefatos set usado = ? where id = ?", (agora, artefato_id))
+    return dict(conn.execute("select * from artefatos where id = ?", (artefato_id,)).fetchone())
+
+def salvar(df: pd.DataFrame, origem: str, dt_inicio: str, status_lista, pasta: str = "out",
+           caminho: str = MANIFESTO) -> tuple:
+    """
+    Grava o extrato como salvar_extrato (CSV, Parquet, Arrow) e o registra.
+    Se um artefato com o mesmo conteúdo já existe, nada é escrito: a
+    extração passa a apontar para ele. Retorna (artefato, reaproveitado).
+    """
+    hash_ = hash_conteudo(df)
+    conn = _conectar(caminho)
+    try:
+        with conn:
+            existente = _artefato_por_hash(conn, origem, hash_)
+            if existente is not None:
+                return _extracao(conn, existente["id"], origem, dt_inicio, status_lista), True
+        csv, pq, arq = caminhos_saida(origem, dt_inicio, pasta)
+        if not salvar_extrato(df, csv, pq, arq):
+            pq = arq = None
+        schema = {c: str(t) for c, t in df.dtypes.items()}
+        try:
+            with conn:
+                return _registrar(conn, origem, dt_inicio, status_lista, hash_, len(df), schema, csv, pq, arq), False
+        except sqlite3.IntegrityError:
+            # outro processo registrou o mesmo conteúdo enquanto gravávamos
+            for p in (csv, pq, arq):
+                if p and os.path.exists(p):
+                    os.remove(p)
+            with conn:
+                existente = _artefato_por_hash(conn, origem, hash_)
+                return _extracao(conn, existente["id"], origem, dt_inicio, status_lista), True
+    finally:
+        conn.close()
+
+def registrar_arquivos(origem: str, dt_inicio: str, status_lista, csv: str, pq: str, arq: str = None,
+                       caminho: str = MANIFESTO) -> tuple:
+    """
+    Registra um extrato já gravado (ex.: por gravar_lotes), com o hash lido
+    do Parquet. Se o conteúdo repete um artefato existente, os arquivos
+    novos são apagados. Retorna (artefato, reaproveitado).
+    """
+    hash_, linhas, schema = _hash_parquet(pq)
+    conn = _conectar(caminho)
+    try:
+        with conn:
+            existente = _artefato_por_hash(conn, origem, hash_)
+            if existente is not None:
+                for p in (csv, pq, arq):
+                    if p and os.path.exists(p):
+                        os.remove(p)
+                return _extracao(conn, existente["id"], origem, dt_inicio, status_lista), True
+            return _registrar(conn, origem, dt_inicio, status_lista, hash_, linhas, schema, csv, pq, arq), False
+    finally:
+        conn.close()
+
+# ---------- consultas ----------
+def mais_recente(origem: str, dt_inicio: str = None, status_lista=None, formatos=FORMATOS,
+                 caminho: str = MANIFESTO):
+    """
+    Caminho do extrato mais recente de `origem` (opcionalmente com os
+    mesmos parâmetros), no primeiro formato de `formatos` disponível; None
+    se não houver. Uma busca no índice (origem, chave, quando).
+    """
+    conn = _conectar(caminho)
+    try:
+        if dt_inicio is not None:
+            chave, _ = chave_parametros(dt_inicio, status_lista or [])
+            filtro, params = "e.origem = ? and e.chave = ?", (origem, chave)
+        else:
+            filtro, params = "e.origem = ?", (origem,)
+        linha = conn.execute(
+            f"select a.* from extracoes e join artefatos a on a.id = e.artefato_id "
+            f"where {filtro} order by e.quando desc limit 1", params,
+        ).fetchone()
+    finally:
+        conn.close()
+    if linha is None:
+        return None
+    for f in formatos:
+        if linha[f] and os.path.exists(linha[f]):
+            return linha[f]
+    return None
+
+def linhas_anteriores(origem: str, dt_inicio: str, status_lista, caminho: str = MANIFESTO):
+    """Linhas do último extrato de `origem` com os mesmos parâmetros (estimativa para o ETA); None se não houver."""
+    chave, _ = chave_parametros(dt_inicio, status_lista)
+    conn = _conectar(caminho)
+    try:
+        linha = conn.execute(
+            "select a.linhas from extracoes e join artefatos a on a.id = e.artefato_id "
+            "where e.origem = ? and e.chave = ? order by e.quando desc limit 1", (origem, chave),
+        ).fetchone()
+    finally:
+        conn.close()
+    return linha[0] if linha else None
+
+def parametros(path: str, caminho: str = MANIFESTO) -> dict:
+    """dt_inicio/status_lista da extração mais recente que gerou `path` ({} se não estiver no manifesto)."""
+    conn = _conectar(caminho)
+    try:
+        linha = conn.execute(
+            "select e.parametros from extracoes e join artefatos a on a.id = e.artefato_id "
+            "where a.csv = ? or a.parquet = ? or a.arrow = ? order by e.quando desc limit 1", (path, path, path),
+        ).fetchone()
+    finally:
+        conn.close()
+    return json.loads(linha[0]) if linha else {}
+
+def tocar(path: str, caminho: str = MANIFESTO):
+    """Marca o artefato de `path` como usado agora (para a remoção por LRU)."""
+    if not os.path.exists(caminho):
+        return
+    conn = _conectar(caminho)
+    try:
+        with conn:
+            conn.execute("update artefatos set usado = ? where csv = ? or parquet = ? or arrow = ?",
+                         (_agora(), path, path, path))
+    finally:
+        conn.close()
+
+# ---------- retenção ----------
+def remover_antigos(dias: int = None, max_artefatos: int = None, caminho: str = MANIFESTO) -> dict:
+    """
+    Apaga arquivos e entradas de artefatos não usados há mais de `dias`
+    (default OUT_RETENCAO_DIAS, 30) e, passando de `max_artefatos` (default
+    OUT_MAX_ARTEFATOS, 50), os menos usados recentemente. O mais recente de
+    cada origem nunca sai.
+    """
+    dias = int(os.getenv("OUT_RETENCAO_DIAS", "30")) if dias is None else dias
+    max_artefatos = int(os.getenv("OUT_MAX_ARTEFATOS", "50")) if max_artefatos is None else max_artefatos
+    corte = (datetime.now() - timedelta(days=dias)).isoformat(timespec="microseconds")
+    conn = _conectar(caminho)
+    try:
+        with conn:
+            protegidos = {r[0] for r in conn.execute(
+                "select artefato_id from extracoes e where quando = "
+                "(select max(quando) from extracoes where origem = e.origem)")}
+            linhas = conn.execute("select * from artefatos order by usado desc").fetchall()
+            remover = [r for i, r in enumerate(linhas)
+                       if r["id"] not in protegidos and (r["usado"] < corte or i >= max_artefatos)]
+            liberados = 0
+            for r in remover:
+                for f in FORMATOS:
+                    if r[f] and os.path.exists(r[f]):
+                        liberados += os.path.getsize(r[f])
+                        os.remove(r[f])
+                conn.execute("delete from artefatos where id = ?", (r["id"],))
+    finally:
+        conn.close()
+    return {"artefatos": len(remover), "bytes": liberados}
+
+_NOME = re.compile(r"^(aws|fabric)_notas_(.+)_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.(csv|parquet|arrow)$")
+
+def _importar_existentes(conn, pasta: str) -> int:
+    """
+    Na criação do índice, registra os extratos de `pasta` gravados antes do
+    manifesto — sem hash nem status, que o nome do arquivo não traz.
+    """
+    grupos = {}
+    for path in glob.glob(os.path.join(pasta, "*_notas_*.*")):
+        m = _NOME.match(os.path.basename(path))
+        if m:
+            grupos.setdefault(m.group(1, 2, 3), {})[m.group(4)] = path
+    for (origem, dt_inicio, ts), arquivos in sorted(grupos.items(), key=lambda kv: kv[0][2]):
+        quando = datetime.strptime(ts, "%Y-%m-%d_%H-%M-%S").isoformat(timespec="microseconds")
+        cur = conn.execute(
+            "insert into artefatos (origem, hash, csv, parquet, arrow, bytes, criado, usado) "
+            "values (?, null, ?, ?, ?, ?, ?, ?)",
+            (origem, arquivos.get("csv"), arquivos.get("parquet"), arquivos.get("arrow"),
+             _tamanho(*arquivos.values()), quando, quando),
+        )
+        chave, parametros = chave_parametros(dt_inicio, [])
+        conn.execute("insert into extracoes (artefato_id, origem, chave, parametros, quando) values (?, ?, ?, ?, ?)",
+                     (cur.lastrowid, origem, chave, parametros, quando))
+    return len(grupos)
@@ -0,0 +1,247 @@
+# pool_conexoes.py — pool de conexões por origem (AWS/Fabric) com validação, keepalive e reconexão
+#
+# Cada empréstimo entrega uma conexão exclusiva (o pyodbc não aceita duas
+# threads na mesma conexão). Conexões ociosas há mais de `validar_apos_s`
+# passam por um SELECT 1 antes de sair do pool; uma thread de keepalive
+# pinga as ociosas a cada `keepalive_s`, descarta as que caíram (timeout de
+# inatividade do servidor/firewall) e repõe o mínimo. Abrir conexão tenta
+# `tentativas` vezes com espera exponencial, para um login ActiveDirectory
+# lento ou recusado momentaneamente não derrubar a extração.
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from desempenho import medir
+
+def validar_select1(conn):
+    """SELECT 1 e rollback (não deixa transação aberta no Postgres)."""
+    cur = conn.cursor()
+    try:
+        cur.execute("select 1")
+        cur.fetchall()
+    finally:
+        cur.close()
+    try: conn.rollback()
+    except Exception: pass
+
+def _fechar(conn):
+    try: conn.close()
+    except Exception: pass
+
+PING_TIMEOUT_S = 5.0
+
+class PoolEsgotado(TimeoutError):
+    """Nenhuma conexão ficou livre dentro do tempo de espera."""
+
+class PoolConexoes:
+    def __init__(self, conectar, nome: str = "conexao", minimo: int = 1, maximo: int = 4,
+                 validar=validar_select1, validar_apos_s: float = 30, keepalive_s: float = 120,
+                 tentativas: int = 3, backoff_s: float = 1.0, log=None):
+        """
+        `conectar()` abre uma conexão DBAPI nova (ex.: conexoes.nova_conexao_pg).
+        Abre `minimo` conexões já na criação (falha aqui se o banco não
+        responder) e nunca mais que `maximo` ao mesmo tempo. keepalive_s=0
+        desliga a thread de keepalive.
+        """
+        self.conectar, self.nome = conectar, nome
+        self.minimo, self.maximo = max(0, minimo), max(1, maximo, minimo)
+        self.validar, self.validar_apos_s = validar, validar_apos_s
+        self.keepalive_s, self.tentativas, self.backoff_s = keepalive_s, max(1, tentativas), backoff_s
+        self.log = log or (lambda msg: None)
+        self._ociosas = deque()  # (conn, instante da devolução); a mais recente sai primeiro
+        self._abertas = 0
+        self._cond = threading.Condition()
+        self._fechado = False
+        self._parar = threading.Event()
+        self._metricas = dict(checkouts=0, espera_total_s=0.0, espera_max_s=0.0, conexoes_abertas=0,
+                              reconexoes=0, falhas_validacao=0, descartadas=0)
+        try:
+            for _ in range(self.minimo):
+                with self._cond:
+                    self._abertas += 1
+                self._devolver_ociosa(self._abrir())
+        except Exception:
+            self.fechar()
+            raise
+        self._keepalive = None
+        if keepalive_s and keepalive_s > 0:
+            self._keepalive = threading.Thread(target=self._manter, name=f"keepalive-{nome}", daemon=True)
+            self._keepalive.start()
+
+    # ---------- abertura ----------
+    def _abrir(self, reconexao: bool = False):
+        """Abre uma conexão na vaga já reservada em _abertas (libera a vaga se não conseguir)."""
+        try:
+            for tentativa in range(self.tentativas):
+                try:
+                    with medir(f"{self.nome}.conectar", tentativa=tentativa + 1):
+                        conn = self.conectar()
+                    break
+                except Exception as e:
+                    if tentativa + 1 == self.tentativas or self._parar.is_set():
+                        raise
+                    espera = self.backoff_s * 2 ** tentativa
+                    self.log(f"⚠️ {self.nome.upper()}: falha ao conectar ({e}); nova tentativa em {espera:.1f}s")
+                    self._parar.wait(espera)
+        except Exception:
+            with self._cond:
+                self._abertas -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._metricas["conexoes_abertas"] += 1
+            if reconexao:
+                self._metricas["reconexoes"] += 1
+        return conn
+
+    def _descartar(self, conn, manter_vaga: bool = False):
+        _fechar(conn)
+        with self._cond:
+            self._metricas["descartadas"] += 1
+            if not manter_vaga:
+                self._abertas -= 1
+                self._cond.notify()
+
+    def _valida(self, conn) -> bool:
+        try:
+            self.validar(conn)
+            return True
+        except Exception:
+            with self._cond:
+                self._metricas["falhas_validacao"] += 1
+            return False
+
+    def _devolver_ociosa(self, conn):
+        with self._cond:
+            if self._fechado:
+                self._abertas -= 1
+                _fechar(conn)
+                return
+            self._ociosas.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    # ---------- empréstimo ----------
+    def _retirar(self, timeout: float = None):
+        """(conn, validar?) — uma ociosa ou uma vaga reservada para abrir uma nova (conn=None)."""
+        t0 = time.monotonic()
+        with self._cond:
+            while True:
+                if self._fechado:
+                    raise RuntimeError(f"pool {self.nome} fechado")
+                if self._ociosas:
+                    conn, desde = self._ociosas.pop()
+                    res = conn, time.monotonic() - desde >= self.validar_apos_s
+                    break
+                if self._abertas < self.maximo:
+                    self._abertas += 1
+                    res = None, False
+                    break
+                restante = None if timeout is None else timeout - (time.monotonic() - t0)
+                if restante is not None and restante <= 0:
+                    raise PoolEsgotado(f"pool {self.nome}: {self.maximo} conexões em uso há {timeout:.1f}s")
+                self._cond.wait(restante)
+            espera = time.monotonic() - t0
+            self._metricas["checkouts"] += 1
+            self._metricas["espera_total_s"] += espera
+            self._metricas["espera_max_s"] = max(self._metricas["espera_max_s"], espera)
+        return res
+
+    @contextmanager
+    def emprestar(self, timeout: float = None):
+        """
+        with pool.emprestar() as conn: ... — conexão exclusiva até o fim do
+        bloco. Uma ociosa que não passar na validação é trocada por uma nova
+        (reconexão). Se o bloco falhar, a conexão volta ao pool só se ainda
+        passar na validação (que faz o rollback); senão é descartada.
+        """
+        conn, validar = self._retirar(timeout)
+        if conn is not None and validar and not self._valida(conn):
+            self.log(f"🔁 {self.nome.upper()}: conexão ociosa caiu; reconectando")
+            self._descartar(conn, manter_vaga=True)  # a vaga passa para a nova conexão
+            conn = None
+            reconexao = True
+        else:
+            reconexao = False
+        if conn is None:
+            conn = self._abrir(reconexao)
+        try:
+            yield conn
+        except BaseException:
+            # o erro pode ter sido a conexão caindo: só volta ao pool se ainda responder
+            if self._valida(conn):
+                self._devolver_ociosa(conn)
+            else:
+                self._descartar(conn)
+            raise
+        self._devolver_ociosa(conn)
+
+    def ping(self, timeout: float = PING_TIMEOUT_S) -> float:
+        """
+        Valida uma conexão do pool; retorna o tempo em ms. Com todas as
+        conexões emprestadas (extrações), PoolEsgotado após `timeout` s.
+        """
+        with self.emprestar(timeout) as conn:
+            t0 = time.perf_counter()
+            self.validar(conn)
+            return (time.perf_counter() - t0) * 1000
+
+    # ---------- keepalive ----------
+    def _manter(self):
+        while not self._parar.wait(self.keepalive_s):
+            with self._cond:
+                agora = time.monotonic()
+                velhas = [(c, d) for c, d in self._ociosas if agora - d >= self.keepalive_s]
+                for item in velhas:
+                    self._ociosas.remove(item)
+            caidas = 0
+            for conn, _ in velhas:
+                if self._valida(conn):
+                    self._devolver_ociosa(conn)
+                else:
+                    caidas += 1
+                    self._descartar(conn)
+            while not self._parar.is_set():
+                with self._cond:
+                    if self._fechado or self._abertas >= self.minimo:
+                        break
+                    self._abertas += 1
+                try:
+                    self._devolver_ociosa(self._abrir(reconexao=True))
+                except Exception as e:
+                    self.log(f"⚠️ {self.nome.upper()}: keepalive não reconectou ({e})")
+                    break
+            if caidas:
+                self.log(f"🔁 {self.nome.upper()}: {caidas} conexão(ões) ociosa(s) caíram e foram substituídas")
+
+    # ---------- estado ----------
+    def metricas(self) -> dict:
+        with self._cond:
+            m = dict(self._metricas, abertas=self._abertas, ociosas=len(self._ociosas),
+                     em_uso=self._abertas - len(self._ociosas))
+        m["espera_media_s"] = m["espera_total_s"] / m["checkouts"] if m["checkouts"] else 0.0
+        return m
+
+    def resumo(self) -> str:
+        m = self.metricas()
+        return (f"{self.nome.upper()} pool: {m['em_uso']}/{m['abertas']} em uso (máx {self.maximo}) | "
+                f"{m['checkouts']} empréstimos, espera média {m['espera_media_s'] * 1000:.0f} ms "
+                f"(máx {m['espera_max_s'] * 1000:.0f} ms) | {m['reconexoes']} reconexões")
+
+    def fechar(self):
+        """Para o keepalive e fecha as ociosas; as emprestadas fecham ao serem devolvidas."""
+        self._parar.set()
+        with self._cond:
+            self._fechado = True
+            ociosas = [c for c, _ in self._ociosas]
+            self._ociosas.clear()
+            self._abertas -= len(ociosas)
+            self._cond.notify_all()
+        for conn in ociosas:
+            _fechar(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
@@ -0,0 +1,115 @@
+# reconciliacao.py — reconciliação por checksums de bucket (pushdown nos dois bancos)
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from extracao_notas import METRICAS, consultar, extrair
+from comparacao import divergentes
+
+BUCKETS_PADRAO = 1024
+FATOR_REFINO = 16
+_MAX_PARAMS_IN = 1000  # SQL Server aceita ~2100 parâmetros por consulta
+
+def checksums(origem: str, conn, dt_inicio: str, status_lista, buckets: int = BUCKETS_PADRAO,
+              casas: int = 4, filtros=()) -> pd.DataFrame:
+    """
+    Roda sql/<origem>_buckets.sql: por bucket (nota_fiscal_id % buckets),
+    contagem, soma dos ids, soma / soma absoluta de cada métrica
+    arredondada por nota e h_<métrica>, a soma de id × valor escalado
+    (inteiros módulo um primo). Índice = bucket.
+    """
+    df = consultar(origem, conn, dt_inicio, status_lista, filtros,
+                   arquivo=f"{origem}_buckets.sql",
+                   substituir={"BUCKETS": int(buckets), "CASAS": int(casas), "ESCALA": 10 ** int(casas)})
+    df.columns = [str(c).lower() for c in df.columns]
+    return df.set_index("bucket").apply(pd.to_numeric, errors="coerce").fillna(0)
+
+def buckets_divergentes(a: pd.DataFrame, b: pd.DataFrame, atol: float = 0.01) -> list:
+    """
+    Buckets com contagem/ids diferentes, alguma soma além da tolerância ou
+    h_<métrica> diferente — valores trocados ou movidos entre notas do mesmo
+    bucket mantêm as somas, mas não o h (comparado exato: uma diferença
+    abaixo da tolerância também marca o bucket, que só custa buscá-lo).
+    """
+    idx = a.index.union(b.index)
+    a = a.reindex(idx, fill_value=0)
+    b = b.reindex(idx, fill_value=0)
+    difere = (a["n"] != b["n"]) | (a["soma_ids"] != b["soma_ids"])
+    for m in METRICAS:
+        for c in (m, f"abs_{m}"):
+            difere |= (a[c] - b[c]).abs() > atol
+        if f"h_{m}" in a.columns and f"h_{m}" in b.columns:
+            difere |= a[f"h_{m}"] != b[f"h_{m}"]
+    return sorted(int(i) for i in idx[difere.to_numpy()])
+
+def _em_paralelo(*funcoes):
+    with ThreadPoolExecutor(max_workers=len(funcoes)) as pool:
+        futuros = [pool.submit(f) for f in funcoes]
+        return tuple(f.result() for f in futuros)
+
+def _buscar(origem: str, conn, dt_inicio: str, status_lista, modulo: int, buckets: list) -> pd.DataFrame:
+    partes = [
+        extrair(origem, conn, dt_inicio, status_lista,
+                [(f"nota_fiscal_id % {int(modulo)}", "in", buckets[i:i + _MAX_PARAMS_IN])])
+        for i in range(0, len(buckets), _MAX_PARAMS_IN)
+    ]
+    if not partes:
+        return extrair(origem, conn, dt_inicio, status_lista, [("1", "=", 0)])
+    return pd.concat(partes, ignore_index=True)
+
+def _ids(origem: str, conn, dt_inicio: str, status_lista) -> np.ndarray:
+    df = consultar(origem, conn, dt_inicio, status_lista, arquivo=f"{origem}_ids.sql")
+    return pd.to_numeric(df.iloc[:, 0], errors="coerce").dropna().to_numpy(dtype=np.int64)
+
+def _reindexar(df: pd.DataFrame, ids, uniao: np.ndarray) -> pd.DataFrame:
+    """Índice = posição da nota no outer join completo (o mesmo de comparacao.divergentes)."""
+    df = df.copy(deep=False)
+    df.index = pd.Index(np.searchsorted(uniao, np.asarray(ids, dtype=np.int64)), dtype="int64")
+    return df
+
+def reconciliar(conn_pg, conn_fabric, dt_inicio: str, status_lista, casas: int = 4, atol: float = 0.01,
+                buckets: int = BUCKETS_PADRAO, niveis: int = 1, fator: int = FATOR_REFINO,
+                dialetos=("aws", "fabric"), log=None):
+    """
+    Compara AWS × Fabric sem trazer todas as notas: primeiro os checksums
+    por bucket nos dois bancos (em paralelo), opcionalmente refinados
+    `niveis - 1` vezes (módulo × fator, só dentro dos buckets divergentes),
+    e depois as linhas completas apenas dos buckets que não batem.
+
+    Retorna (diff_table, so_aws, so_fabric) iguais aos de
+    comparacao.divergentes sobre as extrações completas, inclusive o índice
+    (posição no outer join): para ele vêm só os nota_fiscal_id da AWS
+    (sql/<origem>_ids.sql) — nos buckets que batem os ids são os mesmos
+    dos dois lados. `dialetos` escolhe os templates de sql/ de cada lado —
+    ("fabric", "fabric") permite rodar contra dois bancos SQLite locais.
+    """
+    log = log or (lambda msg: None)
+    d_aws, d_fab = dialetos
+    modulo, buckets_div, filtros = int(buckets), None, ()
+    for nivel in range(max(1, niveis)):
+        if nivel:
+            if not buckets_div:
+                break
+            filtros = [(f"nota_fiscal_id % {modulo}", "in", buckets_div)]
+            modulo *= int(fator)
+        ca, cf = _em_paralelo(
+            lambda: checksums(d_aws, conn_pg, dt_inicio, status_lista, modulo, casas, filtros),
+            lambda: checksums(d_fab, conn_fabric, dt_inicio, status_lista, modulo, casas, filtros),
+        )
+        buckets_div = buckets_divergentes(ca, cf, atol)
+        log(f"🧮 Reconciliação nível {nivel + 1}: {len(buckets_div)} de {max(len(ca), len(cf))} buckets "
+            f"(módulo {modulo}) divergem")
+
+    aws_df, fab_df, ids_aws = _em_paralelo(
+        lambda: _buscar(d_aws, conn_pg, dt_inicio, status_lista, modulo, buckets_div),
+        lambda: _buscar(d_fab, conn_fabric, dt_inicio, status_lista, modulo, buckets_div),
+        lambda: _ids(d_aws, conn_pg, dt_inicio, status_lista),
+    )
+    log(f"🧮 Reconciliação: {len(aws_df)} notas AWS e {len(fab_df)} notas Fabric buscadas")
+    diff_table, so_aws, so_fabric = divergentes(aws_df, fab_df, casas, atol)
+    uniao = np.union1d(ids_aws, fab_df["nota_fiscal_id"].dropna().to_numpy(dtype=np.int64))
+    ids_diff = diff_table["nota_fiscal_id_aws"].fillna(diff_table["nota_fiscal_id_fabric"])
+    return (_reindexar(diff_table, ids_diff, uniao),
+            _reindexar(so_aws, so_aws["nota_fiscal_id"], uniao),
+            _reindexar(so_fabric, so_fabric["nota_fiscal_id"], uniao))
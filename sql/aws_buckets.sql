@@ -0,0 +1,60 @@
+-- checksums por bucket de nota_fiscal_id sobre o mesmo agregado de aws.sql
+-- h_<métrica>: soma de id × valor escalado (inteiros, módulo primo), que vê valores trocados
+-- entre notas do mesmo bucket
+-- ({{BUCKETS}}, {{CASAS}} e {{ESCALA}} = 10^CASAS são inteiros inseridos pelo código; %% = módulo escapado para o psycopg2)
+select
+  nota_fiscal_id %% {{BUCKETS}} as bucket,
+  count(*) as n,
+  sum(nota_fiscal_id) as soma_ids,
+  sum(vol) as vol,
+  sum(abs(vol)) as abs_vol,
+  sum(fat) as fat,
+  sum(abs(fat)) as abs_fat,
+  sum(fatliq) as fatliq,
+  sum(abs(fatliq)) as abs_fatliq,
+  sum(fatdol) as fatdol,
+  sum(abs(fatdol)) as abs_fatdol,
+  sum(fatbon) as fatbon,
+  sum(abs(fatbon)) as abs_fatbon,
+  sum(cc) as cc,
+  sum(abs(cc)) as abs_cc,
+  sum(cp) as cp,
+  sum(abs(cp)) as abs_cp,
+  sum(ci) as ci,
+  sum(abs(ci)) as abs_ci,
+  sum(cf) as cf,
+  sum(abs(cf)) as abs_cf,
+  sum(frete) as frete,
+  sum(abs(frete)) as abs_frete,
+  sum((nota_fiscal_id::bigint %% 1000003) * (round(vol * {{ESCALA}})::bigint %% 1000003)) %% 1000003 as h_vol,
+  sum((nota_fiscal_id::bigint %% 1000003) * (round(fat * {{ESCALA}})::bigint %% 1000003)) %% 1000003 as h_fat,
+  sum((nota_fiscal_id::bigint %% 1000003) * (round(fatliq * {{ESCALA}})::bigint %% 1000003)) %% 1000003 as h_fatliq,
+  sum((nota_fiscal_id::bigint %% 1000003) * (round(fatdol * {{ESCALA}})::bigint %% 1000003)) %% 1000003 as h_fatdol,
+  sum((nota_fiscal_id::bigint %% 1000003) * (round(fatbon * {{ESCALA}})::bigint %% 1000003)) %% 1000003 as h_fatbon,
+  sum((nota_fiscal_id::bigint %% 1000003) * (round(cc * {{ESCALA}})::bigint %% 1000003)) %% 1000003 as h_cc,
+  sum((nota_fiscal_id::bigint %% 1000003) * (round(cp * {{ESCALA}})::bigint %% 1000003)) %% 1000003 as h_cp,
+  sum((nota_fiscal_id::bigint %% 1000003) * (round(ci * {{ESCALA}})::bigint %% 1000003)) %% 1000003 as h_ci,
+  sum((nota_fiscal_id::bigint %% 1000003) * (round(cf * {{ESCALA}})::bigint %% 1000003)) %% 1000003 as h_cf,
+  sum((nota_fiscal_id::bigint %% 1000003) * (round(frete * {{ESCALA}})::bigint %% 1000003)) %% 1000003 as h_frete
+from (
+  select
+    nota_fiscal_id,
+    round(sum(volume_fisico_realizado)::numeric, {{CASAS}}) as vol,
+    round(sum(faturamento_bruto_realizado)::numeric, {{CASAS}}) as fat,
+    round(sum(faturamento_liquido_realizado)::numeric, {{CASAS}}) as fatliq,
+    round(sum(faturamento_dolar)::numeric, {{CASAS}}) as fatdol,
+    round(sum(faturamento_bruto_bonificado)::numeric, {{CASAS}}) as fatbon,
+    round(sum(custo_comercializacao)::numeric, {{CASAS}}) as cc,
+    round(sum(custo_producao_realizado)::numeric, {{CASAS}}) as cp,
+    round(sum(custo_materiais_realizado)::numeric, {{CASAS}}) as ci,
+    round(sum(custo_financeiro)::numeric, {{CASAS}}) as cf,
+    round(sum(valor_frete)::numeric, {{CASAS}}) as frete
+  from schema.tabela
+  where tempo_id >= %(dt_inicio)s
+    and status_pedido_id = ANY(%(status_lista)s)
+  -- {{EXTRA_FILTER}}
+  group by nota_fiscal_id
+  having sum(volume_fisico_realizado) <> 0
+) t
+group by nota_fiscal_id %% {{BUCKETS}}
+order by bucket;
@@ -0,0 +1,19 @@
+select
+  nota_fiscal_id,
+  tempo_id,
+  status_pedido_id,
+  volume_fisico_realizado as vol,
+  faturamento_bruto_realizado as fat,
+  faturamento_liquido_realizado as fatliq,
+  faturamento_dolar as fatdol,
+  faturamento_bruto_bonificado as fatbon,
+  custo_comercializacao as cc,
+  custo_producao_realizado as cp,
+  custo_materiais_realizado as ci,
+  custo_financeiro as cf,
+  valor_frete as frete
+from schema.tabela
+where tempo_id >= %(dt_inicio)s
+  and status_pedido_id = ANY(%(status_lista)s)
+-- {{EXTRA_FILTER}}
+order by nota_fiscal_id, tempo_id;
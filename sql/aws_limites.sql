@@ -0,0 +1,8 @@
+select
+  min(nota_fiscal_id) as id_min,
+  max(nota_fiscal_id) as id_max
+from schema.tabela
+where tempo_id >= %(dt_inicio)s
+  and status_pedido_id = ANY(%(status_lista)s)
+-- {{EXTRA_FILTER}}
+;
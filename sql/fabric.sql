@@ -13,6 +13,7 @@ select
 from schema.tabela
 where tempo_id >= ?
 -- {{STATUS_FILTER}}
+-- {{EXTRA_FILTER}}
 group by nota_fiscal_id
 having sum(volume_fisico_realizado) <> 0
 order by nota_fiscal_id;
@@ -0,0 +1,60 @@
+-- checksums por bucket de nota_fiscal_id sobre o mesmo agregado de fabric.sql
+-- h_<métrica>: soma de id × valor escalado (inteiros, módulo primo), que vê valores trocados
+-- entre notas do mesmo bucket
+-- ({{BUCKETS}}, {{CASAS}} e {{ESCALA}} = 10^CASAS são inteiros inseridos pelo código)
+select
+  nota_fiscal_id % {{BUCKETS}} as bucket,
+  count(*) as n,
+  sum(cast(nota_fiscal_id as bigint)) as soma_ids,
+  sum(vol) as vol,
+  sum(abs(vol)) as abs_vol,
+  sum(fat) as fat,
+  sum(abs(fat)) as abs_fat,
+  sum(fatliq) as fatliq,
+  sum(abs(fatliq)) as abs_fatliq,
+  sum(fatdol) as fatdol,
+  sum(abs(fatdol)) as abs_fatdol,
+  sum(fatbon) as fatbon,
+  sum(abs(fatbon)) as abs_fatbon,
+  sum(cc) as cc,
+  sum(abs(cc)) as abs_cc,
+  sum(cp) as cp,
+  sum(abs(cp)) as abs_cp,
+  sum(ci) as ci,
+  sum(abs(ci)) as abs_ci,
+  sum(cf) as cf,
+  sum(abs(cf)) as abs_cf,
+  sum(frete) as frete,
+  sum(abs(frete)) as abs_frete,
+  sum((cast(nota_fiscal_id as bigint) % 1000003) * (cast(round(vol * {{ESCALA}}, 0) as bigint) % 1000003)) % 1000003 as h_vol,
+  sum((cast(nota_fiscal_id as bigint) % 1000003) * (cast(round(fat * {{ESCALA}}, 0) as bigint) % 1000003)) % 1000003 as h_fat,
+  sum((cast(nota_fiscal_id as bigint) % 1000003) * (cast(round(fatliq * {{ESCALA}}, 0) as bigint) % 1000003)) % 1000003 as h_fatliq,
+  sum((cast(nota_fiscal_id as bigint) % 1000003) * (cast(round(fatdol * {{ESCALA}}, 0) as bigint) % 1000003)) % 1000003 as h_fatdol,
+  sum((cast(nota_fiscal_id as bigint) % 1000003) * (cast(round(fatbon * {{ESCALA}}, 0) as bigint) % 1000003)) % 1000003 as h_fatbon,
+  sum((cast(nota_fiscal_id as bigint) % 1000003) * (cast(round(cc * {{ESCALA}}, 0) as bigint) % 1000003)) % 1000003 as h_cc,
+  sum((cast(nota_fiscal_id as bigint) % 1000003) * (cast(round(cp * {{ESCALA}}, 0) as bigint) % 1000003)) % 1000003 as h_cp,
+  sum((cast(nota_fiscal_id as bigint) % 1000003) * (cast(round(ci * {{ESCALA}}, 0) as bigint) % 1000003)) % 1000003 as h_ci,
+  sum((cast(nota_fiscal_id as bigint) % 1000003) * (cast(round(cf * {{ESCALA}}, 0) as bigint) % 1000003)) % 1000003 as h_cf,
+  sum((cast(nota_fiscal_id as bigint) % 1000003) * (cast(round(frete * {{ESCALA}}, 0) as bigint) % 1000003)) % 1000003 as h_frete
+from (
+  select
+    nota_fiscal_id,
+    round(sum(volume_fisico_realizado), {{CASAS}}) as vol,
+    round(sum(faturamento_bruto_realizado), {{CASAS}}) as fat,
+    round(sum(faturamento_liquido_realizado), {{CASAS}}) as fatliq,
+    round(sum(faturamento_dolar), {{CASAS}}) as fatdol,
+    round(sum(faturamento_bruto_bonificado), {{CASAS}}) as fatbon,
+    round(sum(custo_comercializacao), {{CASAS}}) as cc,
+    round(sum(custo_producao_realizado), {{CASAS}}) as cp,
+    round(sum(custo_materiais_realizado), {{CASAS}}) as ci,
+    round(sum(custo_financeiro), {{CASAS}}) as cf,
+    round(sum(valor_frete), {{CASAS}}) as frete
+  from schema.tabela
+  where tempo_id >= ?
+  -- {{STATUS_FILTER}}
+  -- {{EXTRA_FILTER}}
+  group by nota_fiscal_id
+  having sum(volume_fisico_realizado) <> 0
+) t
+group by nota_fiscal_id % {{BUCKETS}}
+order by bucket;
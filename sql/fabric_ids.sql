@@ -0,0 +1,9 @@
+-- só os nota_fiscal_id do agregado de fabric.sql (posições da reconciliação)
+select nota_fiscal_id
+from schema.tabela
+where tempo_id >= ?
+-- {{STATUS_FILTER}}
+-- {{EXTRA_FILTER}}
+group by nota_fiscal_id
+having sum(volume_fisico_realizado) <> 0
+order by nota_fiscal_id;
@@ -0,0 +1,5 @@
+# os testes importam os módulos da raiz do repositório (extracao_notas, ...)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
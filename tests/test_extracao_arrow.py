@@ -0,0 +1,61 @@
+# extrair_fabric(arrow=True) (lotes Arrow do ADBC) contra o cursor DBAPI, nos stand-ins SQLite.
+import numpy as np
+import pandas as pd
+import pytest
+
+import extracao_notas
+from bench.sintetico import gerar_extratos, gerar_linhas, criar_banco, conectar_fabric, conectar_fabric_adbc, COLUNAS_ORIGEM
+from extracao_notas import extrair_fabric, normalizar_numericos, METRICAS
+
+DT, STATUS = "2025-01-01", [1, 3]
+
+@pytest.fixture(scope="module")
+def banco(tmp_path_factory):
+    aws, _ = gerar_extratos(2_000, taxa_nan=0.02, seed=3)
+    linhas = gerar_linhas(aws, linhas_por_nota=3, seed=3)
+    linhas[COLUNAS_ORIGEM] = linhas[COLUNAS_ORIGEM].round(4)
+    path = str(tmp_path_factory.mktemp("arrow") / "fabric.db")
+    criar_banco(path, linhas)
+    return path
+
+@pytest.fixture
+def adbc(banco):
+    pytest.importorskip("adbc_driver_sqlite")
+    conn = conectar_fabric_adbc(banco)
+    yield conn
+    conn.close()
+
+def test_arrow_igual_ao_dbapi(banco, adbc):
+    lotes = []
+    arrow = extrair_fabric(adbc, DT, STATUS, arrow=True, lote=256, progresso=lotes.append)
+    dbapi = extrair_fabric(conectar_fabric(banco), DT, STATUS)
+    assert len(lotes) > 1 and lotes[-1] == len(arrow)  # leu em vários lotes
+    assert arrow.dtypes.equals(dbapi.dtypes)
+    assert arrow.index.equals(dbapi.index)
+    assert arrow["nota_fiscal_id"].equals(dbapi["nota_fiscal_id"])
+    # a soma do driver ADBC pode diferir na ordem das parcelas (~1e-12)
+    assert np.allclose(arrow[METRICAS], dbapi[METRICAS], rtol=0, atol=1e-9, equal_nan=True)
+    assert normalizar_numericos(arrow).equals(normalizar_numericos(dbapi))
+
+def test_arrow_sem_linhas(banco, adbc):
+    arrow = extrair_fabric(adbc, "2099-01-01", STATUS, arrow=True)
+    dbapi = extrair_fabric(conectar_fabric(banco), "2099-01-01", STATUS)
+    assert len(arrow) == 0 and arrow.dtypes.equals(dbapi.dtypes)
+
+def test_arrow_falha_volta_ao_cursor(banco, adbc, monkeypatch):
+    def _falha(*args, **kwargs):
+        raise OSError("driver ADBC recusou a consulta")
+
+    monkeypatch.setattr(extracao_notas, "_ler_arrow", _falha)
+    logs = []
+    obtido = extrair_fabric(adbc, DT, STATUS, arrow=True, log=logs.append)
+    esperado = extrair_fabric(conectar_fabric(banco), DT, STATUS)
+    pd.testing.assert_frame_equal(normalizar_numericos(obtido), normalizar_numericos(esperado))
+    assert len(logs) == 1 and logs[0].startswith("⚠️ FABRIC leitura Arrow indisponível (OSError")
+
+def test_sem_adbc_volta_ao_cursor(banco):
+    # conexão DBAPI comum: o caminho Arrow tenta o arrow-odbc, sem driver/servidor Fabric aqui
+    logs = []
+    obtido = extrair_fabric(conectar_fabric(banco), DT, STATUS, arrow=True, log=logs.append)
+    assert obtido.equals(extrair_fabric(conectar_fabric(banco), DT, STATUS))
+    assert len(logs) == 1 and "usando o cursor DBAPI" in logs[0]
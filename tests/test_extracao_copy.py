@@ -0,0 +1,57 @@
+# extrair_aws(copy=True) (COPY ... TO STDOUT + leitor CSV do pyarrow) contra o cursor,
+# no stand-in do Postgres (ConexaoPgSQLite).
+import pytest
+
+import bench.sintetico
+from bench.sintetico import gerar_extratos, gerar_linhas, criar_banco, ConexaoPgSQLite
+from extracao_notas import extrair_aws, _sql_aws, _ler_copy, _ler_consulta, _padronizar_cols, METRICAS
+
+DT, STATUS = "2025-01-01", [1, 3]
+
+@pytest.fixture(scope="module")
+def banco(tmp_path_factory):
+    aws, _ = gerar_extratos(2_000, taxa_nan=0.02, seed=7)
+    path = str(tmp_path_factory.mktemp("copy") / "aws.db")
+    criar_banco(path, gerar_linhas(aws, linhas_por_nota=3, seed=7))
+    return path
+
+def test_copy_igual_ao_cursor(banco):
+    copy = extrair_aws(ConexaoPgSQLite(banco), DT, STATUS, copy=True)
+    cursor = extrair_aws(ConexaoPgSQLite(banco), DT, STATUS, copy=False)
+    assert copy.equals(cursor)
+    assert (copy.dtypes == cursor.dtypes).all()
+    # a amostra tem o que o CSV precisa representar: NULL e negativos
+    assert copy[METRICAS].isna().any().any()
+    assert (copy[METRICAS] < 0).any().all()
+
+@pytest.mark.parametrize("filtros, restos", [
+    ([("nota_fiscal_id % 7", "=", 3)], (7, {3})),
+    ([("nota_fiscal_id % 5", "in", [0, 2]), ("tempo_id", "<", "2025-04-01")], (5, {0, 2})),
+])
+def test_copy_com_filtros_e_modulo(banco, filtros, restos):
+    sql, params = _sql_aws(DT, STATUS, filtros)
+    copy = _padronizar_cols(_ler_copy(ConexaoPgSQLite(banco), sql, params, "aws"))
+    cursor = _padronizar_cols(_ler_consulta(ConexaoPgSQLite(banco), sql, params, "aws"))
+    assert len(copy) and copy.equals(cursor)
+    assert set(copy["nota_fiscal_id"] % restos[0]) <= restos[1]
+
+def test_copy_sem_linhas(banco):
+    copy = extrair_aws(ConexaoPgSQLite(banco), "2099-01-01", STATUS, copy=True)
+    cursor = extrair_aws(ConexaoPgSQLite(banco), "2099-01-01", STATUS, copy=False)
+    assert len(copy) == 0 and copy.equals(cursor)
+    assert (copy[METRICAS].dtypes == "float64").all()
+
+def test_copy_falha_volta_ao_cursor(banco, monkeypatch):
+    def _falha(self, sql, arquivo):
+        arquivo.write(b"nota_fiscal_id,vol\n1,")  # metade do CSV antes de a conexão cair
+        raise ConnectionError("conexão perdida no COPY")
+
+    monkeypatch.setattr(bench.sintetico._CursorPg, "copy_expert", _falha)
+    conn = ConexaoPgSQLite(banco)
+    rollbacks = []
+    conn.rollback = lambda: rollbacks.append(1)
+    logs = []
+    obtido = extrair_aws(conn, DT, STATUS, copy=True, log=logs.append)
+    assert obtido.equals(extrair_aws(ConexaoPgSQLite(banco), DT, STATUS))
+    assert rollbacks == [1]
+    assert len(logs) == 1 and logs[0].startswith("⚠️ AWS COPY indisponível (ConnectionError")
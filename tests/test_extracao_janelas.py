@@ -0,0 +1,109 @@
+# extrair_janelas com falha injetada numa janela: checkpoint, retomada e validade,
+# contra a consulta única (extrair_aws/extrair_fabric) nos stand-ins SQLite.
+import json
+import os
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from bench.sintetico import (gerar_extratos, gerar_linhas, criar_banco, conectar_fabric, ConexaoPgSQLite,
+                             ConexaoComFalhas, FalhaInjetada, COLUNAS_ORIGEM)
+from extracao_notas import extrair_aws, extrair_fabric, normalizar_numericos
+from extracao_janelas import extrair_janelas, janelas, _pasta
+
+DT, STATUS, HOJE = "2025-01-01", [1, 3], date(2025, 7, 15)
+PLANO = janelas(DT, 1, HOJE)  # jan..jun fechadas + [jul, fim)
+K = 3  # janela que cai: [2025-04-01, 2025-05-01)
+
+ORIGENS = {
+    "aws": (ConexaoPgSQLite, extrair_aws, lambda params: params["dt_inicio"]),
+    "fabric": (conectar_fabric, extrair_fabric, lambda params: params[0]),
+}
+
+@pytest.fixture(scope="module")
+def banco(tmp_path_factory):
+    aws, _ = gerar_extratos(1_500, seed=11)
+    linhas = gerar_linhas(aws, linhas_por_nota=4, dias=190, seed=11, espalhar=True)
+    linhas[COLUNAS_ORIGEM] = linhas[COLUNAS_ORIGEM].round(4)
+    path = str(tmp_path_factory.mktemp("janelas") / "origem.db")
+    criar_banco(path, linhas)
+    # há notas com linhas em mais de uma janela (o HAVING só vale no total)
+    assert (linhas.assign(mes=linhas["tempo_id"].str[:7]).groupby("nota_fiscal_id")["mes"].nunique() > 1).any()
+    return path
+
+def _conexao(origem, banco, falhar_em_inicio=None):
+    """Stand-in envolvido em ConexaoComFalhas; `inicios` registra a janela de cada consulta."""
+    conectar, _, inicio = ORIGENS[origem]
+    inicios = []
+
+    def falhar_se(sql, params):
+        inicios.append(inicio(params))
+        return inicios[-1] == falhar_em_inicio
+    conn = ConexaoComFalhas(conectar(banco), falhar_se=falhar_se)
+    conn.inicios = inicios
+    return conn
+
+def _normalizado(df):
+    return normalizar_numericos(df).reset_index(drop=True)
+
+def _estado(pasta, origem):
+    with open(os.path.join(_pasta(origem, DT, STATUS, str(pasta)), "checkpoint.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+@pytest.mark.parametrize("origem", ["aws", "fabric"])
+def test_retoma_da_janela_que_falhou(banco, tmp_path, origem):
+    conectar, extrair_unica, _ = ORIGENS[origem]
+    esperado = extrair_unica(conectar(banco), DT, STATUS)
+    kw = dict(meses=1, tentativas=2, backoff_s=0, pasta=str(tmp_path), hoje=HOJE)
+
+    conn = _conexao(origem, banco, falhar_em_inicio=PLANO[K][0])
+    with pytest.raises(FalhaInjetada):
+        extrair_janelas(origem, conn, DT, STATUS, **kw)
+    assert conn.inicios == [ini for ini, _ in PLANO[:K]] + [PLANO[K][0]] * 2
+    estado = _estado(tmp_path, origem)
+    assert [(j["inicio"], j["fim"]) for j in estado["janelas"]] == PLANO[:K]
+
+    conn = _conexao(origem, banco)
+    logs = []
+    obtido = extrair_janelas(origem, conn, DT, STATUS, log=logs.append, **kw)
+    assert conn.inicios == [ini for ini, _ in PLANO[K:]]
+    assert any(f"{K}/{len(PLANO)} janelas já gravadas" in m for m in logs)
+    pd.testing.assert_frame_equal(_normalizado(obtido), _normalizado(esperado))
+    assert not os.path.exists(_pasta(origem, DT, STATUS, str(tmp_path)))
+
+def test_falha_passageira_e_tentada_de_novo(banco, tmp_path):
+    conn = _conexao("fabric", banco)
+    conn.falhar_em = {K + 1}  # só a primeira tentativa da janela K
+    logs = []
+    obtido = extrair_janelas("fabric", conn, DT, STATUS, meses=1, backoff_s=0, pasta=str(tmp_path), hoje=HOJE,
+                             log=logs.append)
+    assert conn.falhas == 1 and conn.consultas == len(PLANO) + 1
+    assert any("nova tentativa" in m for m in logs)
+    pd.testing.assert_frame_equal(_normalizado(obtido), _normalizado(extrair_fabric(conectar_fabric(banco), DT, STATUS)))
+
+@pytest.mark.parametrize("idade_h, reaproveita", [(23, True), (25, False)])
+def test_checkpoint_vence_em_24h(banco, tmp_path, idade_h, reaproveita):
+    kw = dict(meses=1, tentativas=1, backoff_s=0, pasta=str(tmp_path), hoje=HOJE)
+    with pytest.raises(FalhaInjetada):
+        extrair_janelas("fabric", _conexao("fabric", banco, falhar_em_inicio=PLANO[K][0]), DT, STATUS, **kw)
+    caminho = os.path.join(_pasta("fabric", DT, STATUS, str(tmp_path)), "checkpoint.json")
+    estado = _estado(tmp_path, "fabric")
+    estado["criado"] = (datetime.now() - timedelta(hours=idade_h)).isoformat(timespec="seconds")
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(estado, f)
+
+    conn = _conexao("fabric", banco)
+    obtido = extrair_janelas("fabric", conn, DT, STATUS, manter=True, **kw)
+    assert conn.inicios == [ini for ini, _ in (PLANO[K:] if reaproveita else PLANO)]
+    pd.testing.assert_frame_equal(_normalizado(obtido), _normalizado(extrair_fabric(conectar_fabric(banco), DT, STATUS)))
+    # manter=True: o checkpoint fica, agora com todas as janelas
+    assert [(j["inicio"], j["fim"]) for j in _estado(tmp_path, "fabric")["janelas"]] == PLANO
+
+def test_recomecar_ignora_checkpoint(banco, tmp_path):
+    kw = dict(meses=1, tentativas=1, backoff_s=0, pasta=str(tmp_path), hoje=HOJE)
+    with pytest.raises(FalhaInjetada):
+        extrair_janelas("fabric", _conexao("fabric", banco, falhar_em_inicio=PLANO[K][0]), DT, STATUS, **kw)
+    conn = _conexao("fabric", banco)
+    extrair_janelas("fabric", conn, DT, STATUS, recomecar=True, **kw)
+    assert conn.inicios == [ini for ini, _ in PLANO]
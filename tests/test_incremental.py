@@ -0,0 +1,102 @@
+# atualizar_snapshot (marca d'água + janela recente) contra a extração completa,
+# em stand-ins SQLite com soma decimal exata (como o numeric do Postgres).
+import json
+import sqlite3
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from bench.sintetico import gerar_extratos, gerar_linhas, criar_banco, conectar_fabric, ConexaoPgSQLite, COLUNAS_ORIGEM
+from extracao_notas import extrair_aws, extrair_fabric, normalizar_numericos
+from incremental import atualizar_snapshot, verificar_snapshot, _base
+
+DT, STATUS, JANELA = "2025-01-01", [1, 3], 7
+DIAS = [date(2025, 3, 1), date(2025, 3, 20), date(2025, 5, 2), date(2025, 7, 15)]
+ATRAVESSA = 999_999_001  # nota com linhas dos dois lados da primeira marca d'água (2025-02-22)
+
+class _Soma:
+    """sum() exato: parcelas decimais somadas em Decimal, resultado em float (como numeric -> float)."""
+    def __init__(self):
+        self.total = None
+
+    def step(self, valor):
+        if valor is not None:
+            self.total = (self.total or Decimal(0)) + Decimal(repr(valor))
+
+    def finalize(self):
+        return None if self.total is None else float(self.total)
+
+def _conectar(origem, banco):
+    if origem == "aws":
+        conn = ConexaoPgSQLite(banco)
+        conn._conn.create_aggregate("sum", 1, _Soma)
+    else:
+        conn = conectar_fabric(banco)
+        conn.create_aggregate("sum", 1, _Soma)
+    return conn
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # SNAPSHOT_DIR é relativo (out/snapshot)
+    aws, _ = gerar_extratos(1_000, seed=21)
+    linhas = gerar_linhas(aws, linhas_por_nota=3, dias=190, seed=21, espalhar=True)
+    atravessa = pd.DataFrame({"nota_fiscal_id": ATRAVESSA, "tempo_id": ["2025-02-20", "2025-02-24", "2025-03-25"],
+                              "status_pedido_id": 1, **{c: [1.1111, 2.2222, -0.3333] for c in COLUNAS_ORIGEM}})
+    linhas = pd.concat([linhas, atravessa], ignore_index=True)
+    linhas[COLUNAS_ORIGEM] = linhas[COLUNAS_ORIGEM].round(4)
+    criar_banco("origem.db", linhas)
+    return "origem.db"
+
+def _executar(banco, sql, params=()):
+    conn = sqlite3.connect(banco)
+    conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+def _marca(origem):
+    with open(_base(origem, DT, STATUS) + ".json", encoding="utf-8") as f:
+        return json.load(f)["marca_dagua"]
+
+@pytest.mark.parametrize("origem", ["aws", "fabric"])
+def test_incremental_em_varios_dias(banco, origem):
+    conn = _conectar(origem, banco)
+    extrair = extrair_aws if origem == "aws" else extrair_fabric
+    for i, hoje in enumerate(DIAS):
+        if i == 2:
+            # linha nova na janela recente de uma nota já no histórico: entra na soma
+            _executar(banco, "insert into tabela (nota_fiscal_id, tempo_id, status_pedido_id, volume_fisico_realizado) "
+                             "values (?, ?, 3, 5.5)", (ATRAVESSA, (hoje - timedelta(days=2)).isoformat()))
+        logs = []
+        df = atualizar_snapshot(origem, conn, DT, STATUS, janela_dias=JANELA, hoje=hoje, log=logs.append)
+        assert _marca(origem) == (hoje - timedelta(days=JANELA)).isoformat()
+        assert ("ressincronização completa" in logs[0]) == (i == 0)
+        assert verificar_snapshot(df, origem, conn, DT, STATUS)["ok"]
+        pd.testing.assert_frame_equal(df, normalizar_numericos(extrair(conn, DT, STATUS)))
+        nota = df[df["nota_fiscal_id"] == ATRAVESSA]
+        assert nota["fat"].item() == 3.0 and nota["vol"].item() == (3.0 if i < 2 else 8.5)
+
+def test_marca_nao_recua(banco):
+    conn = _conectar("fabric", banco)
+    atualizar_snapshot("fabric", conn, DT, STATUS, janela_dias=JANELA, hoje=DIAS[2])
+    df = atualizar_snapshot("fabric", conn, DT, STATUS, janela_dias=JANELA, hoje=DIAS[0])
+    assert _marca("fabric") == (DIAS[2] - timedelta(days=JANELA)).isoformat()
+    assert verificar_snapshot(df, "fabric", conn, DT, STATUS)["ok"]
+
+def test_completo_refaz_o_historico(banco):
+    conn = _conectar("fabric", banco)
+    atualizar_snapshot("fabric", conn, DT, STATUS, janela_dias=JANELA, hoje=DIAS[1])
+    # correção retroativa atrás da marca d'água: o incremental não a vê ...
+    _executar(banco, "update tabela set valor_frete = valor_frete + 1 "
+                     "where nota_fiscal_id = ? and tempo_id = '2025-02-20'", (ATRAVESSA,))
+    df = atualizar_snapshot("fabric", conn, DT, STATUS, janela_dias=JANELA, hoje=DIAS[1])
+    res = verificar_snapshot(df, "fabric", conn, DT, STATUS)
+    assert not res["ok"] and res["divergentes"] == 1
+    # ... e completo=True relê tudo
+    logs = []
+    df = atualizar_snapshot("fabric", conn, DT, STATUS, janela_dias=JANELA, hoje=DIAS[1], completo=True,
+                            log=logs.append)
+    assert "ressincronização completa" in logs[0]
+    assert verificar_snapshot(df, "fabric", conn, DT, STATUS)["ok"]
+    assert df.loc[df["nota_fiscal_id"] == ATRAVESSA, "frete"].item() == 4.0
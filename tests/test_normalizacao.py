@@ -0,0 +1,101 @@
+# Paridade de escalar_inteiros/desescalar/limite_escalado com o caminho Decimal
+# que normalizar_numericos usava antes (Decimal(str(x)).quantize, ROUND_HALF_UP).
+import math
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from extracao_notas import escalar_inteiros, desescalar, limite_escalado, normalizar_numericos
+
+CASAS = range(0, 11)
+
+def _decimal(x, casas: int) -> int:
+    """Referência: o inteiro escalado pelo caminho Decimal antigo (NaN vira 0)."""
+    if x is None or (isinstance(x, float) and math.isnan(x)):
+        x = 0
+    d = Decimal(str(x)).quantize(Decimal(1).scaleb(-casas), rounding=ROUND_HALF_UP)
+    return int(d.scaleb(casas))
+
+def _valores(casas: int, n: int = 20_000, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed + casas)
+    # |valor| × 10^casas abaixo de 2^62: cabe em int64
+    escala = min(1e6, 2.0 ** 62 / 10.0 ** casas / 10)
+    aleatorios = rng.normal(0, escala, n)
+    arredondados = aleatorios.round(min(casas + 2, 15))
+    # exatamente no meio da última casa (…5), positivos e negativos
+    meio = (np.trunc(rng.uniform(-1e5, 1e5, n) * 10.0 ** casas) + 0.5) / 10.0 ** casas
+    bordas = np.array([0.0, -0.0, 0.5, -0.5, 1.5, -1.5, 2.5, -2.5, 0.05, -0.05, 1.005, -1.005,
+                       0.125, -0.125, 2.675, -2.675, 1e-12, -1e-12, np.nan])
+    return np.concatenate([aleatorios, arredondados, meio, bordas])
+
+@pytest.mark.parametrize("casas", CASAS)
+def test_escalar_inteiros_igual_decimal(casas):
+    x = _valores(casas)
+    esperado = np.array([_decimal(v, casas) for v in x.tolist()], dtype=np.int64)
+    obtido = escalar_inteiros(x, casas)
+    assert obtido.dtype == np.int64
+    divergentes = np.flatnonzero(obtido != esperado)
+    assert divergentes.size == 0, [(x[i], obtido[i], esperado[i]) for i in divergentes[:5]]
+
+@pytest.mark.parametrize("casas", CASAS)
+def test_desescalar_igual_float_decimal(casas):
+    inteiros = escalar_inteiros(_valores(casas), casas)
+    esperado = np.array([float(Decimal(int(i)).scaleb(-casas)) for i in inteiros.tolist()])
+    assert np.array_equal(desescalar(inteiros, casas), esperado)
+
+def test_acima_de_2_53_cai_no_decimal():
+    # |valor| × 10^casas >= 2^52: a parte vetorizada não é confiável, vai para o Decimal
+    casos = [(0, [2.0 ** 53 + 2, -(2.0 ** 53 + 2), 4503599627370497.0]),
+             (4, [9.007199254740993e11, 123456789012.34565, -98765432109.87655, 450359962737.04965]),
+             (6, [9.007199254740993e11, 123456789012.345675, -98765432109.876545])]
+    for casas, x in casos:
+        esperado = [_decimal(v, casas) for v in x]
+        assert escalar_inteiros(np.array(x), casas).tolist() == esperado
+
+def test_fora_do_int64_levanta_overflow():
+    with pytest.raises(OverflowError):
+        escalar_inteiros(np.array([1e15]), 6)
+
+def test_desescalar_acima_de_2_53():
+    inteiros = np.array([2 ** 53 + 1, -(2 ** 53 + 3), 2 ** 62 + 12345], dtype=np.int64)
+    for casas in (0, 4, 10):
+        esperado = [float(Decimal(int(i)).scaleb(-casas)) for i in inteiros.tolist()]
+        assert desescalar(inteiros, casas).tolist() == esperado
+
+def test_nan_e_texto_viram_zero():
+    x = pd.Series([np.nan, None, "abc", "1.23455", 2])
+    assert escalar_inteiros(x, 4).tolist() == [0, 0, 0, 12346, 20000]
+
+def test_normalizar_numericos_igual_decimal():
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({"nota_fiscal_id": np.arange(5_000), "vol": rng.normal(0, 1e4, 5_000),
+                       "fat": (np.trunc(rng.uniform(-1e4, 1e4, 5_000) * 1e4) + 0.5) / 1e4})
+    df.loc[::50, "vol"] = np.nan
+    out = normalizar_numericos(df.copy(), casas=4)
+    for c in ("vol", "fat"):
+        esperado = [float(Decimal(_decimal(v, 4)).scaleb(-4)) for v in df[c].tolist()]
+        assert out[c].tolist() == esperado
+
+@pytest.mark.parametrize("casas", [2, 4, 6])
+@pytest.mark.parametrize("atol", [0.0, 0.01, 0.005, 0.00015, 0.1, 1.0, 0.0001])
+def test_limite_escalado_igual_comparacao_float(casas, atol):
+    """
+    |d| > limite_escalado(atol) (inteiros) decide igual à comparação antiga
+    abs(round(a) - round(b)) > atol em float, exceto quando a diferença é
+    exatamente atol — ali o float antigo erra para um lado ou outro.
+    """
+    rng = np.random.default_rng(casas)
+    a = escalar_inteiros(rng.normal(0, 1e3, 20_000), casas)
+    # diferenças pequenas em torno da tolerância, inclusive exatamente nela
+    passo = int(rng.integers(1, 3))
+    d = rng.integers(-3 * max(1, int(atol * 10 ** casas)) - 3, 3 * max(1, int(atol * 10 ** casas)) + 4, 20_000) * passo
+    b = a - d
+    limite = limite_escalado(atol, casas)
+    novo = np.abs(a - b) > limite
+    antigo = np.abs(desescalar(a, casas) - desescalar(b, casas)) > atol
+    exato = np.array([abs(Decimal(int(v)).scaleb(-casas)) > Decimal(str(atol)) for v in d.tolist()])
+    assert np.array_equal(novo, exato)
+    fora_da_borda = np.array([abs(Decimal(int(v)).scaleb(-casas)) != Decimal(str(atol)) for v in d.tolist()])
+    assert np.array_equal(novo[fora_da_borda], antigo[fora_da_borda])
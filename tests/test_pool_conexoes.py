@@ -0,0 +1,163 @@
+# PoolConexoes com os stand-ins SQLite de bench/sintetico.py (falhas via ConexaoComFalhas).
+import threading
+import time
+
+import pytest
+
+from bench.sintetico import conectar_fabric, ConexaoPgSQLite, ConexaoComFalhas, FalhaInjetada
+from pool_conexoes import PoolConexoes, PoolEsgotado
+
+@pytest.fixture
+def banco(tmp_path):
+    return str(tmp_path / "pool.db")
+
+class _Fabrica:
+    """conectar() que guarda as conexões abertas e pode falhar nas primeiras `falhas` chamadas."""
+    def __init__(self, banco, falhas: int = 0, pg: bool = False):
+        self.banco, self.falhas, self.pg = banco, falhas, pg
+        self.chamadas, self.abertas = 0, []
+
+    def __call__(self):
+        self.chamadas += 1
+        if self.chamadas <= self.falhas:
+            raise FalhaInjetada(f"login recusado ({self.chamadas})")
+        conn = ConexaoComFalhas(ConexaoPgSQLite(self.banco) if self.pg else conectar_fabric(self.banco))
+        self.abertas.append(conn)
+        return conn
+
+def _select1(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute("select 1")
+        return cur.fetchall()[0][0]
+    finally:
+        cur.close()
+
+@pytest.mark.parametrize("pg", [False, True])
+def test_emprestimo_reaproveita_e_conta(banco, pg):
+    fabrica = _Fabrica(banco, pg=pg)
+    with PoolConexoes(fabrica, "t", minimo=1, maximo=2, keepalive_s=0) as pool:
+        for _ in range(3):
+            with pool.emprestar() as conn:
+                assert _select1(conn) == 1
+        m = pool.metricas()
+        assert fabrica.chamadas == 1  # a mesma ociosa volta a ser emprestada
+        assert (m["checkouts"], m["conexoes_abertas"], m["em_uso"], m["ociosas"]) == (3, 1, 0, 1)
+        with pool.emprestar() as a, pool.emprestar() as b:
+            assert a is not b
+            assert pool.metricas()["em_uso"] == 2
+        assert pool.metricas()["abertas"] == 2
+
+def test_validacao_no_emprestimo_reconecta(banco):
+    fabrica = _Fabrica(banco)
+    with PoolConexoes(fabrica, "t", minimo=1, maximo=1, validar_apos_s=0, keepalive_s=0) as pool:
+        fabrica.abertas[0].falhar_se = lambda sql, params: True  # a ociosa "caiu"
+        with pool.emprestar() as conn:
+            assert conn is fabrica.abertas[1]
+            assert _select1(conn) == 1
+        m = pool.metricas()
+        assert (m["falhas_validacao"], m["reconexoes"], m["descartadas"], m["abertas"]) == (1, 1, 1, 1)
+
+def test_ociosa_recente_nao_e_validada(banco):
+    fabrica = _Fabrica(banco)
+    with PoolConexoes(fabrica, "t", minimo=1, maximo=1, validar_apos_s=60, keepalive_s=0) as pool:
+        with pool.emprestar():
+            pass
+        consultas = fabrica.abertas[0].consultas
+        with pool.emprestar():
+            pass
+        assert fabrica.abertas[0].consultas == consultas
+
+def test_ociosa_fechada_pelo_servidor(banco):
+    fabrica = _Fabrica(banco)
+    with PoolConexoes(fabrica, "t", minimo=1, maximo=1, validar_apos_s=0, keepalive_s=0) as pool:
+        fabrica.abertas[0].close()  # timeout de inatividade do lado do banco
+        with pool.emprestar() as conn:
+            assert _select1(conn) == 1
+        assert pool.metricas()["reconexoes"] == 1
+
+def test_erro_no_bloco_devolve_so_conexao_valida(banco):
+    fabrica = _Fabrica(banco)
+    with PoolConexoes(fabrica, "t", minimo=1, maximo=1, keepalive_s=0) as pool:
+        with pytest.raises(ValueError):
+            with pool.emprestar():
+                raise ValueError("erro da consulta")
+        assert pool.metricas()["ociosas"] == 1  # ainda responde: volta ao pool
+        with pytest.raises(FalhaInjetada):
+            with pool.emprestar() as conn:
+                conn.falhar_se = lambda sql, params: True
+                _select1(conn)
+        m = pool.metricas()
+        assert (m["ociosas"], m["abertas"], m["descartadas"]) == (0, 0, 1)
+        with pool.emprestar() as conn:  # a vaga foi liberada: abre outra
+            assert _select1(conn) == 1
+
+def test_pool_esgotado_no_timeout(banco):
+    with PoolConexoes(_Fabrica(banco), "t", minimo=1, maximo=1, keepalive_s=0) as pool:
+        with pool.emprestar():
+            t0 = time.monotonic()
+            with pytest.raises(PoolEsgotado):
+                with pool.emprestar(timeout=0.1):
+                    pass
+            assert 0.1 <= time.monotonic() - t0 < 2
+            with pytest.raises(PoolEsgotado):
+                pool.ping(timeout=0.1)
+        assert pool.ping() >= 0
+
+def test_espera_ate_a_devolucao(banco):
+    with PoolConexoes(_Fabrica(banco), "t", minimo=1, maximo=1, keepalive_s=0) as pool:
+        liberar = threading.Event()
+
+        def segurar():
+            with pool.emprestar():
+                liberar.wait(5)
+
+        t = threading.Thread(target=segurar)
+        t.start()
+        while pool.metricas()["em_uso"] < 1:
+            time.sleep(0.01)
+        threading.Timer(0.2, liberar.set).start()
+        with pool.emprestar(timeout=5) as conn:
+            assert _select1(conn) == 1
+        t.join()
+        m = pool.metricas()
+        assert m["espera_max_s"] >= 0.15
+        assert m["espera_media_s"] == pytest.approx(m["espera_total_s"] / m["checkouts"])
+
+def test_conectar_com_novas_tentativas(banco):
+    fabrica = _Fabrica(banco, falhas=2)
+    with PoolConexoes(fabrica, "t", minimo=1, tentativas=3, backoff_s=0.01, keepalive_s=0) as pool:
+        assert fabrica.chamadas == 3
+        assert pool.metricas()["abertas"] == 1
+
+def test_conectar_esgota_tentativas_e_libera_vaga(banco):
+    fabrica = _Fabrica(banco, falhas=2)
+    with pytest.raises(FalhaInjetada):
+        PoolConexoes(fabrica, "t", minimo=1, tentativas=2, backoff_s=0.01, keepalive_s=0)
+    with PoolConexoes(fabrica, "t", minimo=0, maximo=1, tentativas=1, keepalive_s=0) as pool:
+        fabrica.falhas, fabrica.chamadas = 1, 0
+        with pytest.raises(FalhaInjetada):
+            with pool.emprestar():
+                pass
+        assert pool.metricas()["abertas"] == 0
+        with pool.emprestar() as conn:
+            assert _select1(conn) == 1
+
+def test_keepalive_troca_ociosa_caida(banco):
+    fabrica = _Fabrica(banco)
+    with PoolConexoes(fabrica, "t", minimo=1, maximo=2, keepalive_s=0.05) as pool:
+        fabrica.abertas[0].falhar_se = lambda sql, params: True
+        limite = time.monotonic() + 5
+        while pool.metricas()["reconexoes"] < 1 and time.monotonic() < limite:
+            time.sleep(0.02)
+        m = pool.metricas()
+        assert (m["reconexoes"], m["descartadas"]) == (1, 1)
+        assert m["ociosas"] == 1 and m["abertas"] == 1
+    assert pool.metricas()["abertas"] == 0
+
+def test_fechado_recusa_emprestimo(banco):
+    pool = PoolConexoes(_Fabrica(banco), "t", keepalive_s=0)
+    pool.fechar()
+    with pytest.raises(RuntimeError):
+        with pool.emprestar():
+            pass